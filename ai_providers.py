@@ -0,0 +1,479 @@
+# ai_providers.py - Clients HTTP des fournisseurs IA (connexions persistantes et poolées)
+import asyncio
+import itertools
+import json
+import threading
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from turn_deadline import time_left
+
+# Connexions par client httpx : le pool de httpcore parcourt toutes ses connexions
+# à chaque requête, un grand pool unique devient quadratique avec la charge
+ASYNC_SHARD_SIZE = 25
+
+
+class ProviderError(Exception):
+    """Échec d'un appel fournisseur (message destiné à l'utilisateur)"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ProviderClient(ABC):
+    """Session HTTP persistante d'un fournisseur IA.
+
+    Les connexions TCP/TLS sont gardées ouvertes et réutilisées d'un tour à
+    l'autre (pool de `pool_size` connexions), les en-têtes sont construits
+    une seule fois, et les délais de connexion et de lecture sont distincts.
+
+    Les méthodes `a…` (agenerate, astream) font les mêmes appels avec des
+    clients httpx asynchrones : une requête en cours n'occupe pas de thread,
+    seulement une des `async_pool_size` connexions (réparties en plusieurs
+    clients de `ASYNC_SHARD_SIZE` connexions, utilisés à tour de rôle).
+    """
+
+    name = "provider"
+    # Le fournisseur accepte plusieurs prompts dans une même requête
+    supports_batch = False
+    # Le modèle peut être gardé chargé par des requêtes de maintien (keep_warm)
+    keeps_warm = False
+
+    def __init__(self, base_url: str, headers: Optional[dict] = None, pool_size: int = 10,
+                 connect_timeout: float = 3.05, read_timeout: float = 30, async_pool_size: int = 100):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.async_pool_size = async_pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._headers = dict(headers or {})
+        self._async_clients = []
+        self._async_loop = None
+        self._async_turn = itertools.count()
+
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.status_codes = {}
+
+    def request_timeout(self) -> tuple:
+        """(connexion, lecture), bornés par l'échéance du tour quand l'appel en a une"""
+        left = time_left()
+        if left is None:
+            return self.timeout
+        left = max(left, 0.001)
+        return min(self.timeout[0], left), min(self.timeout[1], left)
+
+    def post(self, path: str, payload: dict, **kwargs) -> requests.Response:
+        """POST JSON sur la session poolée (délais bornés par l'échéance du tour)"""
+        kwargs.setdefault("timeout", self.request_timeout())
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, **kwargs)
+        except requests.RequestException:
+            self._count(None)
+            raise
+        self._count(response.status_code)
+        return response
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Client httpx suivant de la boucle d'événements courante (créés au premier appel)"""
+        loop = asyncio.get_running_loop()
+        if not self._async_clients or self._async_loop is not loop:
+            shards = max(1, -(-self.async_pool_size // ASYNC_SHARD_SIZE))
+            per_shard = -(-self.async_pool_size // shards)
+            self._async_clients = [
+                httpx.AsyncClient(
+                    headers=self._headers,
+                    timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                    limits=httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard)
+                )
+                for _ in range(shards)
+            ]
+            self._async_loop = loop
+        return self._async_clients[next(self._async_turn) % len(self._async_clients)]
+
+    async def apost(self, path: str, payload: dict) -> httpx.Response:
+        """POST JSON asynchrone"""
+        try:
+            response = await self.async_client().post(f"{self.base_url}{path}", json=payload)
+        except httpx.HTTPError:
+            self._count(None)
+            raise
+        self._count(response.status_code)
+        return response
+
+    @asynccontextmanager
+    async def apost_stream(self, path: str, payload: dict) -> AsyncIterator[httpx.Response]:
+        """POST JSON asynchrone dont le corps est lu au fil de l'eau"""
+        counted = False
+        try:
+            async with self.async_client().stream("POST", f"{self.base_url}{path}", json=payload) as response:
+                counted = True
+                self._count(response.status_code)
+                yield response
+        except httpx.HTTPError:
+            if not counted:
+                self._count(None)
+            raise
+
+    def _count(self, status: Optional[int]):
+        """Compteurs d'appels (status None : échec de connexion)"""
+        with self._lock:
+            self.requests += 1
+            if status is not None:
+                self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            if status != 200:
+                self.errors += 1
+
+    @abstractmethod
+    def generate(self, prompt: str) -> str:
+        """Réponse complète du modèle au prompt"""
+
+    def generate_batch(self, prompts: List[str]) -> List[str]:
+        """Une réponse par prompt (par défaut : un appel par prompt)"""
+        return [self.generate(prompt) for prompt in prompts]
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Génère la réponse morceau par morceau (par défaut : d'un seul bloc)"""
+        yield self.generate(prompt)
+
+    def warm_up(self, timeout: float = 120):
+        """Charge le modèle et l'amorce par une génération minimale"""
+        self.generate("Bonjour")
+
+    async def agenerate(self, prompt: str) -> str:
+        """Version asynchrone de generate (par défaut : dans un thread)"""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Version asynchrone de stream (par défaut : d'un seul bloc)"""
+        yield await self.agenerate(prompt)
+
+    def stats(self) -> dict:
+        """Statistiques d'appels et du pool de connexions"""
+        opened = 0
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        with self._lock:
+            return {
+                "provider": self.name,
+                "requests": self.requests,
+                "errors": self.errors,
+                "status_codes": dict(self.status_codes),
+                "pool_size": self.pool_size,
+                "connections_opened": opened,
+                # Requêtes servies par une connexion déjà ouverte
+                "connection_reuse": 1 - opened / self.requests if self.requests else 0.0
+            }
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        clients, self._async_clients = self._async_clients, []
+        for client in clients:
+            await client.aclose()
+
+
+class HuggingFaceProvider(ProviderClient):
+    """API d'inférence Hugging Face"""
+
+    name = "huggingface"
+    supports_batch = True
+
+    def __init__(self, model: str, api_token: Optional[str],
+                 base_url: str = "https://api-inference.huggingface.co/models/", **kwargs):
+        headers = {"Authorization": f"Bearer {api_token}"} if api_token else None
+        super().__init__(base_url, headers=headers, **kwargs)
+        self.model = model
+        self.api_token = api_token
+
+    def _payload(self, prompt) -> dict:
+        # Pour DialoGPT et modèles conversationnels ; `inputs` accepte aussi une liste de prompts
+        return {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": 100,
+                "temperature": 0.7,
+                "do_sample": True,
+                "return_full_text": False
+            }
+        }
+
+    def _check_token(self):
+        if not self.api_token:
+            raise ProviderError("Token Hugging Face manquant. Définir HF_TOKEN dans les variables d'environnement.")
+
+    def generate(self, prompt: str) -> str:
+        self._check_token()
+        payload = self._payload(prompt)
+
+        try:
+            response = self.post(self.model, payload)
+            if response.status_code != 200:
+                raise ProviderError(f"Erreur API ({response.status_code}): {response.text}", response.status_code)
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ProviderError(f"Erreur connexion: {e}") from e
+
+        return self._parse_result(result)
+
+    @staticmethod
+    def _parse_result(result) -> str:
+        if isinstance(result, list) and len(result) > 0:
+            return result[0].get("generated_text", "").strip()
+        return str(result)
+
+    def warm_up(self, timeout: float = 120):
+        """Attend le chargement du modèle côté API (`wait_for_model`) avec un seul token"""
+        self._check_token()
+        payload = self._payload("Bonjour")
+        payload["parameters"]["max_new_tokens"] = 1
+        payload["options"] = {"wait_for_model": True, "use_cache": False}
+        try:
+            response = self.post(self.model, payload, timeout=(self.timeout[0], timeout))
+        except requests.RequestException as e:
+            raise ProviderError(f"Erreur connexion: {e}") from e
+        if response.status_code != 200:
+            raise ProviderError(f"Erreur API ({response.status_code}): {response.text}", response.status_code)
+
+    def generate_batch(self, prompts: List[str]) -> List[str]:
+        """Plusieurs prompts en une seule requête (`inputs` en liste)"""
+        if len(prompts) == 1:
+            return [self.generate(prompts[0])]
+        self._check_token()
+        payload = self._payload(list(prompts))
+
+        try:
+            response = self.post(self.model, payload)
+            if response.status_code != 200:
+                raise ProviderError(f"Erreur API ({response.status_code}): {response.text}", response.status_code)
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ProviderError(f"Erreur connexion: {e}") from e
+
+        if not isinstance(result, list) or len(result) != len(prompts):
+            raise ProviderError(f"Erreur API: réponse inattendue pour un lot de {len(prompts)} prompts")
+        # Une entrée par prompt : liste de générations ou génération seule
+        return [self._parse_result(item if isinstance(item, list) else [item]) for item in result]
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Tokens en Server-Sent Events (modèles servis par text-generation-inference).
+
+        Si le modèle ne sait pas streamer, l'API répond en JSON : la réponse
+        est alors renvoyée d'un seul bloc.
+        """
+        self._check_token()
+        payload = self._payload(prompt)
+        payload["stream"] = True
+        try:
+            with self.post(self.model, payload, stream=True) as response:
+                if response.status_code != 200:
+                    raise ProviderError(f"Erreur API ({response.status_code}): {response.text}", response.status_code)
+                if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                    yield self._parse_result(response.json())
+                    return
+                first = True
+                for line in response.iter_lines(decode_unicode=True):
+                    text = self._sse_text(line)
+                    if first:
+                        text = text.lstrip()
+                        first = not text
+                    if text:
+                        yield text
+        except (requests.RequestException, ValueError) as e:
+            raise ProviderError(f"Erreur connexion: {e}") from e
+
+    @staticmethod
+    def _sse_text(line: str) -> str:
+        """Texte du token d'une ligne SSE ("" pour les autres lignes et les tokens spéciaux)"""
+        if not line or not line.startswith("data:"):
+            return ""
+        token = json.loads(line[5:]).get("token", {})
+        return "" if token.get("special") else token.get("text", "")
+
+    async def agenerate(self, prompt: str) -> str:
+        self._check_token()
+        try:
+            response = await self.apost(self.model, self._payload(prompt))
+            if response.status_code != 200:
+                raise ProviderError(f"Erreur API ({response.status_code}): {response.text}", response.status_code)
+            result = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise ProviderError(f"Erreur connexion: {e}") from e
+        return self._parse_result(result)
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        self._check_token()
+        payload = self._payload(prompt)
+        payload["stream"] = True
+        try:
+            async with self.apost_stream(self.model, payload) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise ProviderError(f"Erreur API ({response.status_code}): {response.text}", response.status_code)
+                if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                    await response.aread()
+                    yield self._parse_result(response.json())
+                    return
+                first = True
+                async for line in response.aiter_lines():
+                    text = self._sse_text(line)
+                    if first:
+                        text = text.lstrip()
+                        first = not text
+                    if text:
+                        yield text
+        except (httpx.HTTPError, ValueError) as e:
+            raise ProviderError(f"Erreur connexion: {e}") from e
+
+
+class OllamaProvider(ProviderClient):
+    """Serveur Ollama local.
+
+    `context` reprend les tokens d'un échange précédent (le préfixe n'est
+    pas réencodé) ; `on_context` reçoit les tokens de fin de génération pour
+    le tour suivant. `keep_alive` garde le modèle chargé entre deux requêtes.
+    """
+
+    name = "ollama"
+    keeps_warm = True
+
+    def __init__(self, model: str = "llama2", base_url: str = "http://localhost:11434",
+                 keep_alive: Optional[str] = None, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.model = model
+        self.keep_alive = keep_alive
+
+    def _payload(self, prompt: str, stream: bool, context: Optional[List[int]]) -> dict:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream
+        }
+        if context:
+            payload["context"] = context
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def generate(self, prompt: str, context: Optional[List[int]] = None,
+                 on_context: Optional[Callable[[List[int]], None]] = None) -> str:
+        payload = self._payload(prompt, False, context)
+        try:
+            response = self.post("/api/generate", payload)
+            if response.status_code != 200:
+                raise ProviderError(f"Erreur Ollama: {response.text}", response.status_code)
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ProviderError(f"Ollama non disponible: {e}") from e
+        return self._result_text(result, on_context)
+
+    @staticmethod
+    def _result_text(result: dict, on_context: Optional[Callable[[List[int]], None]]) -> str:
+        if on_context is not None and result.get("context"):
+            on_context(result["context"])
+        return result.get("response", "").strip()
+
+    @staticmethod
+    def _chunk_text(line, on_context: Optional[Callable[[List[int]], None]]) -> tuple:
+        """(texte, fin) d'une ligne du flux ; transmet le contexte final"""
+        if not line:
+            return "", False
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise ProviderError(f"Erreur Ollama: {chunk['error']}")
+        done = bool(chunk.get("done"))
+        if done and on_context is not None and chunk.get("context"):
+            on_context(chunk["context"])
+        return chunk.get("response", ""), done
+
+    def warm_up(self, timeout: float = 120):
+        """Charge le modèle en mémoire et génère un seul token"""
+        payload = self._payload("Bonjour", False, None)
+        payload["options"] = {"num_predict": 1}
+        self._post_checked(payload, timeout)
+
+    def keep_warm(self, timeout: float = 120):
+        """Requête sans prompt : recharge le modèle si besoin et repousse son déchargement"""
+        payload = {"model": self.model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        self._post_checked(payload, timeout)
+
+    def _post_checked(self, payload: dict, timeout: float):
+        try:
+            response = self.post("/api/generate", payload, timeout=(self.timeout[0], timeout))
+        except requests.RequestException as e:
+            raise ProviderError(f"Ollama non disponible: {e}") from e
+        if response.status_code != 200:
+            raise ProviderError(f"Erreur Ollama: {response.text}", response.status_code)
+
+    def stream(self, prompt: str, context: Optional[List[int]] = None,
+               on_context: Optional[Callable[[List[int]], None]] = None) -> Iterator[str]:
+        """Tokens au fil de la génération (une ligne JSON par morceau)"""
+        payload = self._payload(prompt, True, context)
+        try:
+            with self.post("/api/generate", payload, stream=True) as response:
+                if response.status_code != 200:
+                    raise ProviderError(f"Erreur Ollama: {response.text}", response.status_code)
+                first = True
+                for line in response.iter_lines():
+                    text, done = self._chunk_text(line, on_context)
+                    if first:
+                        # Même nettoyage que la réponse complète (strip)
+                        text = text.lstrip()
+                        first = not text
+                    if text:
+                        yield text
+                    if done:
+                        break
+        except (requests.RequestException, ValueError) as e:
+            raise ProviderError(f"Ollama non disponible: {e}") from e
+
+    async def agenerate(self, prompt: str, context: Optional[List[int]] = None,
+                        on_context: Optional[Callable[[List[int]], None]] = None) -> str:
+        payload = self._payload(prompt, False, context)
+        try:
+            response = await self.apost("/api/generate", payload)
+            if response.status_code != 200:
+                raise ProviderError(f"Erreur Ollama: {response.text}", response.status_code)
+            result = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise ProviderError(f"Ollama non disponible: {e}") from e
+        return self._result_text(result, on_context)
+
+    async def astream(self, prompt: str, context: Optional[List[int]] = None,
+                      on_context: Optional[Callable[[List[int]], None]] = None) -> AsyncIterator[str]:
+        payload = self._payload(prompt, True, context)
+        try:
+            async with self.apost_stream("/api/generate", payload) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise ProviderError(f"Erreur Ollama: {response.text}", response.status_code)
+                first = True
+                async for line in response.aiter_lines():
+                    text, done = self._chunk_text(line, on_context)
+                    if first:
+                        text = text.lstrip()
+                        first = not text
+                    if text:
+                        yield text
+                    if done:
+                        break
+        except (httpx.HTTPError, ValueError) as e:
+            raise ProviderError(f"Ollama non disponible: {e}") from e
@@ -1,306 +1,18 @@
-# app_with_ai.py - POC Compagnon avec vraie IA
+# app_with_ai.py - POC Compagnon avec vraie IA (interface Gradio du moteur companion_engine)
 import gradio as gr
-import json
 import os
-from datetime import datetime
-import requests
-from typing import Optional
+from chat_session import ChatSession
+# AIVoiceCompanion reste importable depuis ce module
+from companion_engine import AIVoiceCompanion, get_companion  # noqa: F401
 
-class AIVoiceCompanion:
-    def __init__(self):
-        # Mémoire utilisateur simple (fichier JSON local)
-        self.memory_file = "user_memory.json"
-        self.load_memory()
-        
-        # Configuration IA - à modifier selon vos besoins
-        self.ai_config = {
-            "provider": "huggingface",  # ou "ollama", "openai"
-            "model": "microsoft/DialoGPT-medium",
-            "api_token": os.getenv("HF_TOKEN"),  # Token Hugging Face
-            "base_url": "https://api-inference.huggingface.co/models/"
-        }
-    
-    def load_memory(self):
-        """Charge la mémoire depuis fichier JSON"""
-        try:
-            with open(self.memory_file, 'r') as f:
-                self.user_memories = json.load(f)
-        except FileNotFoundError:
-            self.user_memories = {}
-    
-    def save_memory(self):
-        """Sauvegarde la mémoire dans fichier JSON"""
-        with open(self.memory_file, 'w') as f:
-            json.dump(self.user_memories, f, indent=2)
-    
-    def get_user_memory(self, user_id):
-        """Récupère mémoire utilisateur"""
-        if user_id not in self.user_memories:
-            self.user_memories[user_id] = {
-                "intimacy_level": 1.0,
-                "interaction_count": 0,
-                "personal_info": {},
-                "conversation_history": [],
-                "emotional_state": "neutral"
-            }
-        return self.user_memories[user_id]
-    
-    def extract_personal_markers(self, text):
-        """Extraction simple d'éléments personnels"""
-        markers = {
-            "nom": ["je m'appelle", "je suis", "mon nom"],
-            "humeur": ["je me sens", "je suis triste", "je suis heureux", "je suis content"],
-            "activité": ["je travaille", "je fais", "j'étudie"],
-            "lieu": ["je vis à", "j'habite", "je suis de"],
-            "famille": ["ma famille", "mes parents", "mon mari", "ma femme"],
-            "loisirs": ["j'aime", "je pratique", "mon hobby"]
-        }
-        
-        found_info = {}
-        text_lower = text.lower()
-        
-        for category, expressions in markers.items():
-            for expr in expressions:
-                if expr in text_lower:
-                    start = text_lower.find(expr)
-                    context = text[start:start+80].strip()
-                    found_info[category] = context
-                    break
-        
-        return found_info
-    
-    def calculate_intimacy_boost(self, text):
-        """Calcule augmentation intimité selon contenu"""
-        intimacy_triggers = {
-            "confidence": ["je te fais confiance", "tu peux m'aider", "j'ai besoin de toi"],
-            "personal": ["c'est personnel", "entre nous", "en confidence"],
-            "emotional": ["je me sens", "j'ai peur", "je suis inquiet", "ça me rend"],
-            "gratitude": ["merci", "tu m'aides", "grâce à toi"],
-            "problems": ["j'ai un problème", "je ne sais pas quoi faire", "aide-moi"]
-        }
-        
-        boost = 0.0
-        text_lower = text.lower()
-        
-        for category, triggers in intimacy_triggers.items():
-            for trigger in triggers:
-                if trigger in text_lower:
-                    if category == "confidence":
-                        boost += 0.3
-                    elif category == "personal":
-                        boost += 0.2
-                    elif category == "emotional":
-                        boost += 0.15
-                    elif category == "gratitude":
-                        boost += 0.1
-                    elif category == "problems":
-                        boost += 0.25
-                    break
-        
-        return min(boost, 0.5)
-    
-    def create_context_prompt(self, user_input: str, memory: dict) -> str:
-        """Crée le prompt contextuel pour l'IA"""
-        intimacy = memory["intimacy_level"]
-        personal_info = memory["personal_info"]
-        
-        # Base du prompt système
-        system_prompt = "Tu es un assistant conversationnel empathique et adaptatif. "
-        
-        # Adaptation selon niveau d'intimité
-        if intimacy <= 1.5:
-            system_prompt += "Utilise le vouvoiement et reste professionnel mais chaleureux. "
-        elif intimacy <= 2.5:
-            system_prompt += "Sois amical et utilise le tutoiement avec respect. "
-        elif intimacy <= 3.5:
-            system_prompt += "Sois familier et chaleureux. "
-            if "nom" in personal_info:
-                name = personal_info["nom"].split()[-1]
-                system_prompt += f"L'utilisateur s'appelle {name}. "
-        elif intimacy <= 4.5:
-            system_prompt += "Sois proche et empathique. Montre de la compréhension émotionnelle. "
-        else:
-            system_prompt += "Sois très proche et complice. Cette personne te fait confiance. "
-        
-        # Ajout contexte personnel
-        if personal_info:
-            system_prompt += f"Informations personnelles connues: {personal_info}. "
-        
-        # Historique récent
-        if memory["conversation_history"]:
-            recent = memory["conversation_history"][-2:]  # 2 derniers échanges
-            context = "Contexte récent: "
-            for conv in recent:
-                context += f"User: {conv['user']} | Assistant: {conv['assistant']} | "
-            system_prompt += context
-        
-        return f"{system_prompt}\n\nRéponds naturellement à: {user_input}"
-    
-    def query_huggingface_api(self, prompt: str) -> Optional[str]:
-        """Interroge l'API Hugging Face"""
-        if not self.ai_config["api_token"]:
-            return "⚠️ Token Hugging Face manquant. Définir HF_TOKEN dans les variables d'environnement."
-        
-        headers = {"Authorization": f"Bearer {self.ai_config['api_token']}"}
-        
-        # Pour DialoGPT et modèles conversationnels
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": 100,
-                "temperature": 0.7,
-                "do_sample": True,
-                "return_full_text": False
-            }
-        }
-        
-        try:
-            url = f"{self.ai_config['base_url']}{self.ai_config['model']}"
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    return result[0].get("generated_text", "").strip()
-                else:
-                    return str(result)
-            else:
-                return f"⚠️ Erreur API ({response.status_code}): {response.text}"
-        except Exception as e:
-            return f"⚠️ Erreur connexion: {str(e)}"
-    
-    def query_ollama_local(self, prompt: str) -> Optional[str]:
-        """Interroge Ollama en local"""
-        try:
-            payload = {
-                "model": "llama2",  # ou autre modèle installé
-                "prompt": prompt,
-                "stream": False
-            }
-            
-            response = requests.post(
-                "http://localhost:11434/api/generate", 
-                json=payload, 
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return response.json().get("response", "").strip()
-            else:
-                return f"⚠️ Erreur Ollama: {response.text}"
-        except Exception as e:
-            return f"⚠️ Ollama non disponible: {str(e)}"
-    
-    def generate_ai_response(self, prompt: str) -> str:
-        """Génère réponse via IA selon configuration"""
-        if self.ai_config["provider"] == "huggingface":
-            return self.query_huggingface_api(prompt)
-        elif self.ai_config["provider"] == "ollama":
-            return self.query_ollama_local(prompt)
-        else:
-            return "⚠️ Fournisseur IA non configuré"
-    
-    def adapt_response_style(self, ai_response: str, intimacy_level: float, personal_info: dict) -> str:
-        """Adapte le style de la réponse IA selon niveau intimité"""
-        if not ai_response or ai_response.startswith("⚠️"):
-            return ai_response
-        
-        response = ai_response
-        
-        if intimacy_level <= 1.5:
-            # Assurer vouvoiement si pas présent
-            response = response.replace(" tu ", " vous ")
-            response = response.replace("Tu ", "Vous ")
-        
-        elif intimacy_level <= 2.5:
-            # Amical mais respectueux - pas de modification nécessaire
-            pass
-        
-        elif intimacy_level <= 3.5:
-            # Familier et chaleureux
-            if "nom" in personal_info:
-                name = personal_info["nom"].split()[-1]
-                if name.lower() not in response.lower():
-                    response = f"{name}, {response}"
-            response += " 😊"
-        
-        elif intimacy_level <= 4.5:
-            # Proche et empathique
-            response += " ❤️"
-        
-        else:
-            # Très intime et complice
-            response += " 💙"
-        
-        return response
-    
-    def generate_response(self, user_input: str, user_id: str):
-        """Génère réponse adaptée avec IA"""
-        memory = self.get_user_memory(user_id)
-        
-        # Mise à jour compteur interactions
-        memory["interaction_count"] += 1
-        
-        # Extraction infos personnelles
-        personal_info = self.extract_personal_markers(user_input)
-        memory["personal_info"].update(personal_info)
-        
-        # Calcul boost intimité
-        intimacy_boost = self.calculate_intimacy_boost(user_input)
-        memory["intimacy_level"] = min(5.0, memory["intimacy_level"] + intimacy_boost)
-        
-        # Progression naturelle avec interactions
-        if memory["interaction_count"] % 5 == 0:
-            memory["intimacy_level"] = min(5.0, memory["intimacy_level"] + 0.1)
-        
-        # Génération prompt contextuel
-        context_prompt = self.create_context_prompt(user_input, memory)
-        
-        # Génération réponse IA
-        ai_response = self.generate_ai_response(context_prompt)
-        
-        # Adaptation style selon intimité
-        final_response = self.adapt_response_style(
-            ai_response, 
-            memory["intimacy_level"], 
-            memory["personal_info"]
-        )
-        
-        # Sauvegarde conversation
-        memory["conversation_history"].append({
-            "timestamp": datetime.now().isoformat(),
-            "user": user_input,
-            "assistant": final_response,
-            "intimacy_level": memory["intimacy_level"],
-            "ai_raw": ai_response  # Pour debug
-        })
-        
-        # Garder seulement les 10 dernières conversations
-        if len(memory["conversation_history"]) > 10:
-            memory["conversation_history"] = memory["conversation_history"][-10:]
-        
-        self.save_memory()
-        
-        return final_response, memory["intimacy_level"]
+# Instance globale (partagée avec les autres points d'entrée du processus)
+companion = get_companion("ai")
 
-# Instance globale
-companion = AIVoiceCompanion()
+# Nombre d'échanges affichés dans le chat (l'historique complet reste en mémoire)
+CHAT_DISPLAY_WINDOW = int(os.getenv("CHAT_DISPLAY_WINDOW", "20"))
 
-def process_conversation(message, chat_history, user_id, ai_provider):
-    """Traite la conversation avec IA"""
-    if not message.strip():
-        return chat_history, "Veuillez entrer un message", ""
-    
-    # Mise à jour config IA
-    companion.ai_config["provider"] = ai_provider.lower()
-    
-    # Génération réponse
-    response, intimacy_level = companion.generate_response(message, user_id)
-    
-    # Mise à jour historique
-    chat_history.append([message, response])
-    
-    # Info intimité
+def format_intimacy(intimacy_level):
+    """Libellé du niveau d'intimité affiché sous le chat"""
     intimacy_info = f"Niveau intimité: {intimacy_level:.1f}/5.0"
     if intimacy_level <= 1.5:
         intimacy_info += " (Formel)"
@@ -312,14 +24,55 @@ def process_conversation(message, chat_history, user_id, ai_provider):
         intimacy_info += " (Proche)"
     else:
         intimacy_info += " (Très intime)"
+    return intimacy_info
+
+def process_conversation(message, session, user_id, ai_provider):
+    """Traite la conversation avec IA (réponse affichée au fil des tokens en mode streaming).
+    
+    L'historique affiché est dans `session` (côté serveur) : seul le message arrive du navigateur.
+    """
+    if not message.strip():
+        yield gr.update(), "Veuillez entrer un message", ""
+        return
+    
+    # Fournisseur propre à la session, config partagée inchangée
+    provider = ai_provider.lower()
+    
+    if not companion.ai_config["stream"]:
+        response, intimacy_level = companion.generate_response(message, user_id, provider)
+        session.add(message, response)
+        yield session.render(), format_intimacy(intimacy_level), ""
+        return
+    
+    # Mise à jour historique au fil de la génération
+    session.add(message)
+    for partial, intimacy_level in companion.generate_response_stream(message, user_id, provider):
+        session.update(partial)
+        yield session.render(), format_intimacy(intimacy_level), ""
+
+async def aprocess_conversation(message, session, user_id, ai_provider):
+    """Version asynchrone de process_conversation (boucle d'événements de Gradio, sans thread par tour)"""
+    if not message.strip():
+        yield gr.update(), "Veuillez entrer un message", ""
+        return
+    
+    provider = ai_provider.lower()
     
-    return chat_history, intimacy_info, ""
+    if not companion.ai_config["stream"]:
+        response, intimacy_level = await companion.agenerate_response(message, user_id, provider)
+        session.add(message, response)
+        yield session.render(), format_intimacy(intimacy_level), ""
+        return
+    
+    session.add(message)
+    async for partial, intimacy_level in companion.agenerate_response_stream(message, user_id, provider):
+        session.update(partial)
+        yield session.render(), format_intimacy(intimacy_level), ""
 
-def reset_conversation(user_id):
+def reset_conversation(user_id, session):
     """Reset conversation pour un utilisateur"""
-    if user_id in companion.user_memories:
-        del companion.user_memories[user_id]
-        companion.save_memory()
+    companion.reset_memory(user_id)
+    session.clear()
     return [], "Niveau intimité: 1.0/5.0 (Formel)"
 
 # Interface Gradio
@@ -353,6 +106,9 @@ with gr.Blocks(
                 placeholder="La conversation avec IA apparaîtra ici..."
             )
             
+            # Historique affiché gardé côté serveur (jamais renvoyé par le navigateur)
+            chat_session = gr.State(ChatSession(window=CHAT_DISPLAY_WINDOW))
+            
             # Indicateur niveau intimité
             intimacy_display = gr.Textbox(
                 label="📊 Niveau de relation",
@@ -366,10 +122,17 @@ with gr.Blocks(
             gr.Markdown("### 🤖 Configuration IA")
             
             ai_provider = gr.Dropdown(
-                choices=["HuggingFace", "Ollama"],
-                value="HuggingFace",
+                choices=["Auto", "HuggingFace", "Ollama"],
+                value="Auto",
                 label="Fournisseur IA",
-                info="Choisir le backend IA"
+                info="Auto : premier fournisseur disponible, bascule si lent ou en panne"
+            )
+            
+            model_status = gr.Textbox(
+                label="🔥 État des modèles",
+                value=companion.warmup.status_text,
+                interactive=False,
+                max_lines=2
             )
             
             user_id = gr.Textbox(
@@ -406,26 +169,39 @@ with gr.Blocks(
             clear_btn = gr.Button("🗑️ Reset", variant="secondary")
     
     # Événements
+    conversation_handler = aprocess_conversation if companion.ai_config["async"] else process_conversation
     send_btn.click(
-        fn=process_conversation,
-        inputs=[message_input, chatbot, user_id, ai_provider],
+        fn=conversation_handler,
+        inputs=[message_input, chat_session, user_id, ai_provider],
         outputs=[chatbot, intimacy_display, message_input]
     )
     
     message_input.submit(
-        fn=process_conversation,
-        inputs=[message_input, chatbot, user_id, ai_provider],
+        fn=conversation_handler,
+        inputs=[message_input, chat_session, user_id, ai_provider],
         outputs=[chatbot, intimacy_display, message_input]
     )
     
     clear_btn.click(
-        fn=lambda uid: reset_conversation(uid),
-        inputs=[user_id],
+        fn=reset_conversation,
+        inputs=[user_id, chat_session],
         outputs=[chatbot, intimacy_display]
     )
+    
+    # Rafraîchissement de l'état des modèles (préchauffage, maintien)
+    gr.Timer(5).tick(fn=companion.warmup.status_text, outputs=[model_status])
 
 # Lancement application
 if __name__ == "__main__":
+    # Plusieurs sessions traitées en parallèle (verrous par utilisateur) ; en asynchrone,
+    # une conversation en attente du modèle ne coûte pas de thread : limite bien plus haute
+    default_concurrency = "256" if companion.ai_config["async"] else "8"
+    demo.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", default_concurrency)))
+    companion.export_metrics()
+    # Serveur ouvert une fois les modèles chargés : le premier tour n'attend pas le chargement
+    companion.start_warmup()
+    if companion.ai_config["warmup"]:
+        companion.warmup.wait(companion.ai_config["warmup_timeout"])
     demo.launch(
         debug=True,
         share=False  # True pour URL publique temporaire
@@ -0,0 +1,99 @@
+# benchmarks/bench_history_archive.py - Archive froide de l'historique : taux de compression et débit par codec
+"""Archive des échanges synthétiques (conversations de bench_turns.py, réponses
+de fake_llm.py) avec chaque codec de history_archive.py, puis les relit en flux.
+Affiche pour chaque codec :
+
+- le taux de compression (JSON brut / segments compressés) ;
+- le débit d'archivage (mise en attente, compression et écriture des blocs) ;
+- le débit de relecture complète (`iter_turns`) et la relecture d'un seul utilisateur.
+
+    python benchmarks/bench_history_archive.py --entries 200000
+    python benchmarks/bench_history_archive.py --codec lzma --block-entries 2048
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_turns import conversation  # noqa: E402
+from fake_llm import REPLIES  # noqa: E402
+
+
+def generate_entries(count: int, users: int, seed: int) -> list:
+    """(user_id, HistoryEntry) d'échanges répartis entre `users` utilisateurs"""
+    from user_memory import HistoryEntry
+
+    rng = random.Random(seed)
+    entries = []
+    while len(entries) < count:
+        user_id = f"user_{rng.randrange(users)}"
+        for message in conversation(rng, 20):
+            reply = rng.choice(REPLIES)
+            prefix = rng.choice(["", "Oh, ", "Je vois. "])
+            entries.append((user_id, HistoryEntry.create(message, prefix + reply, 1.0 + rng.random() * 4,
+                                                         ai_raw=reply)))
+    return entries[:count]
+
+
+def run(codec: str, entries: list, args, directory: str) -> dict:
+    from history_archive import HistoryArchive
+
+    archive = HistoryArchive(directory, codec, block_entries=args.block_entries, flush_interval=3600)
+    start = time.perf_counter()
+    for index, (user_id, entry) in enumerate(entries, 1):
+        archive.add(user_id, entry)
+        if index % args.block_entries == 0:
+            archive.flush()
+    archive.flush()
+    write_seconds = time.perf_counter() - start
+    stats = archive.stats()
+
+    start = time.perf_counter()
+    read = sum(1 for _ in archive.iter_turns())
+    read_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    user_turns = sum(1 for _ in archive.iter_turns(user_id=entries[0][0]))
+    user_seconds = time.perf_counter() - start
+    archive.close()
+    return {
+        "codec": codec,
+        "entries": len(entries),
+        "ratio": stats["compression_ratio"],
+        "raw_bytes": stats["raw_bytes"],
+        "disk_bytes": sum(os.path.getsize(path) for _, path in archive.segments()),
+        "write_per_sec": len(entries) / write_seconds,
+        "write_mb_per_sec": stats["raw_bytes"] / 1e6 / write_seconds,
+        "read_per_sec": read / read_seconds,
+        "user_read_ms": 1000 * user_seconds,
+        "user_turns": user_turns
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000, help="échanges archivés")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--codec", choices=["gzip", "zlib", "lzma"], action="append",
+                        help="codec(s) à mesurer (tous par défaut)")
+    parser.add_argument("--block-entries", type=int, default=512, help="échanges par bloc compressé")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entries = generate_entries(args.entries, args.users, args.seed)
+    print(f"{'codec':6s} {'échanges':>9s} {'brut':>9s} {'disque':>9s} {'taux':>6s} {'écrits/s':>9s} "
+          f"{'Mo/s':>6s} {'relus/s':>9s} {'1 utilisateur':>14s}")
+    for codec in args.codec or ["gzip", "zlib", "lzma"]:
+        with tempfile.TemporaryDirectory() as directory:
+            r = run(codec, entries, args, directory)
+        print(f"{r['codec']:6s} {r['entries']:9d} {r['raw_bytes'] / 1e6:7.1f}Mo {r['disk_bytes'] / 1e6:7.1f}Mo "
+              f"{r['ratio']:5.1f}x {r['write_per_sec']:9.0f} {r['write_mb_per_sec']:6.1f} {r['read_per_sec']:9.0f} "
+              f"{r['user_read_ms']:9.0f} ms ({r['user_turns']})")
+
+
+if __name__ == "__main__":
+    main()
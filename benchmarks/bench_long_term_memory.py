@@ -0,0 +1,137 @@
+# benchmarks/bench_long_term_memory.py - Recherche dans la mémoire à long terme (BM25) sur de longs historiques
+"""Remplit la mémoire à long terme d'un utilisateur avec des milliers
+d'échanges synthétiques, dans lesquels quelques confidences sont glissées tôt.
+Mesure :
+
+- le débit d'ajout (historique du profil et archivage compressé compris) ;
+- la construction de l'index depuis l'archive (premier tour après un redémarrage) ;
+- la latence des recherches (p50/p99) ;
+- le rappel : part des confidences retrouvées parmi les `--top-k` souvenirs.
+
+    python benchmarks/bench_long_term_memory.py --turns 1000 5000 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEMPLATES = [
+    "J'ai eu une longue journée {place}", "Ce week-end je vais {activity} avec {person}",
+    "Tu peux me conseiller {thing} ?", "Je me sens {feeling} depuis {moment}",
+    "Hier soir {person} m'a parlé de {thing}", "J'aimerais {activity} plus souvent",
+    "Je repense à {moment}, c'était {feeling}", "Qu'est-ce que tu penses de {thing} ?",
+    "{person} veut qu'on aille {place}", "Je n'ai pas réussi à {activity} {moment}"
+]
+VOCABULARY = {
+    "place": ["au bureau", "à la gare", "chez le dentiste", "au marché", "à la piscine", "en réunion",
+              "à la bibliothèque", "au restaurant", "à la montagne", "au cinéma"],
+    "activity": ["courir", "cuisiner", "lire", "jardiner", "peindre", "nager", "danser", "méditer",
+                 "bricoler", "jouer de la guitare"],
+    "person": ["ma collègue", "mon voisin", "ma mère", "mon frère", "mon patron", "une amie",
+               "mon coloc", "ma cousine", "le médecin", "mon coach"],
+    "thing": ["un roman policier", "une série", "un podcast", "une recette de soupe", "un voyage en Italie",
+              "un nouveau téléphone", "la politique", "un film d'animation", "un jeu de société", "le yoga"],
+    "feeling": ["épuisée", "soulagé", "nerveuse", "joyeux", "mélancolique", "motivée", "perdu",
+                "reconnaissante", "agacé", "sereine"],
+    "moment": ["ce matin", "la semaine dernière", "mon anniversaire", "les vacances", "lundi",
+               "l'été dernier", "notre déménagement", "la rentrée", "Noël", "mon enfance"]
+}
+REPLIES = [
+    "Je comprends ce que tu ressens, c'est tout à fait normal.", "Raconte-moi, je suis là pour t'écouter.",
+    "C'est une belle idée ! Qu'est-ce qui t'en a donné envie ?", "Prends soin de toi ce soir."
+]
+# (confidence glissée dans l'historique, question posée bien plus tard)
+FACTS = [
+    ("Mon chat s'appelle Filou et il dort sur mon clavier", "Tu te souviens du nom de mon chat ?"),
+    ("Ma sœur Élodie se marie en juin à Biarritz", "Où se passe le mariage de ma sœur ?"),
+    ("Je suis allergique aux arachides depuis l'enfance", "Tu connais mes allergies ?"),
+    ("Mon grand-père m'a appris à jouer aux échecs", "Qui m'a appris les échecs déjà ?"),
+    ("J'ai peur de l'avion depuis un vol très agité", "Pourquoi j'ai peur de prendre l'avion ?")
+]
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run(turns: int, args, directory: str) -> dict:
+    from history_archive import HistoryArchive
+    from long_term_memory import LongTermMemory
+    from user_memory import UserMemory
+
+    rng = random.Random(args.seed)
+    archive = HistoryArchive(directory, flush_interval=3600)
+    memory = LongTermMemory(archive)
+    profile = UserMemory()
+    user_id = f"bench_{turns}"
+    planted = {rng.randrange(turns // 2) for _ in range(len(FACTS))}
+    facts = iter(FACTS)
+    start = time.perf_counter()
+    for position in range(turns):
+        fact = next(facts, None) if position in planted else None
+        message = fact[0] if fact else rng.choice(TEMPLATES).format(
+            **{slot: rng.choice(words) for slot, words in VOCABULARY.items()})
+        reply = rng.choice(REPLIES)
+        # Comme un tour du compagnon : historique du profil, échange évincé archivé, puis indexé
+        entry = profile.add_exchange(message, reply, ai_raw=reply, on_evict=partial(archive.add, user_id))
+        memory.add(user_id, entry)
+    archive.flush()
+    add_seconds = time.perf_counter() - start
+
+    # Premier tour après redémarrage : index reconstruit depuis l'archive et l'historique du profil
+    memory = LongTermMemory(archive)
+    start = time.perf_counter()
+    memory.load(user_id, profile.conversation_history)
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    found = 0
+    queries = [question for _, question in FACTS[:len(planted)]] + [
+        rng.choice(TEMPLATES).format(**{slot: rng.choice(words) for slot, words in VOCABULARY.items()})
+        for _ in range(100)
+    ]
+    for index in range(args.queries):
+        question = queries[index % len(queries)]
+        start = time.perf_counter()
+        results = memory.recall(user_id, question, args.top_k, exclude=profile.conversation_history.recent(2))
+        latencies.append(time.perf_counter() - start)
+        if index < len(planted):
+            found += any(entry.user == FACTS[index][0] for entry in results)
+    latencies.sort()
+    memory.close()
+    archive.close()
+    return {
+        "turns": turns,
+        "add_per_sec": turns / add_seconds,
+        "load_ms": 1000 * load_seconds,
+        "query_p50_us": 1e6 * percentile(latencies, 0.5),
+        "query_p99_us": 1e6 * percentile(latencies, 0.99),
+        "recall": found / len(planted)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[1000, 5000],
+                        help="échanges gardés pour l'utilisateur")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'échanges':>9s} {'ajouts/s':>9s} {'index ms':>9s} {'p50 µs':>8s} {'p99 µs':>8s} {'rappel':>7s}")
+    for turns in args.turns:
+        with tempfile.TemporaryDirectory() as directory:
+            r = run(turns, args, directory)
+        print(f"{r['turns']:9d} {r['add_per_sec']:9.0f} {r['load_ms']:9.1f} {r['query_p50_us']:8.0f} "
+              f"{r['query_p99_us']:8.0f} {r['recall']:7.0%}")
+
+
+if __name__ == "__main__":
+    main()
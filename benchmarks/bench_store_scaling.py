@@ -0,0 +1,371 @@
+# benchmarks/bench_store_scaling.py - Montée en charge du store : population synthétique et rapport de capacité
+"""Génère des populations d'utilisateurs au format de `user_memory.json`, avec
+des historiques, des informations personnelles et des niveaux d'intimité
+variés. Pour chaque format de store et chaque taille, la mesure se fait dans
+un processus séparé :
+
+- temps d'ouverture (chargement au démarrage) ;
+- lecture à froid d'un profil (`get`) ;
+- coût de persistance par tour (`get` + `save` du delta, compactages compris) ;
+- temps du `flush` final ;
+- pic de mémoire (RSS) au-delà de l'interpréteur nu ;
+- taille moyenne d'un profil chargé en mémoire (tracemalloc) ;
+- taille sur disque, dont l'index.
+
+Le rapport se termine par une extrapolation à `--plan` utilisateurs : linéaire
+pour le JSON (tout est chargé), cache plein plus index pour les backends à
+chargement paresseux.
+
+    python benchmarks/bench_store_scaling.py --users 10000 100000
+    python benchmarks/bench_store_scaling.py --users 1000000 --format sqlite --turns 20000 --json capacity.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Format -> paramètres de create_memory_store (mêmes réglages que les compagnons par défaut)
+FORMATS = {
+    "json": {"backend": "json"},
+    "json+flusher": {"backend": "json", "flush_interval_ms": 20},
+    "sqlite": {"backend": "sqlite"},
+    "sqlite+flusher": {"backend": "sqlite", "flush_interval_ms": 20},
+    "segment": {"backend": "segment"},
+    "segment+flusher": {"backend": "segment", "flush_interval_ms": 20}
+}
+# Profils gardés en mémoire par le cache des backends paresseux (défaut des compagnons, MEMORY_CACHE_SIZE)
+CACHE_SIZE = 10000
+# Backend -> (extension, fichiers d'index compagnons) du fichier de population
+FILES = {"json": ("json", ()), "sqlite": ("db", ()), "segment": ("seg", (".idx",))}
+
+FIRST_NAMES = ["Marie", "Lucas", "Camille", "Hugo", "Léa", "Théo", "Chloé", "Nathan", "Inès", "Jules"]
+PERSONAL_INFO = {
+    "nom": "je m'appelle {name} et je suis ravie de te parler",
+    "humeur": "je me sens un peu fatiguée ces derniers temps, le travail me pèse",
+    "activité": "je travaille comme infirmière de nuit à l'hôpital",
+    "lieu": "j'habite à Lyon depuis cinq ans avec mon chat",
+    "famille": "ma famille vit loin, je les vois surtout pendant les vacances",
+    "loisirs": "j'aime la randonnée et la photographie de paysages"
+}
+USER_MESSAGES = [
+    "Bonjour !", "Je me sens un peu triste aujourd'hui", "Merci de m'écouter",
+    "J'ai eu une longue journée au travail", "Tu peux me conseiller un livre ?",
+    "Je te fais confiance", "Il fait beau, j'ai envie de sortir ce week-end"
+]
+REPLIES = [
+    "Bonjour ! Comment puis-je vous aider aujourd'hui ?",
+    "Je comprends ce que tu ressens, c'est tout à fait normal de passer par là.",
+    "Je t'en prie, c'est avec plaisir que je t'écoute. 💙",
+    "C'est intéressant ce que tu me dis. Tu peux m'en dire davantage ?"
+]
+
+
+def generate_user(rng: random.Random, shape: str, now: datetime) -> dict:
+    """Profil synthétique : la plupart des utilisateurs sont occasionnels, quelques-uns très actifs"""
+    interactions = min(5000, int(rng.paretovariate(1.2)))
+    intimacy = min(5.0, 1.0 + 0.1 * (interactions // 5) + rng.random() * min(4.0, interactions * 0.05))
+    name = rng.choice(FIRST_NAMES)
+    categories = rng.sample(list(PERSONAL_INFO), k=min(len(PERSONAL_INFO), rng.randrange(0, 7)))
+    personal_info = {category: PERSONAL_INFO[category].format(name=name) for category in categories}
+    moment = now - timedelta(days=rng.randrange(0, 365), seconds=rng.randrange(86400))
+    history = []
+    for _ in range(min(10, interactions)):
+        moment += timedelta(seconds=rng.randrange(10, 600))
+        reply = rng.choice(REPLIES)
+        entry = {
+            "timestamp": moment.isoformat(),
+            "user": rng.choice(USER_MESSAGES),
+            "assistant": reply,
+            "intimacy_level": round(intimacy, 1)
+        }
+        if shape == "ai":
+            entry["ai_raw"] = reply
+        history.append(entry)
+    return {
+        "intimacy_level": round(intimacy, 1),
+        "interaction_count": interactions,
+        "personal_info": personal_info,
+        "conversation_history": history,
+        "emotional_state": "neutral"
+    }
+
+
+def generate_population(users: int, seed: int, shape: str):
+    """(user_id, profil) pour `users` utilisateurs, de façon reproductible"""
+    rng = random.Random(seed)
+    now = datetime(2025, 9, 1)
+    for index in range(users):
+        yield f"user_{index}", generate_user(rng, shape, now)
+
+
+def write_json_population(path: str, users: int, seed: int, shape: str):
+    """Écrit la population comme le ferait un compactage (indent=2), sans tout garder en mémoire"""
+    with open(path, "w") as f:
+        f.write("{\n")
+        for index, (user_id, memory) in enumerate(generate_population(users, seed, shape)):
+            if index:
+                f.write(",\n")
+            f.write(json.dumps({user_id: memory}, indent=2)[2:-2])
+        f.write("\n}")
+
+
+def write_sqlite_population(path: str, users: int, seed: int, shape: str):
+    from memory_store import SqliteMemoryStore
+    from user_memory import UserMemory
+
+    store = SqliteMemoryStore(path)
+    batch = {}
+    for user_id, memory in generate_population(users, seed, shape):
+        batch[user_id] = UserMemory.from_dict(memory)
+        if len(batch) >= 10000:
+            store.save_many(batch)
+            batch = {}
+    store.save_many(batch)
+    store.close()
+
+
+def write_segment_population(path: str, users: int, seed: int, shape: str):
+    """Segment et index tels que laissés par un compactage"""
+    from memory_segments import SegmentMemoryStore
+    from user_memory import UserMemory
+
+    store = SegmentMemoryStore(path, unindexed_limit=users + 1)
+    batch = {}
+    for user_id, memory in generate_population(users, seed, shape):
+        batch[user_id] = UserMemory.from_dict(memory)
+        if len(batch) >= 10000:
+            store.save_many(batch)
+            batch = {}
+    store.save_many(batch)
+    store.compact()
+    store.close()
+
+
+WRITERS = {"json": write_json_population, "sqlite": write_sqlite_population, "segment": write_segment_population}
+
+
+def prepare_population(data_dir: str, backend: str, users: int, seed: int, shape: str) -> str:
+    """Fichier de population du backend (généré une fois par taille, puis réutilisé)"""
+    extension, companions = FILES[backend]
+    path = os.path.join(data_dir, f"population_{shape}_{users}_{seed}.{extension}")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        WRITERS[backend](f"{path}.tmp", users, seed, shape)
+        for suffix in companions:
+            os.replace(f"{path}.tmp{suffix}", f"{path}{suffix}")
+        os.replace(f"{path}.tmp", path)
+        print(f"  population {backend} de {users} utilisateurs générée en {time.perf_counter() - start:.1f}s",
+              file=sys.stderr)
+    return path
+
+
+def peak_rss() -> int:
+    """Pic de mémoire résidente du processus, en octets (0 si non mesurable).
+
+    Sous Linux, VmHWM repart de zéro à l'exec, contrairement à ru_maxrss qui
+    hérite du pic du processus parent.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def backend_store(store):
+    """Backend sous les couches de cache, d'écriture groupée et de mesure"""
+    while hasattr(store, "backend"):
+        store = store.backend
+    return store
+
+
+def profile_bytes(store, user_ids: list) -> float:
+    """Mémoire moyenne d'un profil lu depuis le backend (objets UserMemory, historique compris)"""
+    backend = backend_store(store)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = [backend.get(user_id) for user_id in user_ids]
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    loaded = sum(memory is not None for memory in held)
+    return allocated / loaded if loaded else 0.0
+
+
+def measure(format_name: str, workdir: str, users: int, turns: int, seed: int) -> dict:
+    """Mesures d'un format, dans le processus courant (appelé dans un sous-processus)"""
+    from memory_store import create_memory_store, new_user_memory
+
+    baseline = peak_rss()
+    memory_file = os.path.join(workdir, "user_memory.json")
+    start = time.perf_counter()
+    store = create_memory_store(memory_file=memory_file, cache_size=CACHE_SIZE, **FORMATS[format_name])
+    load_seconds = time.perf_counter() - start
+    rng = random.Random(seed + 1)
+
+    # Lectures à froid : profils jamais demandés depuis l'ouverture
+    gets = []
+    for user_id in rng.sample(range(users), min(users, 1000)):
+        start = time.perf_counter()
+        store.get(f"user_{user_id}")
+        gets.append(time.perf_counter() - start)
+
+    # Tours : lecture, mise à jour comme commit_turn, sauvegarde du delta
+    costs = []
+    for _ in range(turns):
+        user_id = f"user_{rng.randrange(users)}"
+        start = time.perf_counter()
+        memory = store.get(user_id) or new_user_memory()
+        memory.interaction_count += 1
+        entry = memory.add_exchange(rng.choice(USER_MESSAGES), rng.choice(REPLIES))
+        store.save(user_id, memory, {}, entry)
+        costs.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    store.flush()
+    flush_seconds = time.perf_counter() - start
+    # Après les mesures de temps (tracemalloc ralentit les allocations)
+    profile_size = profile_bytes(store, [f"user_{user_id}" for user_id in rng.sample(range(users), min(users, 1000))])
+    store.close()
+    extension, companions = FILES[FORMATS[format_name]["backend"]]
+    index_bytes = sum(os.path.getsize(f"{memory_file[:-len('json')]}{extension}{suffix}") for suffix in companions)
+
+    gets.sort()
+    ordered = sorted(costs)
+    return {
+        "format": format_name,
+        "users": users,
+        "turns": turns,
+        "load_seconds": load_seconds,
+        "get_p50_us": 1e6 * percentile(gets, 0.5),
+        "get_p99_us": 1e6 * percentile(gets, 0.99),
+        "turn_mean_us": 1e6 * sum(costs) / len(costs) if costs else 0.0,
+        "turn_p50_us": 1e6 * percentile(ordered, 0.5),
+        "turn_p99_us": 1e6 * percentile(ordered, 0.99),
+        "turn_max_ms": 1e3 * (ordered[-1] if ordered else 0.0),
+        "flush_seconds": flush_seconds,
+        "peak_rss_bytes": max(0, peak_rss() - baseline),
+        "profile_bytes": profile_size,
+        "index_bytes": index_bytes,
+        "disk_bytes": sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir))
+    }
+
+
+def run_format(format_name: str, users: int, args) -> dict:
+    """Copie la population dans un répertoire neuf et mesure dans un sous-processus"""
+    backend = FORMATS[format_name]["backend"]
+    population = prepare_population(args.data_dir, backend, users, args.seed, args.shape)
+    with tempfile.TemporaryDirectory(dir=args.data_dir) as workdir:
+        extension, companions = FILES[backend]
+        for suffix in ("",) + companions:
+            shutil.copyfile(f"{population}{suffix}", os.path.join(workdir, f"user_memory.{extension}{suffix}"))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", format_name, workdir,
+             str(users), str(args.turns), str(args.seed)],
+            capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def human(size: float) -> str:
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "o" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} To"
+
+
+def report(results: list, plan: int):
+    print(f"{'format':15s} {'utilisateurs':>12s} {'chargement':>10s} {'get p99':>9s} {'tour moy':>9s} "
+          f"{'tour p99':>9s} {'tour max':>9s} {'RSS':>10s} {'disque':>10s}")
+    for r in results:
+        print(f"{r['format']:15s} {r['users']:12d} {r['load_seconds']:9.2f}s {r['get_p99_us']:7.0f}µs "
+              f"{r['turn_mean_us']:7.0f}µs {r['turn_p99_us']:7.0f}µs {r['turn_max_ms']:7.1f}ms "
+              f"{human(r['peak_rss_bytes']):>10s} {human(r['disk_bytes']):>10s}")
+
+    # Extrapolation depuis la plus grande population mesurée de chaque format
+    largest = {}
+    for r in results:
+        if r["users"] >= largest.get(r["format"], {"users": 0})["users"]:
+            largest[r["format"]] = r
+    print(f"\nCapacité estimée pour {plan} utilisateurs :")
+    for name, r in largest.items():
+        factor = plan / r["users"]
+        disk = f"disque ~{human(r['disk_bytes'] * factor)} ({r['disk_bytes'] / r['users']:.0f} o/utilisateur)"
+        if FORMATS[name]["backend"] == "json":
+            # Tout est chargé au démarrage : temps et mémoire proportionnels à la population
+            print(f"  {name:15s} chargement ~{r['load_seconds'] * factor:.1f}s, "
+                  f"RAM ~{human(r['peak_rss_bytes'] * factor)} ({r['peak_rss_bytes'] / r['users']:.0f} "
+                  f"o/utilisateur), {disk}")
+        else:
+            # Chargement paresseux : cache plein de profils actifs, plus l'index (proportionnel à la population)
+            cached = min(plan, CACHE_SIZE)
+            index = r["index_bytes"] * factor
+            print(f"  {name:15s} chargement ~{r['load_seconds']:.2f}s, "
+                  f"RAM ~{human(cached * r['profile_bytes'] + index)} (cache de {cached} profils "
+                  f"× {r['profile_bytes']:.0f} o + index {human(index)}), {disk}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        format_name, workdir, users, turns, seed = sys.argv[2:7]
+        print(json.dumps(measure(format_name, workdir, int(users), int(turns), int(seed))))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000],
+                        help="tailles de population (ex. 10000 100000 1000000)")
+    parser.add_argument("--format", choices=sorted(FORMATS), action="append",
+                        help="format(s) de store à mesurer (tous par défaut)")
+    parser.add_argument("--turns", type=int, default=5000, help="tours persistés par mesure")
+    parser.add_argument("--shape", choices=["simple", "ai"], default="ai",
+                        help="entrées d'historique de app.py ou de app_with_ai.py (avec ai_raw)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="répertoire des populations générées (réutilisées d'un lancement à l'autre)")
+    parser.add_argument("--plan", type=int, default=1000000, help="nombre d'utilisateurs visé par le rapport")
+    parser.add_argument("--json", help="écrit les mesures dans ce fichier")
+    args = parser.parse_args()
+
+    cleanup = args.data_dir is None
+    args.data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix="store_scaling_"))
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    try:
+        for users in args.users:
+            for format_name in args.format or FORMATS:
+                print(f"{format_name} / {users} utilisateurs…", file=sys.stderr)
+                results.append(run_format(format_name, users, args))
+    finally:
+        if cleanup:
+            shutil.rmtree(args.data_dir, ignore_errors=True)
+
+    report(results, args.plan)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
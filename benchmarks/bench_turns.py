@@ -0,0 +1,255 @@
+# benchmarks/bench_turns.py - Débit et latence des compagnons face à un fournisseur IA simulé
+"""Rejoue des conversations françaises synthétiques (plusieurs utilisateurs en
+parallèle) à travers `SimpleVoiceCompanion.generate_response` et
+`AIVoiceCompanion.generate_response`, puis affiche la latence par tour
+(p50/p95/p99), le débit et le volume écrit par le store.
+
+Le compagnon IA parle à benchmarks/fake_llm.py, lancé dans un processus à part
+(latence log-normale et taux d'erreur réglables). Les résultats peuvent être
+ajoutés à un fichier JSON Lines pour comparer les commits entre eux.
+
+    python benchmarks/bench_turns.py --users 32 --turns 20 --median-ms 300
+    python benchmarks/bench_turns.py --target ai --provider ollama --async --error-rate 0.05
+    python benchmarks/bench_turns.py --backend sqlite --flush-ms 20 --json bench.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIRST_NAMES = ["Marie", "Lucas", "Camille", "Hugo", "Léa", "Théo", "Chloé", "Nathan", "Inès", "Jules"]
+CITIES = ["Lyon", "Marseille", "Nantes", "Bordeaux", "Lille", "Toulouse", "Rennes", "Strasbourg"]
+HOBBIES = ["la randonnée", "la photographie", "cuisiner", "lire des romans", "la musique", "le vélo"]
+JOBS = ["infirmière", "développeur", "professeur", "boulangère", "étudiant", "comptable"]
+FEELINGS = ["un peu triste", "fatigué", "vraiment heureuse", "stressé", "seule", "de bonne humeur"]
+
+OPENINGS = ["Bonjour !", "Salut", "Coucou, ça va ?", "Bonsoir"]
+PERSONAL = [
+    "Je m'appelle {name}",
+    "J'habite à {city} depuis quelques années",
+    "J'aime beaucoup {hobby}, surtout le week-end",
+    "Je travaille comme {job}",
+    "Je me sens {feeling} aujourd'hui"
+]
+SMALL_TALK = [
+    "Tu peux me conseiller un livre ?",
+    "Qu'est-ce que tu penses de la vie en ville ?",
+    "J'ai eu une longue journée au travail",
+    "Il fait beau aujourd'hui, j'ai envie de sortir",
+    "Je ne sais pas quoi faire ce soir",
+    "Tu crois qu'on peut changer de métier à trente ans ?"
+]
+CLOSE = [
+    "Merci de m'écouter",
+    "Je te fais confiance",
+    "Tu me comprends vraiment bien",
+    "J'ai besoin de parler à quelqu'un",
+    "Merci beaucoup, ça me fait du bien"
+]
+
+
+def conversation(rng: random.Random, turns: int) -> list:
+    """Conversation d'un utilisateur : salutation, confidences puis échanges plus proches"""
+    details = {
+        "name": rng.choice(FIRST_NAMES), "city": rng.choice(CITIES), "hobby": rng.choice(HOBBIES),
+        "job": rng.choice(JOBS), "feeling": rng.choice(FEELINGS)
+    }
+    messages = [rng.choice(OPENINGS)]
+    while len(messages) < turns:
+        progress = len(messages) / turns
+        pool = rng.choices([PERSONAL, SMALL_TALK, CLOSE], weights=[2, 3, 1 + 4 * progress])[0]
+        messages.append(rng.choice(pool).format(**details))
+    return messages[:turns]
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def start_fake_server(args) -> tuple:
+    """Lance fake_llm.py dans un processus à part et renvoie (processus, port)"""
+    command = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_llm.py"),
+        "--median-ms", str(args.median_ms), "--sigma", str(args.sigma), "--token-ms", str(args.token_ms),
+        "--error-rate", str(args.error_rate), "--seed", str(args.seed)
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("PORT "):
+        process.kill()
+        raise RuntimeError(f"fake_llm.py n'a pas démarré : {line!r}")
+    return process, int(line.split()[1])
+
+
+def create_companion(target: str, args, port: int):
+    """Compagnon configuré par variables d'environnement, dans le répertoire de travail courant"""
+    os.environ.update({
+        "MEMORY_BACKEND": args.backend,
+        "MEMORY_FLUSH_MS": str(args.flush_ms),
+        "AI_PROVIDERS": "huggingface,ollama" if args.provider == "auto" else args.provider,
+        "HF_TOKEN": "benchmark",
+        "HF_BASE_URL": f"http://127.0.0.1:{port}/models/",
+        "OLLAMA_URL": f"http://127.0.0.1:{port}",
+        "AI_WARMUP": "0"
+    })
+    if target == "simple":
+        from companion_engine import SimpleVoiceCompanion
+        return SimpleVoiceCompanion()
+    from companion_engine import AIVoiceCompanion
+    return AIVoiceCompanion()
+
+
+def backend_store(store):
+    """Backend sous les couches de cache, d'écriture groupée et de mesure"""
+    while hasattr(store, "backend"):
+        store = store.backend
+    return store
+
+
+def disk_usage(workdir: str) -> int:
+    """Octets écrits sous `workdir`, sous-répertoires compris (archive de l'historique)"""
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(workdir) for name in files)
+
+
+def run_target(target: str, args, port: int, workdir: str) -> dict:
+    """Un passage de charge ; renvoie les mesures"""
+    companion = create_companion(target, args, port)
+    provider = None if target == "simple" else args.provider
+    rng = random.Random(args.seed)
+    scripts = [(f"bench_{i}", conversation(rng, args.turns)) for i in range(args.users)]
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def respond(user_id: str, message: str) -> str:
+        if target == "simple":
+            return companion.generate_response(message, user_id)[0]
+        return companion.generate_response(message, user_id, provider)[0]
+
+    def worker(user_id: str, messages: list):
+        nonlocal errors
+        local, failed = [], 0
+        for message in messages:
+            start = time.perf_counter()
+            response = respond(user_id, message)
+            local.append(time.perf_counter() - start)
+            failed += response.startswith("⚠️")
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    async def async_worker(user_id: str, messages: list):
+        nonlocal errors
+        for message in messages:
+            start = time.perf_counter()
+            response, _ = await companion.agenerate_response(message, user_id, provider)
+            latencies.append(time.perf_counter() - start)
+            errors += response.startswith("⚠️")
+
+    async def run_async():
+        await asyncio.gather(*(async_worker(user_id, messages) for user_id, messages in scripts))
+
+    start = time.perf_counter()
+    if args.use_async and target == "ai":
+        asyncio.run(run_async())
+    else:
+        threads = [threading.Thread(target=worker, args=script) for script in scripts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+    companion.store.flush()
+    backend = backend_store(companion.store)
+    written = backend.stats()["bytes_written"] if hasattr(backend, "stats") else 0
+    companion.close()
+
+    ordered = sorted(latencies)
+    turns = len(ordered)
+    return {
+        "target": target,
+        "mode": "async" if args.use_async and target == "ai" else "threads",
+        "provider": provider,
+        "backend": args.backend,
+        "flush_ms": args.flush_ms,
+        "users": args.users,
+        "turns": turns,
+        "errors": errors,
+        "seconds": elapsed,
+        "turns_per_sec": turns / elapsed if elapsed else 0.0,
+        "p50_ms": 1000 * percentile(ordered, 0.50),
+        "p95_ms": 1000 * percentile(ordered, 0.95),
+        "p99_ms": 1000 * percentile(ordered, 0.99),
+        "mean_ms": 1000 * sum(ordered) / turns if turns else 0.0,
+        "store_bytes_written": written,
+        "store_bytes_per_turn": written / turns if turns else 0.0,
+        "store_disk_bytes": disk_usage(workdir)
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["simple", "ai"], action="append",
+                        help="compagnon(s) à mesurer (les deux par défaut)")
+    parser.add_argument("--users", type=int, default=16, help="utilisateurs simultanés")
+    parser.add_argument("--turns", type=int, default=20, help="tours par utilisateur")
+    parser.add_argument("--provider", choices=["auto", "huggingface", "ollama"], default="ollama")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="compagnon IA via agenerate_response (une tâche asyncio par utilisateur)")
+    parser.add_argument("--backend", choices=["json", "sqlite", "segment"], default="json")
+    parser.add_argument("--flush-ms", type=float, default=0, help="écriture groupée en tâche de fond (0 = non)")
+    parser.add_argument("--median-ms", type=float, default=300, help="latence médiane du fournisseur simulé")
+    parser.add_argument("--sigma", type=float, default=0.5, help="dispersion log-normale de la latence")
+    parser.add_argument("--token-ms", type=float, default=20, help="intervalle entre tokens en streaming")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction de réponses 503 simulées")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="ajoute les résultats (une ligne JSON par passage) à ce fichier")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    process, port = start_fake_server(args)
+    results = []
+    try:
+        for target in args.target or ["simple", "ai"]:
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                results.append(run_target(target, args, port, workdir))
+                os.chdir(ROOT)
+    finally:
+        process.terminate()
+        process.wait()
+
+    commit = git_commit()
+    print(f"{'cible':8s} {'mode':8s} {'tours':>6s} {'err':>4s} {'tours/s':>8s} {'p50 ms':>8s} "
+          f"{'p95 ms':>8s} {'p99 ms':>8s} {'octets/tour':>11s} {'disque':>9s}")
+    for result in results:
+        print(f"{result['target']:8s} {result['mode']:8s} {result['turns']:6d} {result['errors']:4d} "
+              f"{result['turns_per_sec']:8.1f} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} "
+              f"{result['p99_ms']:8.1f} {result['store_bytes_per_turn']:11.0f} {result['store_disk_bytes']:9d}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps({"commit": commit, "timestamp": time.time(), **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# benchmarks/fake_llm.py - Fournisseur IA simulé : API Hugging Face et Ollama sur localhost
+"""Serveur HTTP local qui imite les deux fournisseurs, pour mesurer les
+compagnons sans token Hugging Face ni serveur Ollama.
+
+- `POST /models/<modèle>` : API d'inférence Hugging Face (`inputs` texte ou
+  liste, réponse JSON ou Server-Sent Events avec `"stream": true`) ;
+- `POST /api/generate` : Ollama (réponse JSON ou NDJSON en streaming, tokens
+  de `context` renvoyés ; une requête sans prompt est un maintien en mémoire).
+
+Le délai avant le premier token suit une loi log-normale (médiane et
+dispersion réglables). En streaming, les tokens suivants arrivent tous les
+`token_ms`, et une fraction `error_rate` des requêtes répond 503.
+
+    python benchmarks/fake_llm.py --port 11434 --median-ms 300 --error-rate 0.02
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLIES = [
+    "Je comprends ce que tu ressens, c'est tout à fait normal de passer par là.",
+    "Merci de me raconter ça, j'aime beaucoup en apprendre plus sur toi.",
+    "C'est une belle idée ! Qu'est-ce qui t'en a donné envie ?",
+    "Prends le temps qu'il te faut, je suis là pour t'écouter.",
+    "Ça a l'air passionnant, tu fais ça depuis longtemps ?",
+    "Je vois. Et comment te sens-tu par rapport à tout ça aujourd'hui ?",
+    "Quelle journée ! Tu as pu te reposer un peu ce soir ?",
+    "Bonne question. Je dirais qu'il vaut mieux y aller pas à pas."
+]
+
+
+class LatencyModel:
+    """Délai avant le premier token et tirage des erreurs simulées"""
+
+    def __init__(self, median_ms: float = 300, sigma: float = 0.5, token_ms: float = 20,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+        self.token_delay = token_ms / 1000
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> tuple:
+        """(délai en secondes, échec ?) d'une requête"""
+        with self._lock:
+            delay = self.median * math.exp(self.sigma * self._random.gauss(0, 1)) if self.sigma else self.median
+            return delay, self._random.random() < self.error_rate
+
+    def reply(self) -> str:
+        with self._lock:
+            return self._random.choice(REPLIES)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # connexions persistantes, comme les vrais fournisseurs
+    model: LatencyModel = None
+    counters: dict = None
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/generate" and "prompt" not in payload:
+            self._json(200, {"model": payload.get("model"), "done": True})  # maintien en mémoire
+            return
+        delay, failed = self.model.sample()
+        self._count("requests")
+        time.sleep(delay)
+        if failed:
+            self._count("errors")
+            self._json(503, {"error": "Service indisponible (erreur simulée)"})
+            return
+        if self.path == "/api/generate":
+            self._ollama(payload)
+        elif self.path.startswith("/models/"):
+            self._huggingface(payload)
+        else:
+            self._json(404, {"error": f"Route inconnue: {self.path}"})
+
+    def _huggingface(self, payload: dict):
+        inputs = payload.get("inputs", "")
+        if isinstance(inputs, list):
+            self._json(200, [[{"generated_text": self.model.reply()}] for _ in inputs])
+        elif payload.get("stream"):
+            self._stream("text/event-stream", (
+                "data:" + json.dumps({"token": {"text": word, "special": False}}) + "\n\n"
+                for word in self._words(self.model.reply())
+            ))
+        else:
+            self._json(200, [{"generated_text": self.model.reply()}])
+
+    def _ollama(self, payload: dict):
+        # Contexte : tokens précédents + un token par mot du prompt et de la réponse
+        reply = self.model.reply()
+        context = list(payload.get("context") or [])
+        context.extend(range(len(payload["prompt"].split()) + len(reply.split())))
+        if payload.get("stream"):
+            lines = [json.dumps({"response": word, "done": False}) + "\n" for word in self._words(reply)]
+            lines.append(json.dumps({"response": "", "done": True, "context": context}) + "\n")
+            self._stream("application/x-ndjson", iter(lines))
+        else:
+            self._json(200, {"response": reply, "done": True, "context": context})
+
+    @staticmethod
+    def _words(text: str) -> list:
+        words = text.split(" ")
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def _json(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content_type: str, chunks):
+        """Réponse en transfert par morceaux, un token tous les `token_ms`"""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(self.model.token_delay)
+            data = chunk.encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _count(self, name: str):
+        with self.server.counters_lock:
+            self.counters[name] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # rafales de connexions du générateur de charge
+
+
+def start_fake_llm(port: int = 0, host: str = "127.0.0.1", **latency) -> FakeLLMServer:
+    """Démarre le serveur dans un thread ; `server.server_address[1]` donne le port"""
+    handler = type("Handler", (FakeLLMHandler,), {
+        "model": LatencyModel(**latency),
+        "counters": {"requests": 0, "errors": 0}
+    })
+    server = FakeLLMServer((host, port), handler)
+    server.counters_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 = port libre (affiché au démarrage)")
+    parser.add_argument("--median-ms", type=float, default=300, help="délai médian avant le premier token")
+    parser.add_argument("--sigma", type=float, default=0.5, help="dispersion log-normale (0 = délai fixe)")
+    parser.add_argument("--token-ms", type=float, default=20, help="intervalle entre tokens en streaming")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction de requêtes en erreur 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_fake_llm(args.port, args.host, median_ms=args.median_ms, sigma=args.sigma,
+                            token_ms=args.token_ms, error_rate=args.error_rate, seed=args.seed)
+    # Première ligne lue par bench_turns.py
+    print(f"PORT {server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        counters = server.RequestHandlerClass.counters
+        print(f"{counters['requests']} requêtes, {counters['errors']} erreurs simulées", flush=True)
+
+
+if __name__ == "__main__":
+    main()
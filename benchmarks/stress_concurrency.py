@@ -0,0 +1,111 @@
+# benchmarks/stress_concurrency.py - Stress test : aucun tour perdu sous accès concurrents
+"""Lance de nombreux threads qui parlent à quelques utilisateurs partagés, puis
+relit la mémoire depuis le disque et vérifie que chaque `interaction_count`
+vaut exactement le nombre de tours envoyés.
+
+    python benchmarks/stress_concurrency.py --threads 32 --turns 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MESSAGES = [
+    "Bonjour !",
+    "Je m'appelle Marie",
+    "Je me sens un peu triste aujourd'hui",
+    "Merci de m'écouter",
+    "Je te fais confiance",
+    "J'habite à Lyon et j'aime la randonnée"
+]
+
+CONFIGS = {
+    "json": {"MEMORY_BACKEND": "json", "MEMORY_FLUSH_MS": "0"},
+    "json+flusher": {"MEMORY_BACKEND": "json", "MEMORY_FLUSH_MS": "20"},
+    "sqlite": {"MEMORY_BACKEND": "sqlite", "MEMORY_FLUSH_MS": "0"},
+    "sqlite+flusher": {"MEMORY_BACKEND": "sqlite", "MEMORY_FLUSH_MS": "20"},
+    "segment": {"MEMORY_BACKEND": "segment", "MEMORY_FLUSH_MS": "0"},
+    "segment+flusher": {"MEMORY_BACKEND": "segment", "MEMORY_FLUSH_MS": "20"}
+}
+
+
+def run_config(name: str, env: dict, threads: int, users: int, turns: int) -> bool:
+    """Exécute le stress test pour une configuration de store"""
+    os.environ.update(env)
+    from companion_engine import SimpleVoiceCompanion
+
+    companion = SimpleVoiceCompanion()
+    sent = Counter()
+    sent_lock = threading.Lock()
+    errors = []
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        local = Counter()
+        try:
+            for _ in range(turns):
+                user_id = f"user_{rng.randrange(users)}"
+                companion.generate_response(rng.choice(MESSAGES), user_id)
+                local[user_id] += 1
+        except Exception as e:
+            errors.append(repr(e))
+        with sent_lock:
+            sent.update(local)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    companion.close()
+
+    # Relecture depuis le disque
+    reloaded = SimpleVoiceCompanion()
+    lost = {}
+    for i in range(users):
+        user_id = f"user_{i}"
+        memory = reloaded.get_user_memory(user_id)
+        if memory.interaction_count != sent[user_id]:
+            lost[user_id] = (sent[user_id], memory.interaction_count)
+    reloaded.close()
+
+    total = sum(sent.values())
+    ok = not lost and not errors
+    print(f"{name:16s} {'OK   ' if ok else 'ÉCHEC'} {total} tours en {elapsed:.2f}s "
+          f"({total / elapsed:.0f} tours/s)")
+    for user_id, (expected, actual) in lost.items():
+        print(f"    {user_id}: attendu {expected}, relu {actual}")
+    for error in errors[:5]:
+        print(f"    erreur: {error}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=200, help="tours par thread")
+    parser.add_argument("--config", choices=sorted(CONFIGS), action="append",
+                        help="configuration(s) de store à tester (toutes par défaut)")
+    args = parser.parse_args()
+
+    ok = True
+    for name in args.config or CONFIGS:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            ok &= run_config(name, CONFIGS[name], args.threads, args.users, args.turns)
+            os.chdir(ROOT)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# chat_session.py - Historique de chat gardé côté serveur, par session d'interface
+from collections import deque
+
+
+class ChatSession:
+    """Échanges affichés dans le chat d'une session de navigateur.
+
+    L'objet vit dans un `gr.State`, donc côté serveur : le navigateur n'envoie
+    plus l'historique à chaque message, seulement le message. L'affichage est
+    borné aux `window` derniers échanges (la file ne recopie rien en ajoutant),
+    l'historique complet restant dans la mémoire du compagnon. En streaming,
+    Gradio n'envoie entre deux rendus que la différence, c'est-à-dire les
+    nouveaux morceaux de la réponse.
+    """
+
+    __slots__ = ("exchanges", "messages_format")
+
+    def __init__(self, window: int = 20, messages_format: bool = False):
+        self.exchanges = deque(maxlen=window)  # [message, réponse]
+        self.messages_format = messages_format  # gr.Chatbot(type="messages")
+
+    def add(self, message: str, response: str = ""):
+        self.exchanges.append([message, response])
+
+    def update(self, response: str):
+        """Réponse (partielle) du dernier échange"""
+        self.exchanges[-1][1] = response
+
+    def clear(self):
+        self.exchanges.clear()
+
+    def render(self) -> list:
+        """Valeur du composant Chatbot"""
+        if self.messages_format:
+            messages = []
+            for message, response in self.exchanges:
+                messages.append({"role": "user", "content": message})
+                messages.append({"role": "assistant", "content": response})
+            return messages
+        return [(message, response) for message, response in self.exchanges]
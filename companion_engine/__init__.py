@@ -0,0 +1,56 @@
+# companion_engine/__init__.py - Cœur des compagnons, sans interface (import rapide, construction paresseuse)
+"""Compagnons utilisables sans Gradio : workers, jobs batch, serveur HTTP.
+
+L'import du paquet ne charge ni Gradio ni les modules des compagnons, et
+n'ouvre aucun fichier. `SimpleVoiceCompanion` et `AIVoiceCompanion` ne sont
+importés qu'au premier accès. Le compagnon lui-même (mémoire, fournisseurs)
+n'est construit qu'au premier `get_companion`, une fois par processus ; le
+préchauffage des modèles n'est lancé que par les points d'entrée serveur
+(`start_warmup`).
+
+    from companion_engine import get_companion
+    response, intimacy_level = get_companion("simple").generate_response("Bonjour", "user_1")
+
+Interfaces : `app.py` et `app_with_ai.py` (Gradio), `python -m companion_engine.server` (HTTP/JSON).
+"""
+import importlib
+import threading
+
+# Moteur -> (module, classe)
+ENGINES = {
+    "simple": ("companion_engine.simple", "SimpleVoiceCompanion"),
+    "ai": ("companion_engine.ai", "AIVoiceCompanion")
+}
+
+_companions = {}
+_lock = threading.Lock()
+
+
+def companion_class(engine: str) -> type:
+    """Classe du compagnon `engine` ("simple" ou "ai"), importée à la demande"""
+    try:
+        module, name = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Moteur inconnu: {engine}") from None
+    return getattr(importlib.import_module(module), name)
+
+
+def get_companion(engine: str = "simple"):
+    """Compagnon partagé du processus, construit au premier appel"""
+    companion = _companions.get(engine)
+    if companion is None:
+        with _lock:
+            companion = _companions.get(engine)
+            if companion is None:
+                companion = _companions[engine] = companion_class(engine)()
+    return companion
+
+
+def __getattr__(name: str):
+    for engine, (_, class_name) in ENGINES.items():
+        if name == class_name:
+            return companion_class(engine)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["ENGINES", "AIVoiceCompanion", "SimpleVoiceCompanion", "companion_class", "get_companion"]
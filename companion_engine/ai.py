@@ -0,0 +1,902 @@
+# companion_engine/ai.py - Compagnon avec vraie IA : fournisseurs, prompts contextuels et adaptation du style
+import asyncio
+import os
+import time
+from functools import partial
+from ai_providers import HuggingFaceProvider, OllamaProvider, ProviderError
+from intent_router import IntentRouter
+from long_term_memory import LongTermMemory
+from metrics import SIZE_BUCKETS, Metrics, dump_metrics, serve_metrics
+from provider_dispatcher import ProviderDispatcher
+from request_batcher import RequestBatcher
+from history_archive import HistoryArchive
+from memory_store import create_memory_store, new_user_memory
+from model_warmup import ModelWarmup
+from ollama_context import OllamaContexts, OllamaSession
+from response_cache import ResponseCache, intimacy_band, normalize_for_key
+from response_templates import template_response
+from text_analysis import detect_intent, intimacy_boost, personal_markers, scan_message
+from turn_deadline import DeadlineExceeded, DeadlinePolicy
+from user_locks import UserLocks
+from user_memory import UserMemory
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+class AIVoiceCompanion:
+    def __init__(self):
+        # Mémoire utilisateur (fichier JSON journalisé ou SQLite)
+        self.memory_file = "user_memory.json"
+        self.memory_backend = os.getenv("MEMORY_BACKEND", "json")
+        self.memory_cache_size = int(os.getenv("MEMORY_CACHE_SIZE", "10000"))
+        self.memory_cache_ttl = float(os.getenv("MEMORY_CACHE_TTL", "1800"))
+        # Écriture en tâche de fond par lots (0 = écriture synchrone à chaque tour)
+        self.memory_flush_ms = float(os.getenv("MEMORY_FLUSH_MS", "0"))
+        self.memory_flush_max_turns = int(os.getenv("MEMORY_FLUSH_MAX_TURNS", "100"))
+        # Mesures par étape du tour ; export Prometheus (port, 0 = aucun) et/ou fichier JSON périodique
+        self.metrics = Metrics(enabled=os.getenv("METRICS", "1") == "1")
+        self.metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        self.metrics_dump_file = os.getenv("METRICS_DUMP_FILE", "")
+        self.metrics_dump_interval = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+        # Archive compressée (gzip, zlib ou lzma) des échanges sortis de l'historique du profil
+        self.history_archive_dir = os.getenv("HISTORY_ARCHIVE_DIR", "history_archive")
+        self.history_archive_codec = os.getenv("HISTORY_ARCHIVE_CODEC", "gzip")
+        self.history_archive_enabled = os.getenv("HISTORY_ARCHIVE", "1") == "1"
+        self.load_memory()
+        
+        # Tours d'un même utilisateur sérialisés, utilisateurs différents en parallèle
+        self.user_locks = UserLocks()
+        
+        # Configuration IA - à modifier selon vos besoins
+        self.ai_config = {
+            "provider": "auto",  # "auto" (fournisseurs de "providers" dans l'ordre), "huggingface" ou "ollama"
+            "providers": [
+                name.strip() for name in os.getenv("AI_PROVIDERS", "huggingface,ollama").split(",") if name.strip()
+            ],
+            # Requête doublée vers le fournisseur suivant après le p95 du premier
+            # (hedge_after secondes tant qu'il manque des mesures)
+            "hedge": os.getenv("AI_HEDGE", "1") == "1",
+            "hedge_after": float(os.getenv("AI_HEDGE_AFTER", "2.0")),
+            # Disjoncteur : échecs consécutifs avant d'ignorer un fournisseur, et pendant combien de secondes
+            "breaker_failures": int(os.getenv("AI_BREAKER_FAILURES", "5")),
+            "breaker_reset": float(os.getenv("AI_BREAKER_RESET", "30")),
+            "model": "microsoft/DialoGPT-medium",
+            "api_token": os.getenv("HF_TOKEN"),  # Token Hugging Face
+            "base_url": os.getenv("HF_BASE_URL", "https://api-inference.huggingface.co/models/"),
+            "ollama_url": os.getenv("OLLAMA_URL", "http://localhost:11434"),
+            "ollama_model": "llama2",  # ou autre modèle installé
+            # Reprise du contexte Ollama d'un tour à l'autre, et durée de maintien du modèle en mémoire
+            "ollama_context": os.getenv("AI_OLLAMA_CONTEXT", "1") == "1",
+            "ollama_context_max_tokens": int(os.getenv("AI_OLLAMA_CONTEXT_MAX_TOKENS", "4096")),
+            "ollama_keep_alive": os.getenv("AI_OLLAMA_KEEP_ALIVE", "30m"),
+            # Connexions HTTP persistantes : taille du pool et délais séparés
+            "pool_size": int(os.getenv("AI_POOL_SIZE", "10")),
+            "connect_timeout": 3.05,
+            "read_timeout": 30,
+            # Affichage de la réponse au fil des tokens
+            "stream": os.getenv("AI_STREAM", "1") == "1",
+            # Tours traités en asynchrone (client httpx) : une conversation en attente
+            # du modèle n'occupe pas de thread ; connexions simultanées par fournisseur
+            "async": os.getenv("AI_ASYNC", "1") == "1",
+            "async_pool_size": int(os.getenv("AI_ASYNC_POOL_SIZE", "100")),
+            # Cache des réponses (opt-in) : taille max et durée de vie en secondes
+            "response_cache": os.getenv("AI_RESPONSE_CACHE", "0") == "1",
+            "response_cache_size": int(os.getenv("AI_RESPONSE_CACHE_SIZE", "1000")),
+            "response_cache_ttl": float(os.getenv("AI_RESPONSE_CACHE_TTL", "600")),
+            # Chemin rapide : intentions servies par les réponses prédéfinies (vide = désactivé)
+            "fast_path_intents": [
+                intent.strip() for intent in os.getenv("AI_FAST_PATH_INTENTS", "greeting,thanks").split(",")
+                if intent.strip()
+            ],
+            "fast_path_min_confidence": float(os.getenv("AI_FAST_PATH_MIN_CONFIDENCE", "0.6")),
+            # Regroupement des prompts simultanés (1 = désactivé) et attente max en ms
+            "batch_max_size": int(os.getenv("AI_BATCH_MAX_SIZE", "1")),
+            "batch_max_wait_ms": float(os.getenv("AI_BATCH_MAX_WAIT_MS", "5")),
+            # Budget par tour en secondes (0 = sans limite) ; en deçà de min_model_budget
+            # restantes, le modèle n'est pas appelé et la réponse prédéfinie est servie
+            "turn_deadline": float(os.getenv("AI_TURN_DEADLINE", "8")),
+            "min_model_budget": float(os.getenv("AI_MIN_MODEL_BUDGET", "0.5")),
+            # Préchauffage des modèles au démarrage, puis maintien en mémoire (secondes, 0 = sans maintien)
+            "warmup": os.getenv("AI_WARMUP", "1") == "1",
+            "warmup_timeout": float(os.getenv("AI_WARMUP_TIMEOUT", "120")),
+            "keep_alive_interval": float(os.getenv("AI_KEEP_ALIVE_INTERVAL", "240")),
+            # Mémoire à long terme : échanges passés les plus pertinents ajoutés au prompt
+            # (nombre max et budget en caractères)
+            "long_term_memory": os.getenv("AI_LONG_TERM_MEMORY", "1") == "1",
+            "long_term_top_k": int(os.getenv("AI_LONG_TERM_TOP_K", "3")),
+            "long_term_budget": int(os.getenv("AI_LONG_TERM_BUDGET", "600"))
+        }
+        self.providers = self.create_providers()
+        for name in self.ai_config["providers"]:
+            if name not in self.providers:
+                raise ValueError(f"Fournisseur IA inconnu dans AI_PROVIDERS: {name} "
+                                 f"(disponibles: {', '.join(self.providers)})")
+        self.batchers = self.create_batchers()
+        self.ollama_contexts = OllamaContexts(max_tokens=self.ai_config["ollama_context_max_tokens"])
+        self.warmup = ModelWarmup(
+            {name: self.providers[name] for name in self.ai_config["providers"]},
+            keep_alive_interval=self.ai_config["keep_alive_interval"],
+            timeout=self.ai_config["warmup_timeout"]
+        )
+        self.dispatcher = ProviderDispatcher(
+            {name: self.provider_client(name) for name in self.ai_config["providers"]},
+            hedge=self.ai_config["hedge"],
+            hedge_after=self.ai_config["hedge_after"],
+            failure_threshold=self.ai_config["breaker_failures"],
+            reset_timeout=self.ai_config["breaker_reset"],
+            max_workers=2 * self.ai_config["pool_size"]
+        )
+        self.response_cache = ResponseCache(
+            self.ai_config["response_cache_size"],
+            self.ai_config["response_cache_ttl"]
+        )
+        self.deadline_policy = DeadlinePolicy(
+            self.ai_config["turn_deadline"],
+            self.ai_config["min_model_budget"],
+            max_workers=2 * self.ai_config["pool_size"]
+        )
+        self.router = IntentRouter(
+            self.ai_config["fast_path_intents"],
+            self.ai_config["fast_path_min_confidence"]
+        )
+        # Index construit depuis l'archive de l'historique (sans archive, pas de mémoire à long terme)
+        self.long_term = LongTermMemory(self.history_archive) \
+            if self.ai_config["long_term_memory"] and self.history_archive is not None else None
+        self.register_metrics()
+    
+    def start_warmup(self):
+        """Lance le préchauffage puis le maintien des modèles (AI_WARMUP), depuis les points d'entrée serveur.
+        
+        La construction seule n'envoie aucune requête : un job batch ou un
+        benchmark n'appelle pas les fournisseurs tant qu'il ne sert pas de tour.
+        """
+        if self.ai_config["warmup"]:
+            self.warmup.start()
+    
+    def create_providers(self) -> dict:
+        """Clients HTTP poolés des fournisseurs IA, réutilisés à chaque tour"""
+        http_options = {
+            "pool_size": self.ai_config["pool_size"],
+            "async_pool_size": self.ai_config["async_pool_size"],
+            "connect_timeout": self.ai_config["connect_timeout"],
+            "read_timeout": self.ai_config["read_timeout"]
+        }
+        return {
+            "huggingface": HuggingFaceProvider(
+                self.ai_config["model"],
+                self.ai_config["api_token"],
+                base_url=self.ai_config["base_url"],
+                **http_options
+            ),
+            "ollama": OllamaProvider(
+                self.ai_config["ollama_model"],
+                base_url=self.ai_config["ollama_url"],
+                keep_alive=self.ai_config["ollama_keep_alive"],
+                **http_options
+            )
+        }
+    
+    def create_batchers(self) -> dict:
+        """Regroupement des requêtes pour les fournisseurs qui acceptent des lots"""
+        if self.ai_config["batch_max_size"] <= 1:
+            return {}
+        return {
+            name: RequestBatcher(
+                provider,
+                self.ai_config["batch_max_size"],
+                self.ai_config["batch_max_wait_ms"],
+                max_in_flight=self.ai_config["pool_size"]
+            )
+            for name, provider in self.providers.items() if provider.supports_batch
+        }
+    
+    def provider_client(self, name: str):
+        """Client d'un fournisseur : via le regroupement s'il est actif"""
+        return self.batchers.get(name) or self.providers[name]
+    
+    def provider_stats(self) -> list:
+        """Statistiques des pools de connexions par fournisseur"""
+        return [provider.stats() for provider in self.providers.values()]
+    
+    def batch_stats(self) -> list:
+        """Taille des lots et attente avant envoi par fournisseur"""
+        return [batcher.stats() for batcher in self.batchers.values()]
+    
+    def register_metrics(self):
+        """Statistiques des composants reprises à chaque export des métriques"""
+        self.metrics.collect("provider", self.provider_stats)
+        self.metrics.collect("batch", self.batch_stats)
+        self.metrics.collect("dispatcher", self.dispatcher.stats)
+        self.metrics.collect("deadline", self.deadline_policy.stats)
+        self.metrics.collect("router", self.router.stats)
+        self.metrics.collect("response_cache", self.response_cache.stats)
+        self.metrics.collect("ollama_context", self.ollama_contexts.stats)
+        self.metrics.collect("warmup", self.warmup.stats)
+        if self.long_term is not None:
+            self.metrics.collect("long_term_memory", self.long_term.stats)
+        if hasattr(self.store, "stats"):
+            self.metrics.collect("store", self.store.stats)
+        if self.history_archive is not None:
+            self.metrics.collect("history_archive", self.history_archive.stats)
+    
+    def export_metrics(self):
+        """Démarre l'export des métriques configuré (endpoint Prometheus, fichier JSON)"""
+        if self.metrics_port:
+            serve_metrics(self.metrics, self.metrics_port)
+        if self.metrics_dump_file:
+            dump_metrics(self.metrics, self.metrics_dump_file, self.metrics_dump_interval)
+    
+    def close(self):
+        """Arrête le préchauffage, les lots et les index en construction, puis écrit ce qui est en attente (mémoire, archive)"""
+        self.warmup.stop()
+        for batcher in self.batchers.values():
+            batcher.close()
+        if self.long_term is not None:
+            self.long_term.close()
+        self.store.close()
+        if self.history_archive is not None:
+            self.history_archive.close()
+    
+    def observe_turn(self, decision, started: float, prompt: Optional[str], ai_response: str,
+                     final_response: str):
+        """Mesures de fin de tour : durée, chemin, tailles et réponses en erreur"""
+        metrics = self.metrics
+        if not metrics.enabled:
+            return
+        metrics.observe_stage("turn", time.perf_counter() - started)
+        metrics.inc("turns_total", route=decision.route)
+        if prompt is not None:
+            metrics.observe("prompt_chars", len(prompt), SIZE_BUCKETS)
+        metrics.observe("response_chars", len(final_response), SIZE_BUCKETS)
+        if ai_response.startswith("⚠️"):
+            metrics.inc("model_errors_total")
+    
+    def load_memory(self):
+        """Ouvre le backend de mémoire (les profils sont lus à la demande)"""
+        self.store = create_memory_store(
+            self.memory_backend,
+            self.memory_file,
+            cache_size=self.memory_cache_size,
+            cache_ttl=self.memory_cache_ttl,
+            flush_interval_ms=self.memory_flush_ms,
+            flush_max_turns=self.memory_flush_max_turns,
+            metrics=self.metrics if self.metrics.enabled else None
+        )
+        self.history_archive = HistoryArchive(self.history_archive_dir, self.history_archive_codec) \
+            if self.history_archive_enabled else None
+    
+    def save_memory(self, user_id, memory, personal_info=None, history_entry=None):
+        """Sauvegarde le profil d'un utilisateur après un tour"""
+        self.store.save(user_id, memory, personal_info, history_entry)
+    
+    def get_user_memory(self, user_id):
+        """Récupère mémoire utilisateur"""
+        memory = self.store.get(user_id)
+        if memory is None:
+            memory = new_user_memory()
+        return memory
+    
+    def reset_memory(self, user_id):
+        """Efface la mémoire d'un utilisateur"""
+        with self.user_locks.hold(user_id):
+            self.store.delete(user_id)
+            if self.history_archive is not None:
+                self.history_archive.forget(user_id)
+            self.ollama_contexts.discard(user_id)
+            if self.long_term is not None:
+                self.long_term.forget(user_id)
+    
+    def extract_personal_markers(self, text, scan=None):
+        """Extraction simple d'éléments personnels"""
+        return personal_markers(scan or scan_message(text))
+    
+    def calculate_intimacy_boost(self, text, scan=None):
+        """Calcule augmentation intimité selon contenu (max 0.5 points par interaction)"""
+        return intimacy_boost(scan or scan_message(text))
+    
+    def create_system_prompt(self, memory: UserMemory) -> str:
+        """Prompt système : consignes selon le niveau d'intimité et informations personnelles"""
+        intimacy = memory.intimacy_level
+        personal_info = memory.personal_info
+        
+        # Base du prompt système
+        system_prompt = "Tu es un assistant conversationnel empathique et adaptatif. "
+        
+        # Adaptation selon niveau d'intimité
+        if intimacy <= 1.5:
+            system_prompt += "Utilise le vouvoiement et reste professionnel mais chaleureux. "
+        elif intimacy <= 2.5:
+            system_prompt += "Sois amical et utilise le tutoiement avec respect. "
+        elif intimacy <= 3.5:
+            system_prompt += "Sois familier et chaleureux. "
+            if "nom" in personal_info:
+                name = personal_info["nom"].split()[-1]
+                system_prompt += f"L'utilisateur s'appelle {name}. "
+        elif intimacy <= 4.5:
+            system_prompt += "Sois proche et empathique. Montre de la compréhension émotionnelle. "
+        else:
+            system_prompt += "Sois très proche et complice. Cette personne te fait confiance. "
+        
+        # Ajout contexte personnel
+        if personal_info:
+            system_prompt += f"Informations personnelles connues: {personal_info}. "
+        
+        return system_prompt
+    
+    def create_turn_prompt(self, user_input: str) -> str:
+        """Consigne du tour : le message auquel répondre"""
+        return f"Réponds naturellement à: {user_input}"
+    
+    def create_generic_prompt(self, user_input: str, memory: UserMemory) -> str:
+        """Prompt sans contexte de conversation : consignes et message seuls"""
+        return f"{self.create_system_prompt(memory)}\n\n{self.create_turn_prompt(user_input)}"
+    
+    def create_context_prompt(self, user_input: str, memory: UserMemory, user_id: Optional[str] = None) -> str:
+        """Crée le prompt contextuel pour l'IA"""
+        system_prompt = self.create_system_prompt(memory)
+        
+        recent = memory.conversation_history.recent(2)  # 2 derniers échanges
+        
+        # Souvenirs : échanges proches du message, hors historique récent, dans le budget du prompt
+        if user_id is not None and self.long_term is not None:
+            budget = self.ai_config["long_term_budget"]
+            context = ""
+            for conv in self.long_term.recall(user_id, user_input, self.ai_config["long_term_top_k"],
+                                              exclude=recent, history=memory.conversation_history):
+                line = f"User: {conv.user} | Assistant: {conv.assistant} | "
+                if len(context) + len(line) <= budget:
+                    context += line
+            if context:
+                system_prompt += f"Souvenirs pertinents: {context}"
+        
+        # Historique récent
+        if recent:
+            context = "Contexte récent: "
+            for conv in recent:
+                context += f"User: {conv.user} | Assistant: {conv.assistant} | "
+            system_prompt += context
+        
+        return f"{system_prompt}\n\n{self.create_turn_prompt(user_input)}"
+    
+    def query_huggingface_api(self, prompt: str) -> Optional[str]:
+        """Interroge l'API Hugging Face"""
+        try:
+            return self.provider_client("huggingface").generate(prompt)
+        except ProviderError as e:
+            return f"⚠️ {e}"
+    
+    def query_ollama_local(self, prompt: str, session: Optional[OllamaSession] = None) -> Optional[str]:
+        """Interroge Ollama en local (en reprenant le contexte de l'utilisateur s'il y en a un)"""
+        try:
+            if session is None:
+                return self.provider_client("ollama").generate(prompt)
+            return self.providers["ollama"].generate(
+                session.prompt(prompt), context=session.context, on_context=session.on_context
+            )
+        except ProviderError as e:
+            return f"⚠️ {e}"
+    
+    def ollama_session(self, user_id: str, memory: UserMemory, user_input: str,
+                       provider: Optional[str] = None) -> Optional[OllamaSession]:
+        """Contexte Ollama du tour (verrou utilisateur requis).
+        
+        Le contexte est retiré à chaque tour : seul un tour servi par Ollama le
+        remet, tout autre tour (réponse prédéfinie, cache, autre fournisseur)
+        l'invalide.
+        """
+        if not self.ai_config["ollama_context"]:
+            return None
+        if (provider or self.ai_config["provider"]) != "ollama":
+            self.ollama_contexts.discard(user_id)
+            return None
+        return self.ollama_contexts.session(
+            user_id, self.create_system_prompt(memory), self.create_turn_prompt(user_input)
+        )
+    
+    def generate_ai_response(self, prompt: str, provider: Optional[str] = None,
+                             session: Optional[OllamaSession] = None) -> str:
+        """Génère réponse via IA selon configuration (ou le fournisseur choisi pour ce tour)"""
+        provider = provider or self.ai_config["provider"]
+        if provider == "auto":
+            try:
+                return self.dispatcher.generate(prompt)
+            except ProviderError as e:
+                return f"⚠️ {e}"
+        elif provider == "huggingface":
+            return self.query_huggingface_api(prompt)
+        elif provider == "ollama":
+            return self.query_ollama_local(prompt, session)
+        else:
+            return "⚠️ Fournisseur IA non configuré"
+    
+    def response_cache_key(self, user_input: str, memory: UserMemory, scan, context_prompt: str,
+                           provider: Optional[str] = None) -> Optional[tuple]:
+        """Clé du cache de réponses, None si le cache est désactivé.
+        
+        Sans informations personnelles ni contexte ajouté au prompt (historique
+        récent, souvenirs), la réponse ne dépend que du palier d'intimité, de
+        l'intention et du message normalisé ; sinon le prompt complet sert de clé,
+        pour qu'une réponse conditionnée par l'historique d'un utilisateur ne
+        soit jamais servie à un autre.
+        """
+        if not self.ai_config["response_cache"]:
+            return None
+        provider = provider or self.ai_config["provider"]
+        if not memory.personal_info and context_prompt == self.create_generic_prompt(user_input, memory):
+            return (provider, intimacy_band(memory.intimacy_level), detect_intent(scan),
+                    normalize_for_key(user_input))
+        return (provider, normalize_for_key(context_prompt))
+    
+    def cached_ai_response(self, prompt: str, cache_key: Optional[tuple], provider: Optional[str] = None,
+                           session: Optional[OllamaSession] = None) -> str:
+        """generate_ai_response précédé du cache de réponses"""
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        ai_response = self.generate_ai_response(prompt, provider, session)
+        if cache_key is not None and ai_response and not ai_response.startswith("⚠️"):
+            self.response_cache.put(cache_key, ai_response)
+        return ai_response
+    
+    def cached_ai_stream(self, prompt: str, cache_key: Optional[tuple], provider: Optional[str] = None,
+                         session: Optional[OllamaSession] = None) -> Iterator[str]:
+        """stream_ai_response précédé du cache (une réponse en cache arrive d'un bloc)"""
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        for chunk in self.stream_ai_response(prompt, provider, session):
+            chunks.append(chunk)
+            yield chunk
+        ai_response = "".join(chunks).strip()
+        if cache_key is not None and ai_response and not ai_response.startswith("⚠️"):
+            self.response_cache.put(cache_key, ai_response)
+    
+    def stream_ai_response(self, prompt: str, provider: Optional[str] = None,
+                           session: Optional[OllamaSession] = None) -> Iterator[str]:
+        """Version streaming de generate_ai_response : morceaux de texte au fil de l'eau"""
+        provider = provider or self.ai_config["provider"]
+        if provider == "ollama" and session is not None:
+            try:
+                yield from self.providers["ollama"].stream(
+                    session.prompt(prompt), context=session.context, on_context=session.on_context
+                )
+            except ProviderError as e:
+                yield f"⚠️ {e}"
+            return
+        if provider == "auto":
+            client = self.dispatcher
+        elif provider in self.providers:
+            client = self.providers[provider]
+        else:
+            yield "⚠️ Fournisseur IA non configuré"
+            return
+        try:
+            yield from client.stream(prompt)
+        except ProviderError as e:
+            yield f"⚠️ {e}"
+    
+    async def agenerate_ai_response(self, prompt: str, provider: Optional[str] = None,
+                                    session: Optional[OllamaSession] = None) -> str:
+        """Version asynchrone de generate_ai_response"""
+        provider = provider or self.ai_config["provider"]
+        try:
+            if provider == "auto":
+                return await self.dispatcher.agenerate(prompt)
+            if provider == "ollama" and session is not None:
+                return await self.providers["ollama"].agenerate(
+                    session.prompt(prompt), context=session.context, on_context=session.on_context
+                )
+            if provider in self.providers:
+                return await self.provider_client(provider).agenerate(prompt)
+        except ProviderError as e:
+            return f"⚠️ {e}"
+        return "⚠️ Fournisseur IA non configuré"
+    
+    async def acached_ai_response(self, prompt: str, cache_key: Optional[tuple], provider: Optional[str] = None,
+                                  session: Optional[OllamaSession] = None) -> str:
+        """Version asynchrone de cached_ai_response"""
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        ai_response = await self.agenerate_ai_response(prompt, provider, session)
+        if cache_key is not None and ai_response and not ai_response.startswith("⚠️"):
+            self.response_cache.put(cache_key, ai_response)
+        return ai_response
+    
+    async def astream_ai_response(self, prompt: str, provider: Optional[str] = None,
+                                  session: Optional[OllamaSession] = None) -> AsyncIterator[str]:
+        """Version asynchrone de stream_ai_response"""
+        provider = provider or self.ai_config["provider"]
+        if provider == "auto":
+            chunks = self.dispatcher.astream(prompt)
+        elif provider == "ollama" and session is not None:
+            chunks = self.providers["ollama"].astream(
+                session.prompt(prompt), context=session.context, on_context=session.on_context
+            )
+        elif provider in self.providers:
+            chunks = self.providers[provider].astream(prompt)
+        else:
+            yield "⚠️ Fournisseur IA non configuré"
+            return
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except ProviderError as e:
+            yield f"⚠️ {e}"
+    
+    async def acached_ai_stream(self, prompt: str, cache_key: Optional[tuple], provider: Optional[str] = None,
+                                session: Optional[OllamaSession] = None) -> AsyncIterator[str]:
+        """Version asynchrone de cached_ai_stream"""
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        async for chunk in self.astream_ai_response(prompt, provider, session):
+            chunks.append(chunk)
+            yield chunk
+        ai_response = "".join(chunks).strip()
+        if cache_key is not None and ai_response and not ai_response.startswith("⚠️"):
+            self.response_cache.put(cache_key, ai_response)
+    
+    def style_affixes(self, ai_response: str, intimacy_level: float, personal_info: dict) -> tuple:
+        """Préfixe et suffixe ajoutés à la réponse selon niveau intimité"""
+        if intimacy_level <= 2.5:
+            # Formel ou amical - pas d'ajout
+            return "", ""
+        
+        elif intimacy_level <= 3.5:
+            # Familier et chaleureux
+            prefix = ""
+            if "nom" in personal_info:
+                name = personal_info["nom"].split()[-1]
+                if name.lower() not in ai_response.lower():
+                    prefix = f"{name}, "
+            return prefix, " 😊"
+        
+        elif intimacy_level <= 4.5:
+            # Proche et empathique
+            return "", " ❤️"
+        
+        else:
+            # Très intime et complice
+            return "", " 💙"
+    
+    def apply_register(self, text: str, intimacy_level: float) -> str:
+        """Assure le vouvoiement au niveau formel"""
+        if intimacy_level <= 1.5:
+            text = text.replace(" tu ", " vous ")
+            text = text.replace("Tu ", "Vous ")
+        return text
+    
+    def adapt_response_style(self, ai_response: str, intimacy_level: float, personal_info: dict) -> str:
+        """Adapte le style de la réponse IA selon niveau intimité"""
+        if not ai_response or ai_response.startswith("⚠️"):
+            return ai_response
+        
+        prefix, suffix = self.style_affixes(ai_response, intimacy_level, personal_info)
+        return f"{prefix}{self.apply_register(ai_response, intimacy_level)}{suffix}"
+    
+    def adapt_response_stream(self, chunks: Iterable[str], intimacy_level: float,
+                              personal_info: dict) -> Iterator[tuple]:
+        """Adapte le style d'une réponse en cours de génération.
+        
+        Le préfixe est fixé dès le premier morceau, le vouvoiement est appliqué
+        au texte reçu jusque-là, le suffixe (emoji) n'est ajouté qu'à la fin.
+        Produit des couples (texte brut, texte stylé) ; le dernier est complet.
+        """
+        raw = ""
+        prefix = suffix = None
+        for chunk in chunks:
+            raw += chunk
+            if raw.startswith("⚠️"):
+                continue
+            if prefix is None:
+                prefix, suffix = self.style_affixes(raw, intimacy_level, personal_info)
+            yield raw, prefix + self.apply_register(raw, intimacy_level)
+        
+        raw = raw.rstrip()
+        if not raw or raw.startswith("⚠️"):
+            yield raw, raw
+        else:
+            yield raw, prefix + self.apply_register(raw, intimacy_level) + suffix
+    
+    async def aadapt_response_stream(self, chunks: AsyncIterator[str], intimacy_level: float,
+                                     personal_info: dict) -> AsyncIterator[tuple]:
+        """Version asynchrone de adapt_response_stream"""
+        raw = ""
+        prefix = suffix = None
+        async for chunk in chunks:
+            raw += chunk
+            if raw.startswith("⚠️"):
+                continue
+            if prefix is None:
+                prefix, suffix = self.style_affixes(raw, intimacy_level, personal_info)
+            yield raw, prefix + self.apply_register(raw, intimacy_level)
+        
+        raw = raw.rstrip()
+        if not raw or raw.startswith("⚠️"):
+            yield raw, raw
+        else:
+            yield raw, prefix + self.apply_register(raw, intimacy_level) + suffix
+    
+    def generate_response(self, user_input: str, user_id: str, provider: Optional[str] = None):
+        """Génère réponse adaptée avec IA"""
+        deadline = self.deadline_policy.start()
+        with self.user_locks.hold(user_id):
+            start = time.perf_counter()
+            self.metrics.observe_stage("lock_wait", deadline.elapsed())
+            memory, personal_info, scan = self.prepare_turn(user_input, user_id)
+            with self.metrics.time("route"):
+                decision = self.router.route(scan)
+            session = self.ollama_session(user_id, memory, user_input, provider)
+            
+            context_prompt = None
+            if decision.fast or not self.deadline_policy.allows_model(deadline):
+                # Intention simple, ou tour déjà hors délai (attente du verrou, lecture du profil) :
+                # réponse prédéfinie, sans prompt (ni souvenirs) ni appel au modèle
+                ai_response = template_response(decision.intent, memory.intimacy_level)
+            else:
+                # Génération prompt contextuel
+                with self.metrics.time("context_prompt"):
+                    context_prompt = self.create_context_prompt(user_input, memory, user_id)
+                
+                # Génération réponse IA (ou réponse en cache pour un message courant),
+                # dans le temps restant du tour
+                cache_key = self.response_cache_key(user_input, memory, scan, context_prompt, provider)
+                try:
+                    with self.metrics.time("model"):
+                        ai_response = self.deadline_policy.call(
+                            deadline, self.cached_ai_response, context_prompt, cache_key, provider, session
+                        )
+                except DeadlineExceeded:
+                    # Hors délai : réponse prédéfinie plutôt qu'une attente ou une erreur
+                    ai_response = template_response(decision.intent, memory.intimacy_level)
+            if session is not None:
+                session.close()
+            
+            # Adaptation style selon intimité
+            with self.metrics.time("style"):
+                final_response = self.adapt_response_style(
+                    ai_response, 
+                    memory.intimacy_level, 
+                    memory.personal_info
+                )
+            
+            self.commit_turn(user_id, memory, personal_info, user_input, final_response, ai_response)
+            self.router.record_latency(decision, time.perf_counter() - start)
+            self.observe_turn(decision, start, context_prompt, ai_response, final_response)
+        self.deadline_policy.record_turn(deadline)
+        return final_response, memory.intimacy_level
+    
+    def generate_response_stream(self, user_input: str, user_id: str,
+                                 provider: Optional[str] = None) -> Iterator[tuple]:
+        """Version streaming de generate_response : (réponse partielle, intimité) au fil des tokens.
+        
+        La mémoire n'est écrite qu'une fois la génération terminée ; un flux
+        abandonné en cours de route ne laisse aucune trace.
+        """
+        deadline = self.deadline_policy.start()
+        with self.user_locks.hold(user_id):
+            start = time.perf_counter()
+            self.metrics.observe_stage("lock_wait", deadline.elapsed())
+            memory, personal_info, scan = self.prepare_turn(user_input, user_id)
+            with self.metrics.time("route"):
+                decision = self.router.route(scan)
+            session = self.ollama_session(user_id, memory, user_input, provider)
+            fallback = template_response(decision.intent, memory.intimacy_level)
+            context_prompt = None
+            # Intention simple ou tour déjà hors délai : réponse prédéfinie, sans prompt
+            if decision.fast or not self.deadline_policy.allows_model(deadline):
+                chunks = iter([fallback])
+            else:
+                with self.metrics.time("context_prompt"):
+                    context_prompt = self.create_context_prompt(user_input, memory, user_id)
+                cache_key = self.response_cache_key(user_input, memory, scan, context_prompt, provider)
+                chunks = self.stream_within(
+                    deadline, self.cached_ai_stream(context_prompt, cache_key, provider, session), fallback
+                )
+            
+            # Premier morceau, puis flux complet (style et envoi à l'interface compris)
+            ai_response = final_response = ""
+            stream_start = time.perf_counter()
+            first_chunk = True
+            for ai_response, final_response in self.adapt_response_stream(
+                chunks,
+                memory.intimacy_level,
+                memory.personal_info
+            ):
+                if first_chunk:
+                    self.metrics.observe_stage("first_chunk", time.perf_counter() - stream_start)
+                    first_chunk = False
+                yield final_response, memory.intimacy_level
+            self.metrics.observe_stage("model_stream", time.perf_counter() - stream_start)
+            if session is not None:
+                session.close()
+            
+            self.commit_turn(user_id, memory, personal_info, user_input, final_response, ai_response)
+            self.router.record_latency(decision, time.perf_counter() - start)
+            self.observe_turn(decision, start, context_prompt, ai_response, final_response)
+        self.deadline_policy.record_turn(deadline)
+    
+    def stream_within(self, deadline, chunks: Iterable[str], fallback: str) -> Iterator[str]:
+        """Flux modèle borné par l'échéance du tour.
+        
+        Sans aucun morceau à l'échéance, la réponse prédéfinie est servie ;
+        au-delà, le texte déjà affiché est gardé tel quel.
+        """
+        started = False
+        try:
+            for chunk in self.deadline_policy.iterate(deadline, chunks):
+                started = True
+                yield chunk
+        except DeadlineExceeded:
+            if not started:
+                yield fallback
+    
+    async def agenerate_response(self, user_input: str, user_id: str, provider: Optional[str] = None):
+        """Version asynchrone de generate_response"""
+        deadline = self.deadline_policy.start()
+        async with self.user_locks.hold_async(user_id):
+            start = time.perf_counter()
+            self.metrics.observe_stage("lock_wait", deadline.elapsed())
+            memory, personal_info, scan = await self.run_blocking(self.prepare_turn, user_input, user_id)
+            with self.metrics.time("route"):
+                decision = self.router.route(scan)
+            session = self.ollama_session(user_id, memory, user_input, provider)
+            
+            context_prompt = None
+            # Intention simple ou tour déjà hors délai : réponse prédéfinie, sans prompt
+            if decision.fast or not self.deadline_policy.allows_model(deadline):
+                ai_response = template_response(decision.intent, memory.intimacy_level)
+            else:
+                with self.metrics.time("context_prompt"):
+                    context_prompt = self.create_context_prompt(user_input, memory, user_id)
+                cache_key = self.response_cache_key(user_input, memory, scan, context_prompt, provider)
+                try:
+                    with self.metrics.time("model"):
+                        ai_response = await self.deadline_policy.acall(
+                            deadline, self.acached_ai_response, context_prompt, cache_key, provider, session
+                        )
+                except DeadlineExceeded:
+                    ai_response = template_response(decision.intent, memory.intimacy_level)
+            if session is not None:
+                session.close()
+            
+            with self.metrics.time("style"):
+                final_response = self.adapt_response_style(
+                    ai_response,
+                    memory.intimacy_level,
+                    memory.personal_info
+                )
+            
+            await self.run_blocking(self.commit_turn, user_id, memory, personal_info, user_input, final_response,
+                                    ai_response)
+            self.router.record_latency(decision, time.perf_counter() - start)
+            self.observe_turn(decision, start, context_prompt, ai_response, final_response)
+        self.deadline_policy.record_turn(deadline)
+        return final_response, memory.intimacy_level
+    
+    async def agenerate_response_stream(self, user_input: str, user_id: str,
+                                        provider: Optional[str] = None) -> AsyncIterator[tuple]:
+        """Version asynchrone de generate_response_stream"""
+        deadline = self.deadline_policy.start()
+        async with self.user_locks.hold_async(user_id):
+            start = time.perf_counter()
+            self.metrics.observe_stage("lock_wait", deadline.elapsed())
+            memory, personal_info, scan = await self.run_blocking(self.prepare_turn, user_input, user_id)
+            with self.metrics.time("route"):
+                decision = self.router.route(scan)
+            session = self.ollama_session(user_id, memory, user_input, provider)
+            fallback = template_response(decision.intent, memory.intimacy_level)
+            context_prompt = None
+            # Intention simple ou tour déjà hors délai : réponse prédéfinie, sans prompt
+            if decision.fast or not self.deadline_policy.allows_model(deadline):
+                chunks = self.astream_within(deadline, None, fallback)
+            else:
+                with self.metrics.time("context_prompt"):
+                    context_prompt = self.create_context_prompt(user_input, memory, user_id)
+                cache_key = self.response_cache_key(user_input, memory, scan, context_prompt, provider)
+                chunks = self.astream_within(
+                    deadline, self.acached_ai_stream(context_prompt, cache_key, provider, session), fallback
+                )
+            
+            ai_response = final_response = ""
+            stream_start = time.perf_counter()
+            first_chunk = True
+            async for ai_response, final_response in self.aadapt_response_stream(
+                chunks,
+                memory.intimacy_level,
+                memory.personal_info
+            ):
+                if first_chunk:
+                    self.metrics.observe_stage("first_chunk", time.perf_counter() - stream_start)
+                    first_chunk = False
+                yield final_response, memory.intimacy_level
+            self.metrics.observe_stage("model_stream", time.perf_counter() - stream_start)
+            if session is not None:
+                session.close()
+            
+            await self.run_blocking(self.commit_turn, user_id, memory, personal_info, user_input, final_response,
+                                    ai_response)
+            self.router.record_latency(decision, time.perf_counter() - start)
+            self.observe_turn(decision, start, context_prompt, ai_response, final_response)
+        self.deadline_policy.record_turn(deadline)
+    
+    async def astream_within(self, deadline, chunks: Optional[AsyncIterator[str]],
+                             fallback: str) -> AsyncIterator[str]:
+        """Version asynchrone de stream_within (chunks None : réponse prédéfinie directe)"""
+        if chunks is None:
+            yield fallback
+            return
+        started = False
+        try:
+            async for chunk in self.deadline_policy.aiterate(deadline, chunks):
+                started = True
+                yield chunk
+        except DeadlineExceeded:
+            if not started:
+                yield fallback
+    
+    async def run_blocking(self, fn, *args):
+        """fn(*args) dans un thread, hors de la boucle d'événements (lecture et écriture de la mémoire).
+        
+        Une annulation attend quand même la fin de l'appel : le verrou
+        utilisateur reste tenu tant que le thread touche au profil.
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+    
+    def prepare_turn(self, user_input: str, user_id: str) -> tuple:
+        """Début de tour : compteur, infos personnelles et intimité (verrou utilisateur requis).
+        
+        Renvoie (mémoire, infos personnelles du message, analyse du message).
+        """
+        with self.metrics.time("memory_get"):
+            memory = self.get_user_memory(user_id)
+        
+        # Mise à jour compteur interactions
+        memory.interaction_count += 1
+        
+        # Analyse du message en une passe (marqueurs, intimité, intention)
+        with self.metrics.time("scan"):
+            scan = scan_message(user_input)
+        
+        # Extraction infos personnelles
+        with self.metrics.time("markers"):
+            personal_info = self.extract_personal_markers(user_input, scan)
+        memory.personal_info.update(personal_info)
+        
+        # Calcul boost intimité
+        with self.metrics.time("intimacy"):
+            intimacy_boost = self.calculate_intimacy_boost(user_input, scan)
+        memory.intimacy_level = min(5.0, memory.intimacy_level + intimacy_boost)
+        
+        # Progression naturelle avec interactions
+        if memory.interaction_count % 5 == 0:
+            memory.intimacy_level = min(5.0, memory.intimacy_level + 0.1)
+        
+        return memory, personal_info, scan
+    
+    def commit_turn(self, user_id: str, memory: UserMemory, personal_info: dict, user_input: str,
+                    final_response: str, ai_response: str):
+        """Fin de tour : historique et persistance (verrou utilisateur requis)"""
+        # Réponse brute gardée pour debug (partagée avec la réponse stylée) ; seules
+        # les 10 dernières conversations sont gardées, la plus ancienne part dans l'archive
+        on_evict = partial(self.history_archive.add, user_id) if self.history_archive is not None else None
+        history_entry = memory.add_exchange(user_input, final_response, ai_raw=ai_response, on_evict=on_evict)
+        # Échange indexé pour la mémoire à long terme (hors réponses en erreur)
+        if self.long_term is not None:
+            self.long_term.add(user_id, history_entry)
+        
+        # Persistance du tour (delta journalisé ou upsert de la ligne)
+        with self.metrics.time("memory_save"):
+            self.save_memory(user_id, memory, personal_info, history_entry)
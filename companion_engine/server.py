@@ -0,0 +1,171 @@
+# companion_engine/server.py - Point d'entrée HTTP/JSON des compagnons, sans Gradio
+"""Sert un compagnon en HTTP/JSON (bibliothèque standard uniquement).
+
+- `POST /chat` : `{"user_id": …, "message": …, "provider": …, "stream": false}`
+  → `{"response": …, "intimacy_level": …}` ; avec `"stream": true` (compagnon
+  IA), une ligne JSON par réponse partielle (NDJSON), la dernière avec `"done": true` ;
+- `POST /reset` : `{"user_id": …}` efface la mémoire de l'utilisateur ;
+- `GET /health` : moteur servi et état des modèles ;
+- `GET /metrics` (Prometheus) et `GET /metrics.json` : mesures du compagnon.
+
+La configuration du compagnon passe par les mêmes variables d'environnement
+que les interfaces Gradio.
+
+    python -m companion_engine.server --engine simple --port 8000
+    python -m companion_engine.server --engine ai --host 0.0.0.0 --port 8080
+"""
+import argparse
+import json
+import logging
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from companion_engine import ENGINES, get_companion
+
+logger = logging.getLogger(__name__)
+
+
+class _RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class CompanionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # connexions persistantes entre deux tours
+    engine: str = "simple"
+
+    @property
+    def companion(self):
+        return get_companion(self.engine)
+
+    def do_GET(self):
+        if self.path == "/health":
+            health = {"status": "ok", "engine": self.engine}
+            if hasattr(self.companion, "warmup"):
+                health["models"] = self.companion.warmup.status_text()
+            self._json(200, health)
+        elif self.path == "/metrics":
+            self._send(200, self.companion.metrics.render().encode(), "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/metrics.json":
+            self._json(200, self.companion.metrics.snapshot())
+        else:
+            self._json(404, {"error": f"Route inconnue: {self.path}"})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+            if self.path == "/chat":
+                self._chat(payload)
+            elif self.path == "/reset":
+                self.companion.reset_memory(self._field(payload, "user_id"))
+                self._json(200, {"status": "ok"})
+            else:
+                self._json(404, {"error": f"Route inconnue: {self.path}"})
+        except _RequestError as e:
+            self._json(e.status, {"error": str(e)})
+
+    def _chat(self, payload: dict):
+        message = self._field(payload, "message")
+        user_id = self._field(payload, "user_id")
+        if not message.strip():
+            raise _RequestError(400, "Veuillez entrer un message")
+        args = (message, user_id)
+        if self.engine == "ai":
+            provider = payload.get("provider")
+            args += (provider.lower() if isinstance(provider, str) else None,)
+
+        if payload.get("stream") and hasattr(self.companion, "generate_response_stream"):
+            self._stream(self.companion.generate_response_stream(*args))
+            return
+        response, intimacy_level = self.companion.generate_response(*args)
+        self._json(200, {"response": response, "intimacy_level": intimacy_level})
+
+    def _stream(self, partials):
+        """Réponses partielles en NDJSON, par morceaux (transfert chunked)"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        response, intimacy_level = "", None
+        for response, intimacy_level in partials:
+            self._chunk({"response": response, "intimacy_level": intimacy_level})
+        self._chunk({"response": response, "intimacy_level": intimacy_level, "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, body: dict):
+        data = (json.dumps(body, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _read_json(self) -> dict:
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            raise _RequestError(400, "Corps JSON invalide") from None
+        if not isinstance(payload, dict):
+            raise _RequestError(400, "Objet JSON attendu")
+        return payload
+
+    @staticmethod
+    def _field(payload: dict, name: str) -> str:
+        value = payload.get(name)
+        if not isinstance(value, str):
+            raise _RequestError(400, f"Champ texte manquant: {name}")
+        return value
+
+    def _json(self, status: int, body):
+        self._send(status, json.dumps(body, ensure_ascii=False, default=str).encode("utf-8"), "application/json")
+
+    def _send(self, status: int, data: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("companion: " + format, *args)
+
+
+def create_server(engine: str = "simple", port: int = 8000, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serveur HTTP du compagnon `engine` (construit à la première requête s'il ne l'est pas déjà)"""
+    if engine not in ENGINES:
+        raise ValueError(f"Moteur inconnu: {engine}")
+    handler = type("Handler", (CompanionHandler,), {"engine": engine})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="simple")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="0 = port libre")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    companion = get_companion(args.engine)
+    companion.export_metrics()
+    server = create_server(args.engine, args.port, args.host)
+    logger.info("Compagnon %s démarré en %.0f ms, http://%s:%d", args.engine,
+                1000 * (time.perf_counter() - started), args.host, server.server_address[1])
+    # Comme l'interface IA : premier tour servi une fois les modèles chargés
+    if hasattr(companion, "start_warmup"):
+        companion.start_warmup()
+    if getattr(companion, "ai_config", {}).get("warmup"):
+        companion.warmup.wait(companion.ai_config["warmup_timeout"])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # Mémoire et archive en attente écrites, threads de fond arrêtés
+        companion.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# companion_engine/simple.py - Compagnon sans IA : intimité, mémoire et réponses prédéfinies
+import os
+from functools import partial
+from history_archive import HistoryArchive
+from memory_store import create_memory_store, new_user_memory
+from metrics import SIZE_BUCKETS, Metrics, dump_metrics, serve_metrics
+from response_templates import template_response
+from text_analysis import detect_intent, intimacy_boost, personal_markers, scan_message
+from user_locks import UserLocks
+
+class SimpleVoiceCompanion:
+    def __init__(self):
+        # Mémoire utilisateur (fichier JSON journalisé ou SQLite)
+        self.memory_file = "user_memory.json"
+        self.memory_backend = os.getenv("MEMORY_BACKEND", "json")
+        self.memory_cache_size = int(os.getenv("MEMORY_CACHE_SIZE", "10000"))
+        self.memory_cache_ttl = float(os.getenv("MEMORY_CACHE_TTL", "1800"))
+        # Écriture en tâche de fond par lots (0 = écriture synchrone à chaque tour)
+        self.memory_flush_ms = float(os.getenv("MEMORY_FLUSH_MS", "0"))
+        self.memory_flush_max_turns = int(os.getenv("MEMORY_FLUSH_MAX_TURNS", "100"))
+        # Mesures par étape du tour ; export Prometheus (port, 0 = aucun) et/ou fichier JSON périodique
+        self.metrics = Metrics(enabled=os.getenv("METRICS", "1") == "1")
+        self.metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        self.metrics_dump_file = os.getenv("METRICS_DUMP_FILE", "")
+        self.metrics_dump_interval = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+        # Archive compressée (gzip, zlib ou lzma) des échanges sortis de l'historique du profil
+        self.history_archive_dir = os.getenv("HISTORY_ARCHIVE_DIR", "history_archive")
+        self.history_archive_codec = os.getenv("HISTORY_ARCHIVE_CODEC", "gzip")
+        self.history_archive_enabled = os.getenv("HISTORY_ARCHIVE", "1") == "1"
+        self.load_memory()
+        
+        # Tours d'un même utilisateur sérialisés, utilisateurs différents en parallèle
+        self.user_locks = UserLocks()
+    
+    def load_memory(self):
+        """Ouvre le backend de mémoire (les profils sont lus à la demande)"""
+        self.store = create_memory_store(
+            self.memory_backend,
+            self.memory_file,
+            cache_size=self.memory_cache_size,
+            cache_ttl=self.memory_cache_ttl,
+            flush_interval_ms=self.memory_flush_ms,
+            flush_max_turns=self.memory_flush_max_turns,
+            metrics=self.metrics if self.metrics.enabled else None
+        )
+        self.history_archive = HistoryArchive(self.history_archive_dir, self.history_archive_codec) \
+            if self.history_archive_enabled else None
+        if hasattr(self.store, "stats"):
+            self.metrics.collect("store", self.store.stats)
+        if self.history_archive is not None:
+            self.metrics.collect("history_archive", self.history_archive.stats)
+    
+    def close(self):
+        """Écrit ce qui est en attente (mémoire, archive) et arrête les threads de fond"""
+        self.store.close()
+        if self.history_archive is not None:
+            self.history_archive.close()
+    
+    def export_metrics(self):
+        """Démarre l'export des métriques configuré (endpoint Prometheus, fichier JSON)"""
+        if self.metrics_port:
+            serve_metrics(self.metrics, self.metrics_port)
+        if self.metrics_dump_file:
+            dump_metrics(self.metrics, self.metrics_dump_file, self.metrics_dump_interval)
+    
+    def save_memory(self, user_id, memory, personal_info=None, history_entry=None):
+        """Sauvegarde le profil d'un utilisateur après un tour"""
+        self.store.save(user_id, memory, personal_info, history_entry)
+    
+    def get_user_memory(self, user_id):
+        """Récupère mémoire utilisateur"""
+        memory = self.store.get(user_id)
+        if memory is None:
+            memory = new_user_memory()
+        return memory
+    
+    def reset_memory(self, user_id):
+        """Efface la mémoire d'un utilisateur"""
+        with self.user_locks.hold(user_id):
+            self.store.delete(user_id)
+            if self.history_archive is not None:
+                self.history_archive.forget(user_id)
+    
+    def extract_personal_markers(self, text, scan=None):
+        """Extraction simple d'éléments personnels"""
+        return personal_markers(scan or scan_message(text))
+    
+    def calculate_intimacy_boost(self, text, scan=None):
+        """Calcule augmentation intimité selon contenu (max 0.5 points par interaction)"""
+        return intimacy_boost(scan or scan_message(text))
+    
+    def adapt_response_style(self, base_response, intimacy_level, personal_info):
+        """Adapte style selon niveau intimité"""
+        if intimacy_level <= 1.5:
+            # Formel et poli
+            response = f"Bonjour ! {base_response}"
+            response = response.replace(" tu ", " vous ")
+            response = response.replace("Tu ", "Vous ")
+        
+        elif intimacy_level <= 2.5:
+            # Amical mais respectueux
+            response = base_response
+            if not any(greeting in base_response.lower() for greeting in ["salut", "bonjour", "hello"]):
+                response = f"Salut ! {response}"
+        
+        elif intimacy_level <= 3.5:
+            # Familier et chaleureux
+            response = base_response
+            # Ajouter prénom si connu
+            if "nom" in personal_info:
+                name = personal_info["nom"].split()[-1]  # Prendre dernier mot comme prénom
+                response = f"Salut {name} ! {response}"
+            response += " 😊"
+        
+        elif intimacy_level <= 4.5:
+            # Proche et empathique
+            empathetic_prefixes = [
+                "Je comprends ce que tu ressens... ",
+                "Ça me touche que tu me dises ça... ",
+                "Je sens que c'est important pour toi... "
+            ]
+            
+            if any(word in base_response.lower() for word in ["triste", "difficile", "problème", "peur"]):
+                response = empathetic_prefixes[0] + base_response
+            else:
+                response = base_response
+            
+            response += " ❤️"
+        
+        else:
+            # Très intime et complice
+            response = base_response
+            response += " 💙 Tu sais que tu peux toujours compter sur moi."
+        
+        return response
+    
+    def generate_response(self, user_input, user_id):
+        """Génère réponse adaptée"""
+        with self.user_locks.hold(user_id):
+            with self.metrics.time("turn"):
+                response, intimacy_level = self._generate_response(user_input, user_id)
+        self.metrics.inc("turns_total")
+        self.metrics.observe("response_chars", len(response), SIZE_BUCKETS)
+        return response, intimacy_level
+    
+    def _generate_response(self, user_input, user_id):
+        """Tour de conversation, appelé avec le verrou de l'utilisateur"""
+        with self.metrics.time("memory_get"):
+            memory = self.get_user_memory(user_id)
+        
+        # Mise à jour compteur interactions
+        memory.interaction_count += 1
+        
+        # Analyse du message en une passe (marqueurs, intimité, intention)
+        with self.metrics.time("scan"):
+            scan = scan_message(user_input)
+        
+        # Extraction infos personnelles
+        with self.metrics.time("markers"):
+            personal_info = self.extract_personal_markers(user_input, scan)
+        memory.personal_info.update(personal_info)
+        
+        # Calcul boost intimité
+        with self.metrics.time("intimacy"):
+            intimacy_boost = self.calculate_intimacy_boost(user_input, scan)
+        memory.intimacy_level = min(5.0, memory.intimacy_level + intimacy_boost)
+        
+        # Progression naturelle avec interactions
+        if memory.interaction_count % 5 == 0:
+            memory.intimacy_level = min(5.0, memory.intimacy_level + 0.1)
+        
+        # Génération réponse de base (simulation simple)
+        with self.metrics.time("response"):
+            base_response = self.generate_base_response(user_input, memory, scan)
+        
+        # Adaptation style
+        with self.metrics.time("style"):
+            final_response = self.adapt_response_style(
+                base_response, 
+                memory.intimacy_level, 
+                memory.personal_info
+            )
+        
+        # Sauvegarde conversation (historique circulaire : les 10 dernières sont gardées,
+        # la plus ancienne part dans l'archive)
+        on_evict = partial(self.history_archive.add, user_id) if self.history_archive is not None else None
+        history_entry = memory.add_exchange(user_input, final_response, on_evict=on_evict)
+        
+        # Persistance du tour (delta journalisé ou upsert de la ligne)
+        with self.metrics.time("memory_save"):
+            self.save_memory(user_id, memory, personal_info, history_entry)
+        
+        return final_response, memory.intimacy_level
+    
+    def generate_base_response(self, user_input, memory, scan=None):
+        """Génération réponse de base (simulation - à remplacer par vraie IA)"""
+        # Réponses selon niveau intimité et contenu
+        intimacy = memory.intimacy_level
+        
+        # Détection intention (tables compilées de text_analysis)
+        intent = detect_intent(scan or scan_message(user_input))
+        
+        # Réponse selon l'intention, au registre du niveau d'intimité
+        return template_response(intent, intimacy)
@@ -0,0 +1,438 @@
+# history_archive.py - Archive froide de l'historique : échanges sortis du profil, en segments compressés par jour
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import lzma
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import date, datetime
+from typing import Iterator, Optional
+
+from user_memory import HistoryEntry, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Codec -> (extension, compression d'un bloc, décompresseur d'un membre, début de chaque membre)
+CODECS = {
+    "gzip": (".gz", lambda data: gzip.compress(data, mtime=0), lambda: zlib.decompressobj(31), b"\x1f\x8b\x08"),
+    "zlib": (".zz", zlib.compress, zlib.decompressobj, b"\x78\x9c"),
+    "lzma": (".xz", lzma.compress, lzma.LZMADecompressor, b"\xfd7zXZ\x00")
+}
+_SEGMENT = re.compile(r"history-(\d{4}-\d{2}-\d{2})\.jsonl(\.gz|\.zz|\.xz)$")
+_READ_SIZE = 1 << 16
+
+
+def _codec(path: str) -> tuple:
+    """Paramètres du codec d'un segment, d'après son extension"""
+    return next(codec for codec in CODECS.values() if path.endswith(codec[0]))
+
+
+def _find(f, magic: bytes, position: int) -> int:
+    """Position de la prochaine occurrence de `magic` à partir de `position`, -1 s'il n'y en a plus"""
+    f.seek(position)
+    tail = b""
+    while True:
+        chunk = f.read(_READ_SIZE)
+        if not chunk:
+            return -1
+        data = tail + chunk
+        found = data.find(magic)
+        if found >= 0:
+            return position - len(tail) + found
+        tail = data[-(len(magic) - 1):]
+        position += len(chunk)
+
+
+def _walk(path: str, start: int = 0) -> Iterator[tuple]:
+    """(début, fin, contenu décompressé) de chaque membre complet d'un segment.
+
+    Un segment est une suite de membres compressés indépendants (un par
+    bloc écrit). Un membre n'est produit qu'une fois entièrement décompressé.
+    Un membre illisible ou incomplet (crash pendant l'écriture) est ignoré en
+    entier, et la lecture reprend au début du membre suivant : un bloc
+    tronqué ne rend pas illisibles ceux écrits après lui.
+    """
+    _, _, new_decompressor, magic = _codec(path)
+    with open(path, "rb") as f:
+        while True:
+            f.seek(start)
+            decompressor = new_decompressor()
+            parts = []
+            consumed = 0
+            try:
+                while not decompressor.eof:
+                    chunk = f.read(_READ_SIZE)
+                    if not chunk:
+                        break
+                    parts.append(decompressor.decompress(chunk))
+                    consumed += len(chunk)
+            except (zlib.error, lzma.LZMAError) as e:
+                logger.warning("Bloc illisible dans %s (octet %d) : %s", path, start, e)
+            else:
+                if decompressor.eof:
+                    end = start + consumed - len(decompressor.unused_data)
+                    yield start, end, b"".join(parts)
+                    start = end
+                    continue
+                if not consumed:
+                    return  # fin du segment
+                logger.warning("Bloc incomplet dans %s (octet %d) : ignoré", path, start)
+            start = _find(f, magic, start + 1)
+            if start < 0:
+                return
+
+
+def _members(path: str) -> Iterator[bytes]:
+    """Contenu décompressé des membres complets d'un segment"""
+    for _, _, data in _walk(path):
+        yield data
+
+
+def _read_member(path: str, start: int, end: int) -> bytes:
+    """Contenu décompressé d'un seul membre (b"" s'il est illisible)"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        decompressor = _codec(path)[2]()
+        content = decompressor.decompress(data)
+    except (OSError, zlib.error, lzma.LZMAError) as e:
+        logger.warning("Bloc illisible dans %s (octet %d) : %s", path, start, e)
+        return b""
+    if not decompressor.eof:
+        logger.warning("Bloc incomplet dans %s (octet %d) : ignoré", path, start)
+        return b""
+    return content
+
+
+def _user_hash(user_id: str) -> str:
+    """Hachage court d'un user_id pour l'index des blocs (une collision ne coûte qu'une lecture de trop)"""
+    return hashlib.blake2b(user_id.encode("utf-8"), digest_size=4).hexdigest()
+
+
+def _block_users(content: bytes) -> list:
+    """Hachages des utilisateurs présents dans un bloc décompressé"""
+    hashes = set()
+    for line in content.split(b"\n"):
+        try:
+            hashes.add(_user_hash(json.loads(line)[0]))
+        except (ValueError, IndexError, TypeError):
+            continue
+    return sorted(hashes)
+
+
+def _index_line(start: int, end: int, hashes) -> bytes:
+    return (json.dumps([start, end, list(hashes)], separators=(",", ":")) + "\n").encode("ascii")
+
+
+def _lines(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+
+
+def _user_prefix(user_id: str) -> bytes:
+    """Début des lignes d'un utilisateur (`["user_id",`), pour filtrer sans décoder"""
+    return (json.dumps([user_id], ensure_ascii=False, separators=(",", ":"))[:-1] + ",").encode("utf-8")
+
+
+def _microseconds(moment: Optional[datetime]) -> Optional[int]:
+    if moment is None:
+        return None
+    value = parse_timestamp(moment.isoformat())
+    if not isinstance(value, int):
+        raise ValueError(f"Horodatage naïf (heure locale) attendu: {moment}")
+    return value
+
+
+class HistoryArchive:
+    """Échanges sortis de l'historique du profil, gardés dans des segments compressés.
+
+    Un échange évincé du tampon circulaire est mis en attente, puis écrit
+    par un thread de fond, en bloc compressé ajouté au segment du jour
+    (`history-AAAA-MM-JJ.jsonl.gz`), toutes les `flush_interval` secondes ou
+    dès que `block_entries` échanges attendent. Chaque bloc est un membre
+    gzip, zlib ou xz complet : `zcat` et `xzcat` lisent les segments tels quels.
+    `iter_turns` les relit en flux, sans tout décompresser en mémoire.
+
+    À côté de chaque segment, un index (`<segment>.idx`, une ligne JSON
+    `[début, fin, [hachages des utilisateurs]]` par bloc) permet de relire
+    les échanges d'un seul utilisateur sans parcourir toute l'archive.
+    """
+
+    def __init__(self, directory: str = "history_archive", codec: str = "gzip", block_entries: int = 512,
+                 flush_interval: float = 5.0):
+        if codec not in CODECS:
+            raise ValueError(f"Codec d'archive inconnu: {codec}")
+        self.directory = directory
+        self.codec = codec
+        self.block_entries = block_entries
+        self.flush_interval = flush_interval
+        self._pending = []  # (user_id, ligne JSON) en attente de compression
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._synced = set()  # segments dont l'index a été rattrapé par ce process
+        self._blocks = None  # hachage d'utilisateur -> [(jour, segment, début, fin)], chargé au premier besoin
+        self.entries_archived = 0
+        self.blocks_written = 0
+        self.blocks_read = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.archive_seconds = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="history-archive", daemon=True)
+        self._thread.start()
+        # Échanges encore en attente écrits à l'arrêt du process, si close() n'a pas été appelé
+        atexit.register(self.flush)
+
+    def add(self, user_id: str, entry: HistoryEntry):
+        """Met l'échange en attente d'archivage (sans compression sur le chemin de réponse)"""
+        line = json.dumps([user_id, entry.to_record()], ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._pending.append((user_id, line))
+            if len(self._pending) >= self.block_entries:
+                self._wake.set()
+
+    def flush(self):
+        """Compresse et écrit immédiatement les échanges en attente, en un bloc"""
+        with self._write_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+            if not lines:
+                return
+            start = time.perf_counter()
+            raw = "".join(line for _, line in lines).encode("utf-8")
+            extension, compress = CODECS[self.codec][:2]
+            block = compress(raw)
+            day = date.today()
+            path = self._segment_path(day, extension)
+            try:
+                # Un segment repris par ce process est d'abord vérifié : un bloc
+                # ajouté derrière une fin tronquée serait lu comme sa suite
+                if path not in self._synced:
+                    self._sync_segment(path)
+                    self._synced.add(path)
+                with open(path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(block)
+            except OSError:
+                with self._lock:
+                    self._pending = lines + self._pending
+                raise
+            hashes = sorted({_user_hash(user_id) for user_id, _ in lines})
+            try:
+                with open(path + ".idx", "ab") as f:
+                    f.write(_index_line(offset, offset + len(block), hashes))
+            except OSError as e:
+                # Le bloc est écrit : l'index sera rattrapé au prochain ajout
+                logger.warning("Index de %s non mis à jour : %s", path, e)
+                self._synced.discard(path)
+            if self._blocks is not None:
+                for user_hash in hashes:
+                    self._blocks.setdefault(user_hash, []).append((day, path, offset, offset + len(block)))
+            with self._lock:
+                self.entries_archived += len(lines)
+                self.blocks_written += 1
+                self.raw_bytes += len(raw)
+                self.compressed_bytes += len(block)
+                self.archive_seconds += time.perf_counter() - start
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Échec de l'archivage de l'historique")
+
+    def _segment_path(self, day: date, extension: str) -> str:
+        return os.path.join(self.directory, f"history-{day.isoformat()}.jsonl{extension}")
+
+    def _sync_segment(self, path: str) -> list:
+        """(début, fin, hachages) des blocs d'un segment, d'après son index rattrapé.
+
+        Les blocs absents de l'index (crash entre les deux écritures, segment
+        écrit avant l'index) sont relus et ajoutés ; une fin de segment
+        incomplète est coupée. Appelé sous `_write_lock`.
+        """
+        index_path = path + ".idx"
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            return []
+        blocks, stale = [], False
+        try:
+            with open(index_path, "rb") as f:
+                for raw in f:
+                    try:
+                        start, end, hashes = json.loads(raw)
+                    except ValueError:
+                        stale = True  # ligne tronquée
+                        continue
+                    if not raw.endswith(b"\n") or end > size or (blocks and start < blocks[-1][1]):
+                        stale = True
+                        continue
+                    blocks.append((start, end, hashes))
+        except FileNotFoundError:
+            pass
+        covered = blocks[-1][1] if blocks else 0
+        found = []
+        if covered < size:
+            for start, end, content in _walk(path, covered):
+                found.append((start, end, _block_users(content)))
+                covered = end
+        if covered < size:
+            logger.warning("Fin incomplète de %s coupée (%d octets)", path, size - covered)
+            with open(path, "r+b") as f:
+                f.truncate(covered)
+        blocks += found
+        if stale:
+            tmp_path = f"{index_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(_index_line(*block) for block in blocks))
+            os.replace(tmp_path, index_path)
+        elif found:
+            with open(index_path, "ab") as f:
+                f.write(b"".join(_index_line(*block) for block in found))
+        return blocks
+
+    def _user_blocks(self, user_id: str) -> list:
+        """(jour, segment, début, fin) des blocs qui peuvent contenir l'utilisateur. Appelé sous `_write_lock`."""
+        if self._blocks is None:
+            blocks = {}
+            for day, path in self.segments():
+                for start, end, hashes in self._sync_segment(path):
+                    for user_hash in hashes:
+                        blocks.setdefault(user_hash, []).append((day, path, start, end))
+                self._synced.add(path)
+            self._blocks = blocks
+        return list(self._blocks.get(_user_hash(user_id), ()))
+
+    def segments(self) -> list:
+        """(jour, chemin) des segments, du plus ancien au plus récent (tous codecs confondus)"""
+        found = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT.match(name)
+            if match:
+                found.append((date.fromisoformat(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def iter_turns(self, user_id: Optional[str] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None) -> Iterator[tuple]:
+        """(user_id, HistoryEntry) archivés, dans l'ordre d'archivage, lus en flux.
+
+        Filtres facultatifs : un utilisateur, et l'intervalle [since, until)
+        des horodatages des échanges (datetime naïfs, en heure locale comme
+        les horodatages). Sans utilisateur, les échanges en attente sont
+        d'abord écrits et toute l'archive est parcourue ; pour un utilisateur,
+        seuls ses blocs (d'après l'index) sont relus, suivis de ses échanges
+        encore en attente.
+        """
+        since_us, until_us = _microseconds(since), _microseconds(until)
+        if user_id is None:
+            self.flush()
+            lines = (line for day, path in self.segments()
+                     if since is None or day >= since.date()
+                     for line in _lines(_members(path)))
+            yield from self._entries(lines, b"", since_us, until_us)
+            return
+        with self._write_lock:
+            blocks = self._user_blocks(user_id)
+            with self._lock:
+                pending = [line.encode("utf-8") for owner, line in self._pending if owner == user_id]
+        # Un échange est archivé le jour de sa création ou après
+        blocks = [block for block in blocks if since is None or block[0] >= since.date()]
+        with self._lock:
+            self.blocks_read += len(blocks)
+        lines = (line for _, path, start, end in blocks
+                 for line in _read_member(path, start, end).split(b"\n"))
+        yield from self._entries(lines, _user_prefix(user_id), since_us, until_us)
+        yield from self._entries(pending, b"", since_us, until_us)
+
+    @staticmethod
+    def _entries(lines, prefix: bytes, since_us: Optional[int], until_us: Optional[int]) -> Iterator[tuple]:
+        for line in lines:
+            if not line.startswith(prefix):
+                continue
+            try:
+                owner, record = json.loads(line)
+            except ValueError:
+                continue
+            entry = HistoryEntry.from_record(record)
+            if isinstance(entry.timestamp, int):
+                if since_us is not None and entry.timestamp < since_us:
+                    continue
+                if until_us is not None and entry.timestamp >= until_us:
+                    continue
+            yield owner, entry
+
+    def forget(self, user_id: str):
+        """Retire les échanges archivés d'un utilisateur (réécriture des segments qui en contiennent)"""
+        with self._write_lock:
+            needle = _user_prefix(user_id)
+            with self._lock:
+                self._pending = [(owner, line) for owner, line in self._pending if owner != user_id]
+            paths = sorted({path for _, path, _, _ in self._user_blocks(user_id)})
+            for path in paths:
+                compress = _codec(path)[1]
+                kept, removed = [], False
+                for line in _lines(_members(path)):
+                    if line.startswith(needle):
+                        removed = True
+                    elif line:
+                        kept.append(line + b"\n")
+                if not removed:
+                    continue
+                # Index retiré d'abord : un crash pendant la réécriture le fait reconstruire
+                if os.path.exists(path + ".idx"):
+                    os.remove(path + ".idx")
+                if not kept:
+                    os.remove(path)
+                    continue
+                content = b"".join(kept)
+                block = compress(content)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(block)
+                os.replace(tmp_path, path)
+                with open(path + ".idx", "wb") as f:
+                    f.write(_index_line(0, len(block), _block_users(content)))
+            if paths:
+                self._blocks = None
+
+    def stats(self) -> dict:
+        """Volume archivé, taux de compression et débit de l'archivage"""
+        with self._lock:
+            return {
+                "codec": self.codec,
+                "pending": len(self._pending),
+                "entries_archived": self.entries_archived,
+                "blocks_written": self.blocks_written,
+                "blocks_read": self.blocks_read,
+                "raw_bytes": self.raw_bytes,
+                "compressed_bytes": self.compressed_bytes,
+                "compression_ratio": self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0,
+                "entries_per_sec": self.entries_archived / self.archive_seconds if self.archive_seconds else 0.0,
+                "raw_mb_per_sec": self.raw_bytes / 1e6 / self.archive_seconds if self.archive_seconds else 0.0
+            }
+
+    def close(self):
+        """Arrête le thread après une dernière écriture (plus d'écriture à l'arrêt du process)"""
+        if not self._stopped:
+            self._stopped = True
+            self._wake.set()
+            self._thread.join()
+            atexit.unregister(self.flush)
+        self.flush()
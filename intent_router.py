@@ -0,0 +1,97 @@
+# intent_router.py - Aiguillage des messages : réponse prédéfinie ou modèle IA
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+from text_analysis import INTENT_KEYWORDS, INTIMACY_TRIGGERS, PERSONAL_MARKERS, ScanResult, detect_intent
+
+logger = logging.getLogger(__name__)
+
+# Un message plus long que ce nombre de mots perd en confiance
+_SHORT_MESSAGE_WORDS = 4
+
+
+def intent_confidence(scan: ScanResult, intent: Optional[str]) -> float:
+    """Confiance (0 à 1) qu'une réponse prédéfinie suffise pour ce message.
+
+    Un message court qui ne contient que l'intention ("Bonjour !", "merci
+    beaucoup") est sûr ; un message qui confie une information personnelle
+    ou une émotion doit être traité par le modèle.
+    """
+    if intent is None:
+        return 0.0
+    if any(scan.has("marker", category) for category in PERSONAL_MARKERS):
+        return 0.0
+    if any(scan.has("intimacy", category) for category in INTIMACY_TRIGGERS if category != "gratitude"):
+        return 0.0
+
+    confidence = min(1.0, _SHORT_MESSAGE_WORDS / max(1, len(scan.text.split())))
+    # Plusieurs intentions ("merci, je suis triste") : message ambigu
+    intents = sum(1 for name in INTENT_KEYWORDS if scan.has("intent", name))
+    return confidence / intents
+
+
+class RouteDecision(NamedTuple):
+    route: str  # "fast_path" ou "llm"
+    intent: Optional[str]
+    confidence: float
+
+    @property
+    def fast(self) -> bool:
+        return self.route == "fast_path"
+
+
+class IntentRouter:
+    """Choisit entre la réponse prédéfinie et le modèle IA.
+
+    Seules les intentions configurées, reconnues avec une confiance au moins
+    égale au seuil, prennent le chemin rapide ; tout le reste part vers le
+    modèle. Chaque décision est journalisée (niveau DEBUG) et comptée, avec la
+    latence des tours de chaque chemin, pour mesurer le trafic et le temps
+    économisés.
+    """
+
+    def __init__(self, intents=("greeting", "thanks"), min_confidence: float = 0.6):
+        self.intents = frozenset(intents)
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.routes = {"fast_path": 0, "llm": 0}
+        self.by_intent = {}  # intention -> {route: nombre}
+        self.latency = {"fast_path": 0.0, "llm": 0.0}  # secondes cumulées
+
+    def route(self, scan: ScanResult) -> RouteDecision:
+        """Décision pour un message déjà analysé"""
+        intent = detect_intent(scan)
+        confidence = intent_confidence(scan, intent) if intent in self.intents else 0.0
+        decision = RouteDecision(
+            "fast_path" if intent in self.intents and confidence >= self.min_confidence else "llm",
+            intent,
+            confidence
+        )
+        with self._lock:
+            self.routes[decision.route] += 1
+            counts = self.by_intent.setdefault(intent or "none", {"fast_path": 0, "llm": 0})
+            counts[decision.route] += 1
+        logger.debug("route=%s intent=%s confidence=%.2f", decision.route, intent, confidence)
+        return decision
+
+    def record_latency(self, decision: RouteDecision, seconds: float):
+        """Durée du tour complet servi par le chemin choisi"""
+        with self._lock:
+            self.latency[decision.route] += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            fast, llm = self.routes["fast_path"], self.routes["llm"]
+            avg_fast = self.latency["fast_path"] / fast if fast else 0.0
+            avg_llm = self.latency["llm"] / llm if llm else 0.0
+            return {
+                "fast_path": fast,
+                "llm": llm,
+                "fast_path_ratio": fast / (fast + llm) if fast + llm else 0.0,
+                "by_intent": {intent: dict(counts) for intent, counts in self.by_intent.items()},
+                "avg_fast_path_latency": avg_fast,
+                "avg_llm_latency": avg_llm,
+                # Appels modèle évités, au coût moyen d'un tour servi par le modèle
+                "estimated_time_saved": fast * max(0.0, avg_llm - avg_fast)
+            }
@@ -0,0 +1,284 @@
+# long_term_memory.py - Mémoire à long terme : tous les échanges d'un utilisateur, retrouvés par BM25
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import Iterable, Optional
+
+from history_archive import HistoryArchive
+from text_analysis import normalize_text
+from user_memory import HistoryEntry
+
+logger = logging.getLogger(__name__)
+
+# Mots vides, sans accents (comparés au texte normalisé)
+FRENCH_STOPWORDS = frozenset("""
+a ai aie aient ait alors as au aucun aussi autre aux avais avait avant avec avez avoir avons bien c ca ce ceci
+cela celle celui ces cet cette chez comme comment d dans de des deja donc du elle elles en encore es est et
+etaient etais etait ete etes etre eu eux fais fait faut ici il ils j je juste l la le les leur leurs lui m ma
+mais me meme mes moi mon n ne ni nos notre nous on ont ou par pas peu peut plus pour pourquoi qu quand que
+quel quelle qui s sa sans se ses si soit son sont suis sur t ta te tes toi ton tous tout toute tres tu un une
+va vais vos votre vous y
+""".split())
+
+_WORD = re.compile(r"\w+")
+
+# Racinisation par troncature : "allergie", "allergique" -> "allerg"
+_STEM_LENGTH = 6
+
+# Paramètres BM25 habituels
+_K1 = 1.2
+_B = 0.75
+# Écart de longueur moyenne toléré avant de recalculer les normes des échanges
+_NORM_DRIFT = 0.1
+
+
+def entry_key(entry: HistoryEntry) -> tuple:
+    """Identité d'un échange, stable d'un chargement du profil à l'autre (horodatage et message)"""
+    return entry.timestamp, entry.user
+
+
+def _indexable(entry: HistoryEntry) -> bool:
+    """Les réponses en erreur du fournisseur ne sont pas des souvenirs"""
+    return not (entry.ai_raw or "").startswith("⚠️")
+
+
+def tokenize(text: str) -> list:
+    """Termes d'un texte : minuscules sans accents, sans mots vides, tronqués à leur racine"""
+    terms = []
+    for word in _WORD.findall(normalize_text(text)[2]):
+        if word in FRENCH_STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word[-1] in "sx":
+            word = word[:-1]
+        terms.append(word[:_STEM_LENGTH])
+    return terms
+
+
+class ConversationIndex:
+    """Index inversé des échanges d'un utilisateur.
+
+    Chaque terme donne les échanges où il apparaît et son nombre
+    d'occurrences : une requête ne parcourt que les listes de ses propres
+    termes, quel que soit le nombre d'échanges. La normalisation de longueur
+    de BM25 est précalculée par échange, et recalculée quand la longueur
+    moyenne a dérivé de plus de 10 %.
+    """
+
+    __slots__ = ("entries", "postings", "lengths", "total_length", "norms", "norm_average")
+
+    def __init__(self):
+        self.entries = []  # HistoryEntry, du plus ancien au plus récent
+        self.postings = {}  # terme -> {n° d'échange: occurrences}
+        self.lengths = []
+        self.total_length = 0
+        self.norms = []  # K1 * (1 - B + B * longueur / longueur moyenne), par échange
+        self.norm_average = 1.0
+
+    def add(self, entry: HistoryEntry):
+        position = len(self.entries)
+        terms = tokenize(f"{entry.user or ''} {entry.ai_raw or entry.assistant or ''}")
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is None:
+                docs = self.postings[term] = {}
+            docs[position] = docs.get(position, 0) + 1
+        self.entries.append(entry)
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+
+        average = self.total_length / len(self.entries) or 1.0
+        if abs(average - self.norm_average) > _NORM_DRIFT * self.norm_average:
+            self.norm_average = average
+            self.norms = [_K1 * (1 - _B + _B * length / average) for length in self.lengths]
+        else:
+            self.norms.append(_K1 * (1 - _B + _B * len(terms) / self.norm_average))
+
+    def search(self, terms: list, limit: int, exclude=frozenset()) -> list:
+        """(n° d'échange, score BM25) des `limit` meilleurs échanges, hors ceux dont la clé est dans `exclude`"""
+        count = len(self.entries)
+        if not count or not terms:
+            return []
+        norms = self.norms
+        scores = {}
+        score = scores.get
+        for term in set(terms):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            weight = (_K1 + 1) * math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for position, occurrences in docs.items():
+                scores[position] = score(position, 0.0) + weight * occurrences / (occurrences + norms[position])
+        best = heapq.nlargest(limit + len(exclude), scores.items(), key=itemgetter(1))
+        if exclude:
+            entries = self.entries
+            best = [result for result in best if entry_key(entries[result[0]]) not in exclude]
+        return best[:limit]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class LongTermMemory:
+    """Tous les échanges de chaque utilisateur, retrouvés dans l'archive de l'historique.
+
+    Aucune copie n'est gardée à part : l'index d'un utilisateur est construit
+    depuis ses échanges archivés (`iter_turns`, qui ne relit que ses blocs)
+    et son historique récent (tampon du profil), puis tenu à jour à chaque
+    tour et gardé pour les `max_users` utilisateurs les plus récents (LRU).
+    La construction se fait sur un thread de fond, lancée par la première
+    recherche : tant que l'index n'est pas prêt, la recherche ne rend rien et
+    le tour n'attend pas. Les réponses en erreur ne sont pas indexées. Les
+    opérations sur un même utilisateur doivent être sérialisées par
+    l'appelant (verrou utilisateur).
+    """
+
+    def __init__(self, archive: HistoryArchive, max_users: int = 1000):
+        self.archive = archive
+        self.max_users = max_users
+        self._indexes = OrderedDict()  # user_id -> ConversationIndex
+        self._building = {}  # user_id -> échanges ajoutés pendant la construction de son index
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="long-term-index")
+        self.turns_added = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.queries = 0
+        self.skipped = 0
+        self.query_seconds = 0.0
+        self.max_query_seconds = 0.0
+
+    def _cached(self, user_id: str) -> Optional[ConversationIndex]:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+            return index
+
+    def _schedule(self, user_id: str, history: Iterable[HistoryEntry]):
+        """Lance la construction de l'index en fond, si elle n'est pas déjà en cours"""
+        with self._lock:
+            if user_id in self._building or user_id in self._indexes:
+                return
+            token = self._building[user_id] = []
+        try:
+            self._executor.submit(self._build, user_id, list(history), token)
+        except RuntimeError:  # fermé
+            with self._lock:
+                self._building.pop(user_id, None)
+
+    def _build(self, user_id: str, history: list, token: list) -> Optional[ConversationIndex]:
+        """Construit l'index depuis l'archive et `history`, puis le publie s'il n'a pas été oublié entre-temps"""
+        start = time.perf_counter()
+        index = ConversationIndex()
+        seen = set()
+
+        def merge(entries):
+            # Un échange évincé pendant la construction est à la fois dans l'archive et l'historique
+            for entry in entries:
+                key = entry_key(entry)
+                if key not in seen and _indexable(entry):
+                    seen.add(key)
+                    index.add(entry)
+
+        try:
+            merge(entry for _, entry in self.archive.iter_turns(user_id))
+            merge(history)
+        except Exception:
+            logger.exception("Échec de la construction de l'index long terme de %s", user_id)
+            with self._lock:
+                if self._building.get(user_id) is token:
+                    del self._building[user_id]
+            return None
+        with self._lock:
+            if self._building.get(user_id) is not token:
+                return None  # oublié (reset_memory) pendant la construction
+            del self._building[user_id]
+            merge(token)
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - start
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def load(self, user_id: str, history: Iterable[HistoryEntry] = ()) -> Optional[ConversationIndex]:
+        """Construit tout de suite l'index de l'utilisateur (préchargement, benchmarks), sans passer par le fond"""
+        index = self._cached(user_id)
+        if index is not None:
+            return index
+        token = []
+        with self._lock:
+            self._building[user_id] = token
+        return self._build(user_id, list(history), token)
+
+    def add(self, user_id: str, entry: HistoryEntry):
+        """Indexe l'échange du tour, si l'index de l'utilisateur est en mémoire ou en construction"""
+        if not _indexable(entry):
+            return
+        with self._lock:
+            self.turns_added += 1
+            index = self._indexes.get(user_id)
+            if index is None:
+                pending = self._building.get(user_id)
+                if pending is not None:
+                    pending.append(entry)
+                return
+        index.add(entry)
+
+    def recall(self, user_id: str, text: str, limit: int = 3, exclude=(), history=()) -> list:
+        """Échanges passés les plus proches de `text`, du plus pertinent au moins pertinent.
+
+        `history` est l'historique récent du profil (pas encore archivé), lu si
+        l'index doit être construit : la recherche ne rend alors rien, le temps
+        de la construction en fond. Les échanges de `exclude` (déjà dans le
+        contexte récent) sont ignorés.
+        """
+        terms = tokenize(text)
+        if not terms or limit <= 0:
+            return []
+        index = self._cached(user_id)
+        if index is None:
+            self._schedule(user_id, history)
+            with self._lock:
+                self.skipped += 1
+            return []
+        start = time.perf_counter()
+        results = index.search(terms, limit, frozenset(entry_key(entry) for entry in exclude))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += elapsed
+            self.max_query_seconds = max(self.max_query_seconds, elapsed)
+        return [index.entries[position] for position, _ in results]
+
+    def forget(self, user_id: str):
+        """Oublie l'index de l'utilisateur, même en construction (ses échanges archivés sont effacés par l'archive)"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            self._building.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """Index en mémoire, constructions depuis l'archive et durée des recherches"""
+        with self._lock:
+            return {
+                "users_loaded": len(self._indexes),
+                "turns_indexed": sum(len(index) for index in self._indexes.values()),
+                "turns_added": self.turns_added,
+                "loads": self.loads,
+                "load_mean_ms": 1000 * self.load_seconds / self.loads if self.loads else 0.0,
+                "pending_builds": len(self._building),
+                "queries": self.queries,
+                "skipped_queries": self.skipped,
+                "query_mean_us": 1e6 * self.query_seconds / self.queries if self.queries else 0.0,
+                "query_max_us": 1e6 * self.max_query_seconds
+            }
+
+    def close(self):
+        """Abandonne les constructions en attente et attend celle en cours"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,189 @@
+# memory_cache.py - Cache LRU/TTL des profils actifs devant un MemoryStore
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from memory_store import MemoryStore, snapshot_memory
+from user_memory import HistoryEntry, UserMemory
+
+logger = logging.getLogger(__name__)
+
+
+class CachedMemoryStore(MemoryStore):
+    """Garde en mémoire les profils des utilisateurs actifs (write-back).
+
+    Les profils modifiés sont marqués sales. Un thread les réécrit dans le
+    backend en un lot toutes les `flush_interval` secondes, et évince au
+    passage les entrées inactives depuis plus de `ttl` secondes. Un profil
+    sale évincé (LRU ou TTL) est gardé à part jusqu'à son écriture, que le
+    thread fait sans attendre. Les écritures et les lectures du backend se
+    font hors du verrou du cache. Les utilisateurs froids sont relus à la
+    demande.
+    """
+
+    def __init__(self, backend: MemoryStore, max_entries: int = 10000, ttl: Optional[float] = 1800,
+                 flush_interval: float = 5.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()  # user_id -> (memory, dernier accès)
+        self._dirty = set()
+        self._evicted = {}  # user_id -> profil sale évincé, en attente d'écriture
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, name="memory-cache", daemon=True)
+        self._thread.start()
+
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        """Profil depuis le cache, sinon depuis le backend"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and not self._expired(entry, now):
+                self.hits += 1
+                self._entries[user_id] = (entry[0], now)
+                self._entries.move_to_end(user_id)
+                return snapshot_memory(entry[0])
+            if entry is not None:
+                self._evict(user_id)
+                self.expirations += 1
+
+            self.misses += 1
+            # Un profil évincé pas encore écrit est plus récent que celui du backend
+            memory = self._evicted.get(user_id)
+            if memory is not None:
+                self._put(user_id, memory, now)
+                return snapshot_memory(memory)
+
+        memory = self.backend.get(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:  # sauvegardé pendant la lecture
+                return snapshot_memory(entry[0])
+            if memory is None:
+                return None
+            self._put(user_id, memory, now)
+            return snapshot_memory(memory)
+
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        """Met à jour le cache ; l'écriture dans le backend est différée"""
+        with self._lock:
+            self._put(user_id, memory, time.monotonic())
+            self._dirty.add(user_id)
+
+    def delete(self, user_id: str):
+        """Supprime du cache et du backend (après l'écriture en cours, qui pourrait le recréer)"""
+        with self._write_lock:
+            with self._lock:
+                self._entries.pop(user_id, None)
+                self._dirty.discard(user_id)
+                self._evicted.pop(user_id, None)
+            self.backend.delete(user_id)
+
+    def flush(self):
+        """Écrit les profils sales puis force l'écriture du backend"""
+        self._write_dirty()
+        self.backend.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self._write_dirty()
+            except Exception:
+                logger.exception("Échec de l'écriture des profils du cache")
+
+    def _write_dirty(self):
+        """Écrit en un seul lot les profils sales et les profils sales évincés, hors du verrou du cache"""
+        with self._write_lock:
+            with self._lock:
+                self._expire_idle(time.monotonic())
+                dirty = {user_id: self._entries[user_id][0] for user_id in self._dirty}
+                self._dirty.clear()
+                batch = {**self._evicted, **dirty}
+            if not batch:
+                return
+            try:
+                self.backend.save_many(batch)
+            except Exception:
+                with self._lock:
+                    for user_id, memory in dirty.items():
+                        if user_id in self._entries:
+                            self._dirty.add(user_id)
+                        else:
+                            self._evicted.setdefault(user_id, memory)
+                raise
+            with self._lock:
+                for user_id, memory in batch.items():
+                    if self._evicted.get(user_id) is memory:
+                        del self._evicted[user_id]
+                self.writes += len(batch)
+
+    def close(self):
+        """Arrête le thread, vide le cache puis ferme le backend"""
+        if not self._stopped:
+            self._stopped = True
+            self._wake.set()
+            self._thread.join()
+        self.flush()
+        self.backend.close()
+
+    def stats(self) -> dict:
+        """Compteurs du cache pour le dimensionnement"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "dirty": len(self._dirty),
+                "evicted_pending": len(self._evicted),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "writes": self.writes
+            }
+
+    def _expired(self, entry: tuple, now: float) -> bool:
+        return self.ttl is not None and now - entry[1] > self.ttl
+
+    def _put(self, user_id: str, memory: UserMemory, now: float):
+        self._entries[user_id] = (memory, now)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+            self.evictions += 1
+
+    def _evict(self, user_id: str):
+        """Retire une entrée du cache ; si elle est sale, le thread l'écrit sans attendre"""
+        memory, _ = self._entries.pop(user_id)
+        if user_id in self._dirty:
+            self._dirty.discard(user_id)
+            self._evicted[user_id] = memory
+            self._wake.set()
+
+    def _expire_idle(self, now: float):
+        """Évince les entrées inactives depuis plus de `ttl` secondes"""
+        if self.ttl is None:
+            return
+        # L'OrderedDict est trié par dernier accès : on s'arrête à la première entrée fraîche
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if not self._expired(entry, now):
+                break
+            self._evict(user_id)
+            self.expirations += 1
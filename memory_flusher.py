@@ -0,0 +1,120 @@
+# memory_flusher.py - Écriture groupée de la mémoire en tâche de fond (group commit)
+import logging
+import threading
+from typing import Optional
+
+from memory_store import MemoryStore, snapshot_memory
+from user_memory import HistoryEntry, UserMemory
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFlushStore(MemoryStore):
+    """Sort la persistance du chemin de réponse.
+
+    `save` et `delete` ne font que marquer l'utilisateur sale et rendent la
+    main immédiatement. Un thread écrit les tours en attente par lots, toutes
+    les `interval_ms` millisecondes ou dès que `max_turns` tours sont en
+    attente. `flush()` force l'écriture, `close()` l'appelle avant l'arrêt.
+    """
+
+    def __init__(self, backend: MemoryStore, interval_ms: float = 50, max_turns: int = 100):
+        self.backend = backend
+        self.interval = interval_ms / 1000
+        self.max_turns = max_turns
+        self._pending = []    # tours dans l'ordre d'arrivée
+        self._latest = {}     # user_id -> dernier tour en attente
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self.batches = 0
+        self.turns_written = 0
+        self._thread = threading.Thread(target=self._run, name="memory-flusher", daemon=True)
+        self._thread.start()
+
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        """Profil en attente d'écriture, sinon lu dans le backend"""
+        with self._lock:
+            turn = self._latest.get(user_id)
+        if turn is not None:
+            return snapshot_memory(turn[1]) if turn[1] is not None else None
+        memory = self.backend.get(user_id)
+        # Copie : le backend peut sérialiser son exemplaire depuis le thread d'écriture
+        return snapshot_memory(memory) if memory is not None else None
+
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        """Marque l'utilisateur sale, l'écriture est différée"""
+        self._enqueue((user_id, snapshot_memory(memory), personal_info, history_entry))
+
+    def save_many(self, memories: dict):
+        for user_id, memory in memories.items():
+            self.save(user_id, memory)
+
+    def delete(self, user_id: str):
+        """Suppression différée, ordonnée avec les sauvegardes"""
+        self._enqueue((user_id, None, None, None))
+
+    def flush(self):
+        """Écrit immédiatement tout ce qui est en attente"""
+        self._write_pending()
+        self.backend.flush()
+
+    def close(self):
+        """Arrête le thread après une dernière écriture, puis ferme le backend"""
+        if not self._stopped:
+            self._stopped = True
+            self._wake.set()
+            self._thread.join()
+        self.flush()
+        self.backend.close()
+
+    def stats(self) -> dict:
+        """Compteurs d'écriture groupée"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_turns": pending,
+            "batches": self.batches,
+            "turns_written": self.turns_written,
+            "avg_batch_size": self.turns_written / self.batches if self.batches else 0.0
+        }
+
+    def _enqueue(self, turn: tuple):
+        with self._lock:
+            self._pending.append(turn)
+            self._latest[turn[0]] = turn
+            if len(self._pending) >= self.max_turns:
+                self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self._write_pending()
+            except Exception:
+                logger.exception("Échec de l'écriture groupée de la mémoire")
+
+    def _write_pending(self):
+        """Écrit le lot en attente ; en cas d'échec il est remis en tête de file"""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                self.backend.write_batch(batch)
+            except Exception:
+                with self._lock:
+                    self._pending = batch + self._pending
+                raise
+
+            with self._lock:
+                for turn in batch:
+                    # Ne pas oublier un tour plus récent arrivé pendant l'écriture
+                    if self._latest.get(turn[0]) is turn:
+                        del self._latest[turn[0]]
+            self.batches += 1
+            self.turns_written += len(batch)
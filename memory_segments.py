@@ -0,0 +1,435 @@
+# memory_segments.py - Backend binaire : segment de profils en ajout seul et index projeté en mémoire
+"""Profils stockés dans un fichier binaire `user_memory.seg`.
+
+Le fichier contient un en-tête (format, génération), puis une suite
+d'enregistrements préfixés par leur longueur :
+
+    [taille u32][crc32 u32][op u8][longueur user_id u16][user_id][profil]
+
+Le profil est la forme compacte de `UserMemory.to_record` en JSON UTF-8.
+L'index `user_memory.seg.idx` contient les hachages 64 bits des user_id,
+triés, suivis des positions des enregistrements. Il est projeté en mémoire
+(mmap) à l'ouverture sans être lu : une recherche est une dichotomie sur
+ses pages, et `get` ne décode que l'enregistrement demandé.
+
+Une mise à jour ajoute la nouvelle version en fin de fichier. Les positions
+écrites depuis le dernier index sont gardées dans un dict, reconstruit à
+l'ouverture en relisant la fin du fichier. Un thread de fond réécrit le
+fichier et son index quand les versions périmées ou les positions hors index
+deviennent trop nombreuses.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from heapq import merge
+from typing import Optional
+
+from memory_store import MemoryStore
+from user_memory import HISTORY_LIMIT, HistoryEntry, UserMemory
+
+logger = logging.getLogger(__name__)
+
+_DATA_HEADER = struct.Struct("<8sQ")  # format, génération
+_DATA_MAGIC = b"CMSEG001"
+_PREFIX = struct.Struct("<II")  # taille de ce qui suit, crc32 de ce qui suit
+_KEY = struct.Struct("<BH")  # opération, longueur du user_id
+_PUT = 1
+_DEL = 2
+
+# Tableaux de l'index dans l'ordre d'octets de la machine (lus sans conversion)
+_INDEX_HEADER = struct.Struct("<8sQQQ")  # format, génération, taille de données couverte, entrées
+_INDEX_MAGIC = b"CMIDX1" + (b"LE" if sys.byteorder == "little" else b"BE")
+
+_DELETED = -1
+
+
+def _hash(user_id: bytes) -> int:
+    return int.from_bytes(blake2b(user_id, digest_size=8).digest(), "little")
+
+
+def _encode(op: int, user_id: bytes, payload: bytes = b"") -> bytes:
+    body = _KEY.pack(op, len(user_id)) + user_id + payload
+    return _PREFIX.pack(len(body), zlib.crc32(body)) + body
+
+
+class SegmentMemoryStore(MemoryStore):
+    """Profils dans un segment binaire en ajout seul, retrouvés par un index mmap.
+
+    Rien n'est décodé à l'ouverture : le coût de démarrage est la projection
+    de l'index et la relecture des enregistrements écrits après lui. Le
+    compactage recopie la dernière version de chaque profil hors verrou ; les
+    tours écrits pendant ce temps sont repris avant le remplacement des
+    fichiers.
+    """
+
+    def __init__(self, data_file: str = "user_memory.seg", index_file: Optional[str] = None,
+                 history_limit: int = HISTORY_LIMIT, compact_ratio: float = 0.5,
+                 compact_min_bytes: int = 1 << 20, unindexed_limit: int = 100000, fsync: bool = False):
+        self.data_file = data_file
+        self.index_file = index_file or f"{data_file}.idx"
+        self.history_limit = history_limit
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.unindexed_limit = unindexed_limit
+        self.fsync = fsync
+        self.records_written = 0
+        self.bytes_written = 0  # enregistrements, segments et index réécrits depuis l'ouverture
+        self.compactions = 0
+        self.compaction_seconds = 0.0
+        self.remaps = 0
+        self.dead_bytes = 0  # versions périmées et suppressions encore dans le fichier
+        # user_id -> position de la dernière version écrite après l'index (_DELETED si supprimé)
+        self._unindexed = {}
+        self._changed = None  # user_id modifiés pendant un compactage en cours
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._open()
+
+        self._closed = False
+        self._wake = threading.Event()
+        self._compactor = threading.Thread(target=self._run_compactor, name="segment-compactor", daemon=True)
+        self._compactor.start()
+        if self._needs_compaction():
+            self._wake.set()
+
+    # Ouverture
+
+    def _open(self):
+        if not os.path.exists(self.data_file) or os.path.getsize(self.data_file) < _DATA_HEADER.size:
+            with open(self.data_file, "wb") as f:
+                f.write(_DATA_HEADER.pack(_DATA_MAGIC, int.from_bytes(os.urandom(8), "little")))
+        self._file = open(self.data_file, "r+b")
+        magic, self.generation = _DATA_HEADER.unpack(self._file.read(_DATA_HEADER.size))
+        if magic != _DATA_MAGIC:
+            self._file.close()
+            raise ValueError(f"Fichier mémoire binaire invalide: {self.data_file}")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._scan(self._map_index())
+        self._file.seek(self._size)
+
+    def _map_index(self) -> int:
+        """Projette l'index s'il correspond au fichier ; renvoie la position jusqu'où il le couvre"""
+        self._index = None
+        self._hashes = self._offsets = array("Q")
+        try:
+            with open(self.index_file, "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return _DATA_HEADER.size
+        if len(index) >= _INDEX_HEADER.size:
+            magic, generation, covered, count = _INDEX_HEADER.unpack_from(index)
+            if (magic == _INDEX_MAGIC and generation == self.generation and covered <= self._size
+                    and len(index) == _INDEX_HEADER.size + 16 * count):
+                self._index = index
+                view = memoryview(index)
+                self._hashes = view[_INDEX_HEADER.size:_INDEX_HEADER.size + 8 * count].cast("Q")
+                self._offsets = view[_INDEX_HEADER.size + 8 * count:].cast("Q")
+                return covered
+        index.close()
+        logger.warning("Index %s périmé ou invalide : relecture complète de %s", self.index_file, self.data_file)
+        return _DATA_HEADER.size
+
+    def _scan(self, offset: int):
+        """Relit les enregistrements écrits après l'index, tronque une écriture interrompue"""
+        data = self._data
+        while offset + _PREFIX.size <= self._size:
+            size, crc = _PREFIX.unpack_from(data, offset)
+            end = offset + _PREFIX.size + size
+            if size < _KEY.size or end > self._size or zlib.crc32(data[offset + _PREFIX.size:end]) != crc:
+                break
+            op, length = _KEY.unpack_from(data, offset + _PREFIX.size)
+            start = offset + _PREFIX.size + _KEY.size
+            self._record_written(data[start:start + length].decode("utf-8"), offset, end - offset, op == _DEL)
+            offset = end
+        if offset < self._size:
+            # Écriture interrompue (crash) : on l'ignore
+            logger.warning("Fin de %s incomplète : %d octets ignorés", self.data_file, self._size - offset)
+            self._data.close()
+            self._file.truncate(offset)
+            self._size = offset
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Lecture
+
+    def _mapped(self, end: int) -> mmap.mmap:
+        """Projection couvrant au moins jusqu'à `end` (les ajouts récents peuvent la dépasser)"""
+        if end > len(self._data):
+            self._data.close()
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.remaps += 1
+        return self._data
+
+    def _record_size(self, offset: int) -> int:
+        return _PREFIX.size + _PREFIX.unpack_from(self._mapped(offset + _PREFIX.size), offset)[0]
+
+    def _record_user(self, offset: int) -> bytes:
+        start = offset + _PREFIX.size + _KEY.size
+        data = self._mapped(start)
+        length = _KEY.unpack_from(data, offset + _PREFIX.size)[1]
+        return self._mapped(start + length)[start:start + length]
+
+    def _locate(self, user_id: str) -> Optional[int]:
+        """Position de la dernière version du profil, None s'il n'existe pas"""
+        offset = self._unindexed.get(user_id)
+        if offset is not None:
+            return offset if offset != _DELETED else None
+        return self._indexed(user_id.encode("utf-8"))
+
+    def _indexed(self, user_id: bytes) -> Optional[int]:
+        key = _hash(user_id)
+        hashes = self._hashes
+        position = bisect_left(hashes, key)
+        while position < len(hashes) and hashes[position] == key:
+            offset = self._offsets[position]
+            if self._record_user(offset) == user_id:
+                return offset
+            position += 1
+        return None
+
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        """Décode le seul enregistrement de l'utilisateur"""
+        with self._lock:
+            offset = self._locate(user_id)
+            if offset is None:
+                return None
+            end = offset + self._record_size(offset)
+            start = offset + _PREFIX.size + _KEY.size + len(user_id.encode("utf-8"))
+            payload = self._mapped(end)[start:end]
+        return UserMemory.from_record(json.loads(payload), self.history_limit)
+
+    # Écriture
+
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        """Ajoute la nouvelle version du profil"""
+        self.write_batch([(user_id, memory, None, None)])
+
+    def save_many(self, memories: dict):
+        """Ajoute plusieurs profils en une seule écriture"""
+        self.write_batch([(user_id, memory, None, None) for user_id, memory in memories.items()])
+
+    def delete(self, user_id: str):
+        """Ajoute une suppression"""
+        self.write_batch([(user_id, None, None, None)])
+
+    def write_batch(self, turns: list):
+        """Ajoute la dernière version de chaque profil du lot (ou sa suppression) en une écriture"""
+        latest = {}
+        for turn in turns:
+            latest[turn[0]] = turn[1]
+        records = [
+            (user_id, None if memory is None else _encode(_PUT, user_id.encode("utf-8"), json.dumps(
+                memory.to_record(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")))
+            for user_id, memory in latest.items()
+        ]
+        with self._lock:
+            chunks = []
+            offset = self._size
+            for user_id, record in records:
+                if record is None:
+                    if self._locate(user_id) is None:
+                        continue
+                    record = _encode(_DEL, user_id.encode("utf-8"))
+                self._record_written(user_id, offset, len(record), record[_PREFIX.size] == _DEL)
+                chunks.append(record)
+                offset += len(record)
+            if not chunks:
+                return
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records_written += len(chunks)
+            self.bytes_written += offset - self._size
+            self._size = offset
+            if self._needs_compaction():
+                self._wake.set()
+
+    def _record_written(self, user_id: str, offset: int, size: int, deleted: bool):
+        """Tient à jour les positions hors index et le volume périmé"""
+        previous = self._locate(user_id)
+        if previous is not None:
+            self.dead_bytes += self._record_size(previous)
+        if deleted:
+            self.dead_bytes += size
+        self._unindexed[user_id] = _DELETED if deleted else offset
+        if self._changed is not None:
+            self._changed.add(user_id)
+
+    # Compactage
+
+    def _needs_compaction(self) -> bool:
+        if len(self._unindexed) >= self.unindexed_limit:
+            return True
+        if self._index is None and self._unindexed:
+            return True  # Premier index : les ouvertures suivantes ne reliront plus tout le fichier
+        return self.dead_bytes >= max(self.compact_min_bytes, self.compact_ratio * self._size)
+
+    def _run_compactor(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.compact()
+            except OSError:
+                logger.exception("Compactage de %s échoué", self.data_file)
+
+    def compact(self):
+        """Réécrit le fichier avec la dernière version de chaque profil, puis son index.
+
+        La recopie se fait depuis une projection figée du fichier, hors verrou.
+        Les profils écrits entre-temps sont repris sous verrou juste avant le
+        remplacement : données puis index, dont la génération doit
+        correspondre (sinon l'index est ignoré et le fichier relu en entier).
+        """
+        with self._compact_lock:
+            with self._lock:
+                end = self._size
+                source = mmap.mmap(self._file.fileno(), end, access=mmap.ACCESS_READ)
+                unindexed = dict(self._unindexed)
+                hashes, offsets = self._hashes, self._offsets
+                generation = self.generation + 1
+                self._changed = set()
+            started = time.perf_counter()
+            tmp_data = f"{self.data_file}.tmp"
+            tmp_index = f"{self.index_file}.tmp"
+            new_hashes, new_offsets = array("Q"), array("Q")
+            try:
+                with open(tmp_data, "w+b", buffering=1 << 20) as out:
+                    out.write(_DATA_HEADER.pack(_DATA_MAGIC, generation))
+                    position = _DATA_HEADER.size
+
+                    def indexed():
+                        for key, offset in zip(hashes, offsets):
+                            start = offset + _PREFIX.size + _KEY.size
+                            length = _KEY.unpack_from(source, offset + _PREFIX.size)[1]
+                            if source[start:start + length].decode("utf-8") not in unindexed:
+                                yield key, offset
+
+                    # Profils de l'index et profils écrits depuis, dans l'ordre des hachages
+                    pending = sorted((_hash(user_id.encode("utf-8")), offset)
+                                     for user_id, offset in unindexed.items() if offset != _DELETED)
+                    for key, offset in merge(indexed(), pending):
+                        size = _PREFIX.size + _PREFIX.unpack_from(source, offset)[0]
+                        out.write(source[offset:offset + size])
+                        new_hashes.append(key)
+                        new_offsets.append(position)
+                        position += size
+
+                    with self._lock:
+                        position = self._catch_up(out, position, new_hashes, new_offsets)
+                        out.flush()
+                        if self.fsync:
+                            os.fsync(out.fileno())
+                        with open(tmp_index, "wb") as f:
+                            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, generation, position, len(new_hashes)))
+                            f.write(new_hashes.tobytes())
+                            f.write(new_offsets.tobytes())
+                            if self.fsync:
+                                os.fsync(f.fileno())
+                        os.replace(tmp_data, self.data_file)
+                        os.replace(tmp_index, self.index_file)
+                        self._swap(generation, position)
+            finally:
+                source.close()
+                with self._lock:
+                    self._changed = None
+                for path in (tmp_data, tmp_index):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self.compactions += 1
+            self.compaction_seconds = time.perf_counter() - started
+            logger.info("%s compacté : %d profils, %d octets en %.2fs", self.data_file, len(new_hashes),
+                        position, self.compaction_seconds)
+
+    def _catch_up(self, out, position: int, hashes: array, offsets: array) -> int:
+        """Reporte dans la copie les profils écrits pendant le compactage (verrou tenu)"""
+        for user_id in self._changed:
+            name = user_id.encode("utf-8")
+            key = _hash(name)
+            slot = bisect_left(hashes, key)
+            while slot < len(hashes) and hashes[slot] == key:
+                out.seek(offsets[slot] + _PREFIX.size + _KEY.size)
+                if out.read(len(name)) == name:
+                    break
+                slot += 1
+            else:
+                slot = None
+            out.seek(position)
+
+            latest = self._unindexed[user_id]
+            if latest == _DELETED:
+                if slot is not None:
+                    del hashes[slot]
+                    del offsets[slot]
+                continue
+            size = self._record_size(latest)
+            out.write(self._mapped(latest + size)[latest:latest + size])
+            if slot is not None:
+                offsets[slot] = position
+            else:
+                slot = bisect_left(hashes, key)
+                hashes.insert(slot, key)
+                offsets.insert(slot, position)
+            position += size
+        return position
+
+    def _swap(self, generation: int, size: int):
+        """Bascule sur le fichier et l'index réécrits (verrou tenu)"""
+        self._data.close()
+        self._file.close()
+        if self._index is not None:
+            self._hashes.release()
+            self._offsets.release()
+            self._index.close()
+        self.bytes_written += size + os.path.getsize(self.index_file)
+        self._file = open(self.data_file, "r+b")
+        self.generation = generation
+        self._size = size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._map_index()
+        self._file.seek(size)
+        self._unindexed = {}
+        self.dead_bytes = 0
+
+    def stats(self) -> dict:
+        """Taille du fichier, volume périmé, profils indexés ou non, compactages"""
+        with self._lock:
+            return {
+                "file_bytes": self._size,
+                "dead_bytes": self.dead_bytes,
+                "indexed": len(self._hashes),
+                "unindexed": len(self._unindexed),
+                "records_written": self.records_written,
+                "bytes_written": self.bytes_written,
+                "compactions": self.compactions,
+                "compaction_seconds": self.compaction_seconds,
+                "remaps": self.remaps
+            }
+
+    def close(self):
+        """Arrête le compacteur et ferme le fichier et l'index"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._compactor.join()
+        with self._lock:
+            self._data.close()
+            self._file.close()
+            if self._index is not None:
+                self._hashes.release()
+                self._offsets.release()
+                self._index.close()
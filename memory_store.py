@@ -0,0 +1,436 @@
+# memory_store.py - Persistance de la mémoire utilisateur (backends JSON journalisé, SQLite et binaire)
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from user_memory import HISTORY_LIMIT, HistoryEntry, UserMemory
+
+
+def new_user_memory() -> UserMemory:
+    """Profil par défaut d'un nouvel utilisateur"""
+    return UserMemory()
+
+
+def snapshot_memory(memory: UserMemory) -> UserMemory:
+    """Copie d'un profil, indépendante des mutations ultérieures du tour suivant.
+
+    Les entrées d'historique ne sont jamais modifiées après ajout : copier
+    les conteneurs suffit.
+    """
+    return memory.copy()
+
+
+def apply_record(memories: dict, record: dict, history_limit: int = HISTORY_LIMIT):
+    """Applique un enregistrement du journal sur le dictionnaire des mémoires"""
+    user_id = record["u"]
+    if record["op"] == "del":
+        memories.pop(user_id, None)
+        return
+    if record["op"] == "put":
+        memories[user_id] = UserMemory.from_dict(record["m"], history_limit)
+        return
+
+    memory = memories.get(user_id)
+    if memory is None:
+        memory = memories[user_id] = UserMemory(history_limit=history_limit)
+    memory.intimacy_level = record["i"]
+    memory.interaction_count = record["n"]
+    memory.personal_info.update(record.get("p", {}))
+    if "h" in record:
+        memory.conversation_history.append(HistoryEntry.from_dict(record["h"]))
+
+
+def _load_profile(data: dict, history_limit: int = HISTORY_LIMIT):
+    """object_hook de json.load : chaque profil est compacté dès sa lecture"""
+    if isinstance(data.get("conversation_history"), list) and "interaction_count" in data:
+        return UserMemory.from_dict(data, history_limit)
+    return data
+
+
+class MemoryStore(ABC):
+    """Interface de persistance des profils utilisateurs.
+
+    `get` renvoie le profil d'un utilisateur (ou None s'il est inconnu),
+    `save` persiste le profil après un tour, `delete` l'efface. Les backends
+    reçoivent aussi le delta du tour (infos personnelles, entrée d'historique)
+    et peuvent s'en servir pour n'écrire que ce qui a changé.
+
+    Le profil renvoyé par `get` est une copie propre au tour en cours : il
+    peut être modifié sans verrou pendant que d'autres threads écrivent, et
+    le store n'y touche plus une fois passé à `save`.
+    """
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        """Profil de l'utilisateur, None s'il est inconnu"""
+
+    @abstractmethod
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        """Persiste le profil après un tour (avec le delta du tour s'il est fourni)"""
+
+    def save_many(self, memories: dict):
+        """Sauvegarde plusieurs profils complets"""
+        for user_id, memory in memories.items():
+            self.save(user_id, memory)
+
+    @abstractmethod
+    def delete(self, user_id: str):
+        """Efface le profil de l'utilisateur"""
+
+    def write_batch(self, turns: list):
+        """Écrit un lot de tours `(user_id, memory, personal_info, history_entry)`.
+
+        `memory` à None signifie une suppression. Par défaut seul l'état final
+        de chaque utilisateur est écrit.
+        """
+        latest = {}
+        for turn in turns:
+            latest[turn[0]] = turn[1]
+        for user_id, memory in latest.items():
+            if memory is None:
+                self.delete(user_id)
+        self.save_many({user_id: memory for user_id, memory in latest.items() if memory is not None})
+
+    def flush(self):
+        """Force l'écriture de ce qui est en attente"""
+
+    def close(self):
+        """Libère les ressources du backend"""
+
+
+class JournaledMemoryStore(MemoryStore):
+    """Mémoire persistée en snapshot JSON + journal d'écritures en ajout seul.
+
+    Chaque tour ajoute une ligne compacte (delta) au journal : le coût d'écriture
+    ne dépend que de la taille du tour. Le snapshot complet n'est réécrit qu'au
+    compactage, déclenché tous les `compact_every` enregistrements.
+    """
+
+    def __init__(self, snapshot_file: str = "user_memory.json", journal_file: Optional[str] = None,
+                 history_limit: int = HISTORY_LIMIT, compact_every: int = 1000, fsync: bool = False):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file or f"{snapshot_file}.journal"
+        self.history_limit = history_limit
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.memories = {}
+        self._journal = None
+        self._pending_records = 0
+        self.bytes_written = 0  # journal et snapshots écrits depuis l'ouverture
+        self.compactions = 0
+        # Verrou d'écriture du store (réentrant : l'ajout au journal peut compacter)
+        self._lock = threading.RLock()
+
+    def load(self) -> dict:
+        """Charge le snapshot puis rejoue le journal"""
+        with self._lock:
+            replay_files = self._recover_compaction()
+
+            try:
+                with open(self.snapshot_file, 'r') as f:
+                    self.memories = json.load(f, object_hook=lambda data: _load_profile(data, self.history_limit))
+            except FileNotFoundError:
+                self.memories = {}
+
+            self._pending_records = sum(self._replay_journal(path) for path in replay_files)
+            return self.memories
+
+    def _recover_compaction(self) -> list:
+        """Termine ou annule un compactage interrompu, renvoie les journaux à rejouer"""
+        tmp_file = f"{self.snapshot_file}.tmp"
+        done_file = f"{self.journal_file}.done"
+
+        if os.path.exists(done_file):
+            if os.path.exists(tmp_file):
+                # Le snapshot n'a pas été remplacé : l'ancien journal reste à rejouer
+                os.remove(tmp_file)
+                return [done_file, self.journal_file]
+            os.remove(done_file)
+        elif os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return [self.journal_file]
+
+    def _replay_journal(self, path: str) -> int:
+        """Rejoue un journal, tronque une éventuelle dernière ligne incomplète"""
+        replayed = 0
+        valid_size = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Écriture interrompue (crash) : on l'ignore
+                    if line.strip():
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break
+                        apply_record(self.memories, record, self.history_limit)
+                        replayed += 1
+                    valid_size += len(line)
+        except FileNotFoundError:
+            return 0
+
+        if valid_size < os.path.getsize(path):
+            os.truncate(path, valid_size)
+        return replayed
+
+    def _append(self, record: dict):
+        """Ajoute un enregistrement au journal"""
+        self._append_many([record])
+
+    def _append_many(self, records: list):
+        """Ajoute des enregistrements au journal en une seule écriture"""
+        data = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records
+        ).encode("utf-8")
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_file, 'ab')
+            self._journal.write(data)
+            self.bytes_written += len(data)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+            self._pending_records += len(records)
+            if self.compact_every and self._pending_records >= self.compact_every:
+                self.compact()
+
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        """Copie du profil en mémoire (tout le fichier est chargé au démarrage)"""
+        with self._lock:
+            memory = self.memories.get(user_id)
+            return snapshot_memory(memory) if memory is not None else None
+
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        """Enregistre le profil et journalise le delta du tour (ou le profil complet)"""
+        record = self._turn_record(user_id, memory, personal_info, history_entry)
+        with self._lock:
+            self.memories[user_id] = memory
+            self._append(record)
+
+    def write_batch(self, turns: list):
+        """Journalise un lot de tours en une seule écriture (group commit)"""
+        records = []
+        with self._lock:
+            for user_id, memory, personal_info, history_entry in turns:
+                if memory is None:
+                    if self.memories.pop(user_id, None) is not None:
+                        records.append({"op": "del", "u": user_id})
+                else:
+                    self.memories[user_id] = memory
+                    records.append(self._turn_record(user_id, memory, personal_info, history_entry))
+            if records:
+                self._append_many(records)
+
+    def _turn_record(self, user_id: str, memory: UserMemory, personal_info: Optional[dict],
+                     history_entry: Optional[HistoryEntry]) -> dict:
+        """Enregistrement delta d'un tour (ou profil complet si le delta est inconnu)"""
+        if personal_info is None and history_entry is None:
+            return {"op": "put", "u": user_id, "m": memory.to_dict()}
+        record = {
+            "op": "turn",
+            "u": user_id,
+            "i": memory.intimacy_level,
+            "n": memory.interaction_count
+        }
+        if personal_info:
+            record["p"] = personal_info
+        if history_entry is not None:
+            record["h"] = history_entry.to_dict()
+        return record
+
+    def delete(self, user_id: str):
+        """Supprime l'utilisateur et journalise la suppression"""
+        with self._lock:
+            if self.memories.pop(user_id, None) is not None:
+                self._append({"op": "del", "u": user_id})
+
+    def compact(self):
+        """Écrit un snapshot complet puis repart d'un journal vide.
+
+        Ordre : snapshot temporaire, journal renommé en `.done`, remplacement
+        atomique du snapshot, suppression de `.done`. `load` sait reprendre
+        après un arrêt à n'importe quelle étape sans rejouer deux fois un tour.
+        """
+        tmp_file = f"{self.snapshot_file}.tmp"
+        done_file = f"{self.journal_file}.done"
+
+        with self._lock:
+            with open(tmp_file, 'w') as f:
+                # Même mise en page que json.dump(indent=2), un profil converti à la fois
+                f.write("{\n")
+                for index, (user_id, memory) in enumerate(self.memories.items()):
+                    if index:
+                        f.write(",\n")
+                    f.write(json.dumps({user_id: memory.to_dict()}, indent=2)[2:-2])
+                f.write("\n}")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.bytes_written += os.path.getsize(tmp_file)
+            self.compactions += 1
+
+            self.close()
+            if os.path.exists(self.journal_file):
+                os.replace(self.journal_file, done_file)
+            os.replace(tmp_file, self.snapshot_file)
+            if os.path.exists(done_file):
+                os.remove(done_file)
+            self._pending_records = 0
+
+    def stats(self) -> dict:
+        """Volume écrit (journal et snapshots) et compactages"""
+        with self._lock:
+            return {
+                "users": len(self.memories),
+                "journal_records": self._pending_records,
+                "compactions": self.compactions,
+                "bytes_written": self.bytes_written
+            }
+
+    def close(self):
+        """Ferme le journal"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+class SqliteMemoryStore(MemoryStore):
+    """Profils stockés ligne par ligne dans SQLite (mode WAL).
+
+    Rien n'est chargé au démarrage : un profil est lu quand l'utilisateur parle
+    et réécrit par un simple upsert de sa ligne.
+    """
+
+    def __init__(self, db_file: str = "user_memory.db"):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_memory ("
+            " user_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self.rows_written = 0
+        self.bytes_written = 0  # profils JSON envoyés à SQLite (hors pages et WAL)
+
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        """Lit la ligne de l'utilisateur"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM user_memory WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return UserMemory.from_dict(json.loads(row[0])) if row else None
+
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        """Upsert de la ligne de l'utilisateur"""
+        self.save_many({user_id: memory})
+
+    def save_many(self, memories: dict):
+        """Upsert de plusieurs profils dans une seule transaction"""
+        self.write_batch([(user_id, memory, None, None) for user_id, memory in memories.items()])
+
+    def write_batch(self, turns: list):
+        """Upserts et suppressions d'un lot dans une seule transaction"""
+        latest = {}
+        for turn in turns:
+            latest[turn[0]] = turn[1]
+        now = time.time()
+        upserts = [
+            (user_id, json.dumps(memory.to_dict(), ensure_ascii=False, separators=(",", ":")), now)
+            for user_id, memory in latest.items() if memory is not None
+        ]
+        deletes = [(user_id,) for user_id, memory in latest.items() if memory is None]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO user_memory (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                upserts
+            )
+            self._conn.executemany("DELETE FROM user_memory WHERE user_id = ?", deletes)
+            self._conn.commit()
+            self.rows_written += len(upserts)
+            self.bytes_written += sum(len(data.encode("utf-8")) for _, data, _ in upserts)
+
+    def delete(self, user_id: str):
+        """Supprime la ligne de l'utilisateur"""
+        with self._lock:
+            self._conn.execute("DELETE FROM user_memory WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Lignes et volume JSON écrits"""
+        with self._lock:
+            return {"rows_written": self.rows_written, "bytes_written": self.bytes_written}
+
+    def close(self):
+        """Ferme la connexion"""
+        with self._lock:
+            self._conn.close()
+
+
+def create_memory_store(backend: str = "json", memory_file: str = "user_memory.json",
+                        cache_size: int = 10000, cache_ttl: Optional[float] = 1800,
+                        flush_interval_ms: float = 0, flush_max_turns: int = 100, metrics=None) -> MemoryStore:
+    """Construit le backend de mémoire demandé ("json", "sqlite" ou "segment").
+
+    Les backends à chargement paresseux sont précédés d'un cache LRU/TTL des
+    profils actifs (`cache_size=0` pour le désactiver). Le backend JSON garde
+    déjà tous les profils en mémoire et n'en a pas besoin.
+    Avec `flush_interval_ms > 0`, les écritures sont faites par lots depuis un
+    thread de fond au lieu du chemin de réponse.
+    Avec `metrics` (registre de metrics.py), la durée de chaque opération du
+    backend est mesurée.
+    """
+    if backend == "json":
+        store = JournaledMemoryStore(memory_file)
+        store.load()
+    elif backend == "sqlite":
+        db_file = f"{os.path.splitext(memory_file)[0]}.db"
+        is_new = not os.path.exists(db_file)
+        store = SqliteMemoryStore(db_file)
+        # Première utilisation : reprise des profils du fichier JSON existant
+        if is_new and os.path.exists(memory_file):
+            legacy = JournaledMemoryStore(memory_file)
+            store.save_many(legacy.load())
+            legacy.close()
+    elif backend == "segment":
+        from memory_segments import SegmentMemoryStore
+        data_file = f"{os.path.splitext(memory_file)[0]}.seg"
+        is_new = not os.path.exists(data_file)
+        store = SegmentMemoryStore(data_file)
+        if is_new and os.path.exists(memory_file):
+            legacy = JournaledMemoryStore(memory_file)
+            store.save_many(legacy.load())
+            legacy.close()
+            store.compact()
+    else:
+        raise ValueError(f"Backend mémoire inconnu: {backend}")
+
+    if metrics is not None:
+        from metrics import TimedMemoryStore
+        store = TimedMemoryStore(store, metrics)
+    if flush_interval_ms:
+        from memory_flusher import BackgroundFlushStore
+        store = BackgroundFlushStore(store, interval_ms=flush_interval_ms, max_turns=flush_max_turns)
+    if backend != "json" and cache_size:
+        from memory_cache import CachedMemoryStore
+        store = CachedMemoryStore(store, max_entries=cache_size, ttl=cache_ttl)
+    # Écriture de ce qui est encore en attente (cache, lot en cours) à l'arrêt du process
+    atexit.register(store.flush)
+    return store
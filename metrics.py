@@ -0,0 +1,351 @@
+# metrics.py - Mesures du chemin de réponse : durées par étape, tailles, erreurs, écritures
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from memory_store import MemoryStore
+from user_memory import HistoryEntry, UserMemory
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes : secondes (de 100 µs à 10 s) et caractères
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+
+class Histogram:
+    """Histogramme à bornes fixes (compteurs par intervalle, somme, total)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple = TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # dernier intervalle : au-delà de la plus grande borne
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimation par la borne supérieure de l'intervalle atteint"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, total_sum = list(self.counts), self.count, self.sum
+        return {
+            "count": total,
+            "sum": total_sum,
+            "mean": total_sum / total if total else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts))
+        }
+
+
+class _StageTimer:
+    """Chronomètre d'une étape (`with metrics.time("étape"):`)"""
+
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Metrics:
+    """Registre des mesures d'un compagnon.
+
+    Assez léger pour rester actif en production : une mesure coûte deux
+    lectures d'horloge, une recherche dichotomique et un verrou non contendu.
+    Les histogrammes et compteurs sont créés au premier usage. Les
+    statistiques des composants (fournisseurs, cache, disjoncteurs…) ne sont
+    lues qu'à l'export, via les fonctions enregistrées par `collect`.
+
+    `render()` produit le format texte de Prometheus, `snapshot()` un dict
+    sérialisable en JSON.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "companion"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}  # (nom, labels) -> Histogram
+        self._counters = {}    # (nom, labels) -> valeur
+        self._collectors = {}  # nom -> fonction renvoyant des statistiques
+        self._stages = {}      # étape -> Histogram (raccourci du chemin de réponse)
+
+    def histogram(self, name: str, buckets: tuple = TIME_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def stage(self, stage: str) -> Histogram:
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            histogram = self._stages.setdefault(stage, self.histogram("stage_seconds", stage=stage))
+        return histogram
+
+    def time(self, stage: str):
+        """Durée d'une étape du tour, dans `stage_seconds{stage=…}`"""
+        if not self.enabled:
+            return _NO_TIMER
+        return _StageTimer(self.stage(stage))
+
+    def observe_stage(self, stage: str, seconds: float):
+        """Durée d'une étape mesurée par l'appelant"""
+        if self.enabled:
+            self.stage(stage).observe(seconds)
+
+    def observe(self, name: str, value: float, buckets: tuple = TIME_BUCKETS, **labels):
+        if self.enabled:
+            self.histogram(name, buckets, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def collect(self, name: str, stats: Callable[[], object]):
+        """Statistiques d'un composant, lues à chaque export"""
+        self._collectors[name] = stats
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        collected = {}
+        for name, stats in list(self._collectors.items()):
+            try:
+                collected[name] = stats()
+            except Exception as e:
+                collected[name] = {"error": str(e)}
+        return {
+            "timestamp": time.time(),
+            "histograms": [
+                {"name": name, "labels": dict(labels), **histogram.snapshot()}
+                for (name, labels), histogram in histograms
+            ],
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in counters],
+            "components": collected
+        }
+
+    def render(self) -> str:
+        """Format texte d'exposition Prometheus"""
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            counters = sorted(self._counters.items(), key=lambda item: item[0])
+        lines = []
+        declared = set()
+        for (name, labels), histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            with histogram._lock:
+                counts, total, total_sum = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, count in zip([*map(repr, histogram.buckets), "+Inf"], counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total_sum}")
+            lines.append(f"{metric}_count{_labels(labels)} {total}")
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        for name, stats in list(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception:
+                logger.exception("Statistiques %s illisibles", name)
+                continue
+            for metric, labels, value in _flatten(f"{self.prefix}_{name}", values, ()):
+                if metric not in declared:
+                    declared.add(metric)
+                    lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _flatten(name: str, value, labels: tuple):
+    """(métrique, labels, valeur) pour chaque nombre d'une statistique de composant.
+
+    Les clés texte prolongent le nom, les clés numériques (codes HTTP)
+    deviennent le label `code`, et les éléments d'une liste sont distingués
+    par leur champ `provider`.
+    """
+    if isinstance(value, bool):
+        yield name, labels, int(value)
+    elif isinstance(value, (int, float)):
+        yield name, labels, value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(key, str) and not key.isdigit():
+                yield from _flatten(f"{name}_{key}", item, labels)
+            else:
+                yield from _flatten(name, item, labels + (("code", key),))
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            if isinstance(item, dict) and "provider" in item:
+                item_labels = labels + (("provider", item["provider"]),)
+                yield from _flatten(name, {k: v for k, v in item.items() if k != "provider"}, item_labels)
+
+
+class TimedMemoryStore(MemoryStore):
+    """Durée des opérations d'un backend de mémoire, dans `store_seconds{op=…}`.
+
+    Placé directement autour du backend : avec l'écriture en tâche de fond,
+    `write_batch` mesure donc le temps réel d'écriture d'un lot.
+    """
+
+    def __init__(self, backend: MemoryStore, metrics: Metrics):
+        self.backend = backend
+        self.metrics = metrics
+
+    def get(self, user_id: str) -> Optional[UserMemory]:
+        with self._time("get"):
+            return self.backend.get(user_id)
+
+    def save(self, user_id: str, memory: UserMemory, personal_info: Optional[dict] = None,
+             history_entry: Optional[HistoryEntry] = None):
+        with self._time("save"):
+            self.backend.save(user_id, memory, personal_info, history_entry)
+
+    def save_many(self, memories: dict):
+        with self._time("save_many"):
+            self.backend.save_many(memories)
+
+    def delete(self, user_id: str):
+        with self._time("delete"):
+            self.backend.delete(user_id)
+
+    def write_batch(self, turns: list):
+        with self._time("write_batch"):
+            self.backend.write_batch(turns)
+        self.metrics.observe("store_batch_turns", len(turns), SIZE_BUCKETS)
+
+    def flush(self):
+        with self._time("flush"):
+            self.backend.flush()
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> dict:
+        return self.backend.stats() if hasattr(self.backend, "stats") else {}
+
+    def _time(self, op: str):
+        if not self.metrics.enabled:
+            return _NO_TIMER
+        return _StageTimer(self.metrics.histogram("store_seconds", op=op))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics: Metrics = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.metrics.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(self.metrics.snapshot(), ensure_ascii=False, default=str).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format, *args)
+
+
+def serve_metrics(metrics: Metrics, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Expose `/metrics` (Prometheus) et `/metrics.json` dans un thread de fond"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Métriques exposées sur http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def dump_metrics(metrics: Metrics, path: str, interval: float = 60) -> threading.Thread:
+    """Écrit `snapshot()` en JSON dans `path` toutes les `interval` secondes"""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            tmp_path = f"{path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(metrics.snapshot(), f, ensure_ascii=False, default=str)
+                os.replace(tmp_path, path)
+            except Exception:
+                logger.exception("Échec de l'écriture des métriques dans %s", path)
+
+    thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,112 @@
+# model_warmup.py - Préchauffage des modèles au démarrage et maintien en mémoire
+import logging
+import threading
+import time
+from typing import Optional
+
+from ai_providers import ProviderError
+
+logger = logging.getLogger(__name__)
+
+PENDING, WARMING, READY, FAILED = "en attente", "chargement", "prêt", "erreur"
+_ICONS = {PENDING: "⚪", WARMING: "🟡", READY: "🟢", FAILED: "🔴"}
+
+
+class ModelWarmup:
+    """Sort le chargement des modèles du premier tour utilisateur.
+
+    `start()` lance en tâche de fond, pour chaque fournisseur, le chargement
+    du modèle et une génération d'amorçage minimale. Ensuite, toutes les
+    `keep_alive_interval` secondes, les fournisseurs qui le permettent
+    (Ollama) reçoivent une requête de maintien pour que le modèle ne soit pas
+    déchargé pendant les périodes calmes. `wait()` permet de n'ouvrir le
+    serveur qu'une fois les modèles prêts.
+    """
+
+    def __init__(self, providers: dict, keep_alive_interval: float = 240, timeout: float = 120):
+        self.providers = providers  # nom -> ProviderClient
+        self.keep_alive_interval = keep_alive_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._status = {name: {"state": PENDING, "load_seconds": None, "error": None, "last_keep_alive": None}
+                        for name in providers}
+        self._warmed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Préchauffage puis maintien, dans un thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Attend la fin du préchauffage (réussi ou non)"""
+        return self._warmed.wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def warm_up(self):
+        """Charge et amorce chaque modèle, l'un après l'autre"""
+        for name, provider in self.providers.items():
+            self._update(name, state=WARMING, error=None)
+            start = time.perf_counter()
+            try:
+                provider.warm_up(self.timeout)
+            except ProviderError as e:
+                logger.warning("Préchauffage de %s impossible : %s", name, e)
+                self._update(name, state=FAILED, error=str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            logger.info("Modèle %s prêt en %.1fs", name, elapsed)
+            self._update(name, state=READY, load_seconds=elapsed)
+        self._warmed.set()
+
+    def keep_warm(self):
+        """Maintien en mémoire (un fournisseur en erreur est retenté à chaque passage)"""
+        for name, provider in self.providers.items():
+            try:
+                if provider.keeps_warm:
+                    provider.keep_warm(self.timeout)
+                elif self.status(name)["state"] == FAILED:
+                    provider.warm_up(self.timeout)
+                else:
+                    continue
+            except ProviderError as e:
+                self._update(name, state=FAILED, error=str(e))
+                continue
+            self._update(name, state=READY, error=None, last_keep_alive=time.time())
+
+    def status(self, name: str) -> dict:
+        with self._lock:
+            return dict(self._status[name])
+
+    def stats(self) -> list:
+        with self._lock:
+            return [{"provider": name, **status} for name, status in self._status.items()]
+
+    def status_text(self) -> str:
+        """Résumé d'une ligne pour l'interface"""
+        parts = []
+        for status in self.stats():
+            text = f"{_ICONS[status['state']]} {status['provider']} : {status['state']}"
+            if status["state"] == READY and status["load_seconds"] is not None:
+                text += f" ({status['load_seconds']:.1f}s)"
+            elif status["state"] == FAILED:
+                text += f" — {status['error'][:80]}"
+            parts.append(text)
+        return " · ".join(parts)
+
+    def _update(self, name: str, **fields):
+        with self._lock:
+            self._status[name].update(fields)
+
+    def _run(self):
+        self.warm_up()
+        if self.keep_alive_interval <= 0:
+            return
+        while not self._stopped.wait(self.keep_alive_interval):
+            self.keep_warm()
@@ -0,0 +1,102 @@
+# ollama_context.py - Réutilisation du contexte Ollama d'un tour à l'autre
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class OllamaSession:
+    """Contexte Ollama d'un tour.
+
+    Avec des tokens valides, seul le nouveau message est envoyé : le prompt
+    système et l'historique sont déjà dans le contexte. Le contexte renvoyé
+    par Ollama n'est conservé que si le tour est encore ouvert (une réponse
+    arrivée après l'échéance n'a pas été montrée à l'utilisateur).
+    """
+
+    __slots__ = ("_contexts", "user_id", "system_key", "turn_prompt", "context", "_closed")
+
+    def __init__(self, contexts: "OllamaContexts", user_id: str, system_key: str, turn_prompt: str,
+                 context: Optional[List[int]]):
+        self._contexts = contexts
+        self.user_id = user_id
+        self.system_key = system_key
+        self.turn_prompt = turn_prompt
+        self.context = context
+        self._closed = False
+
+    def prompt(self, full_prompt: str) -> str:
+        """Prompt à envoyer : le message seul si le contexte est repris"""
+        return self.turn_prompt if self.context else full_prompt
+
+    def on_context(self, context: List[int]):
+        if not self._closed:
+            self._contexts.put(self.user_id, self.system_key, context)
+
+    def close(self):
+        self._closed = True
+
+
+class OllamaContexts:
+    """Tokens de contexte Ollama par utilisateur, gardés en mémoire du processus.
+
+    Le contexte est retiré à chaque tour (`take`) et n'est remis que par une
+    génération Ollama réussie : un tour servi autrement (chemin rapide,
+    cache, autre fournisseur, échéance) l'invalide. Il est aussi invalidé
+    quand le prompt système change (palier d'intimité ou informations
+    personnelles) ou dépasse `max_tokens`.
+    """
+
+    def __init__(self, max_users: int = 1000, max_tokens: int = 4096):
+        self.max_users = max_users
+        self.max_tokens = max_tokens
+        self._entries = OrderedDict()  # user_id -> (clé du prompt système, tokens)
+        self._lock = threading.Lock()
+        self.reuses = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.tokens_reused = 0
+
+    def session(self, user_id: str, system_key: str, turn_prompt: str) -> OllamaSession:
+        return OllamaSession(self, user_id, system_key, turn_prompt, self.take(user_id, system_key))
+
+    def take(self, user_id: str, system_key: str) -> Optional[List[int]]:
+        """Retire le contexte de l'utilisateur ; None s'il n'est plus valable"""
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != system_key:
+                self.invalidations += 1
+                return None
+            self.reuses += 1
+            self.tokens_reused += len(entry[1])
+            return entry[1]
+
+    def put(self, user_id: str, system_key: str, context: List[int]):
+        with self._lock:
+            if len(context) > self.max_tokens:
+                # Trop long pour la fenêtre du modèle : prochain tour reconstruit
+                self.invalidations += 1
+                self._entries.pop(user_id, None)
+                return
+            self._entries[user_id] = (system_key, context)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.reuses + self.misses + self.invalidations
+            return {
+                "users": len(self._entries),
+                "reuses": self.reuses,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "reuse_rate": self.reuses / lookups if lookups else 0.0,
+                "tokens_reused": self.tokens_reused
+            }
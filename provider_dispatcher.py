@@ -0,0 +1,390 @@
+# provider_dispatcher.py - Plusieurs fournisseurs IA : requêtes doublées et disjoncteurs
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Iterator, List, Optional
+
+from ai_providers import ProviderError
+from turn_deadline import time_left
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Disjoncteur d'un fournisseur.
+
+    Après `failure_threshold` échecs consécutifs le circuit s'ouvre : le
+    fournisseur est ignoré pendant `reset_timeout` secondes. Une seule requête
+    d'essai passe ensuite (semi-ouvert) ; son succès referme le circuit, son
+    échec le rouvre.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Le fournisseur peut-il recevoir une requête maintenant ?"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release(self):
+        """Requête abandonnée sans résultat : libère l'essai en cours"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def _record_failure(breaker: CircuitBreaker):
+    """Échec d'un appel ; une requête coupée à l'échéance du tour ne compte pas contre le fournisseur"""
+    if time_left() == 0:
+        breaker.release()
+    else:
+        breaker.record_failure()
+
+
+class LatencyWindow:
+    """Latences des derniers appels réussis, pour estimer le p95"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """None tant qu'il y a trop peu de mesures"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ProviderDispatcher:
+    """Liste ordonnée de fournisseurs vue comme un seul fournisseur.
+
+    Le premier fournisseur au circuit fermé reçoit la requête. S'il n'a pas
+    répondu après sa latence p95 (`hedge_after` secondes tant qu'il n'y a pas
+    assez de mesures), la même requête part vers le suivant et la première
+    réponse arrivée gagne. Un fournisseur en échec passe immédiatement la
+    main au suivant. La requête perdante se termine en arrière-plan et compte
+    quand même pour la latence et le disjoncteur.
+
+    `agenerate` et `astream` appliquent les mêmes règles avec des tâches
+    asyncio et les méthodes asynchrones des fournisseurs.
+    """
+
+    name = "auto"
+
+    def __init__(self, clients: dict, hedge: bool = True, hedge_after: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30, max_workers: int = 16):
+        self.clients = clients  # nom -> client (generate/stream), dans l'ordre de préférence
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_timeout) for name in clients}
+        self.latencies = {name: LatencyWindow() for name in clients}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider-dispatch")
+        self._stats_lock = threading.Lock()
+        self.calls = {name: 0 for name in clients}
+        self.wins = {name: 0 for name in clients}
+        self.hedges = 0
+        self.failovers = 0
+        self._background = set()  # requêtes asynchrones perdantes encore en cours
+
+    def available(self) -> List[str]:
+        """Fournisseurs dont le circuit n'est pas ouvert, dans l'ordre"""
+        return [name for name in self.clients if self.breakers[name].state != CircuitBreaker.OPEN]
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.latencies[name].percentile(0.95)
+        return p95 if p95 is not None else self.hedge_after
+
+    def generate(self, prompt: str) -> str:
+        """Réponse du premier fournisseur sain à répondre"""
+        candidates = iter(self.available())
+        running = {}  # future -> nom
+        last_error = None
+
+        def launch() -> bool:
+            for name in candidates:
+                if self.breakers[name].allow():
+                    # Contexte copié : l'échéance du tour borne aussi les requêtes doublées
+                    context = contextvars.copy_context()
+                    running[self._executor.submit(context.run, self._call, name, prompt)] = name
+                    return True
+            return False
+
+        if not launch():
+            raise ProviderError("Aucun fournisseur IA disponible (circuits ouverts)")
+        exhausted = False
+        while running:
+            latest = list(running.values())[-1]
+            timeout = self.hedge_delay(latest) if self.hedge and not exhausted else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Fournisseur lent : requête doublée vers le suivant
+                if launch():
+                    with self._stats_lock:
+                        self.hedges += 1
+                    logger.debug("Requête doublée après %.2fs sur %s", timeout, latest)
+                else:
+                    exhausted = True
+                continue
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                except ProviderError as e:
+                    last_error = e
+                    continue
+                with self._stats_lock:
+                    self.wins[name] += 1
+                return result
+            # Échec : fournisseur suivant sans attendre
+            if launch():
+                with self._stats_lock:
+                    self.failovers += 1
+            else:
+                exhausted = True
+        raise last_error or ProviderError("Aucun fournisseur IA disponible")
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Streaming sans doublement : bascule vers le suivant si un fournisseur
+        échoue avant d'avoir produit du texte"""
+        last_error = None
+        for name in self.available():
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            with self._stats_lock:
+                self.calls[name] += 1
+            started = False
+            try:
+                for chunk in self.clients[name].stream(prompt):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                # Flux abandonné par l'appelant : pas un échec du fournisseur
+                breaker.release()
+                raise
+            except ProviderError as e:
+                _record_failure(breaker)
+                if started:
+                    raise
+                last_error = e
+                with self._stats_lock:
+                    self.failovers += 1
+                continue
+            except Exception as e:
+                _record_failure(breaker)
+                logger.exception("Échec inattendu du fournisseur %s", name)
+                if started:
+                    raise ProviderError(f"Erreur {name}: {e}") from e
+                last_error = ProviderError(f"Erreur {name}: {e}")
+                with self._stats_lock:
+                    self.failovers += 1
+                continue
+            except BaseException:
+                # Interruption (KeyboardInterrupt...) : l'essai du disjoncteur est rendu
+                breaker.release()
+                raise
+            breaker.record_success()
+            with self._stats_lock:
+                self.wins[name] += 1
+            return
+        raise last_error or ProviderError("Aucun fournisseur IA disponible (circuits ouverts)")
+
+    async def agenerate(self, prompt: str) -> str:
+        """Version asynchrone de generate"""
+        candidates = iter(self.available())
+        running = {}  # tâche -> nom
+        last_error = None
+
+        def launch() -> bool:
+            for name in candidates:
+                if self.breakers[name].allow():
+                    running[asyncio.ensure_future(self._acall(name, prompt))] = name
+                    return True
+            return False
+
+        if not launch():
+            raise ProviderError("Aucun fournisseur IA disponible (circuits ouverts)")
+        exhausted = False
+        try:
+            while running:
+                latest = list(running.values())[-1]
+                timeout = self.hedge_delay(latest) if self.hedge and not exhausted else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        with self._stats_lock:
+                            self.hedges += 1
+                    else:
+                        exhausted = True
+                    continue
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        result = task.result()
+                    except ProviderError as e:
+                        last_error = e
+                        continue
+                    with self._stats_lock:
+                        self.wins[name] += 1
+                    return result
+                if launch():
+                    with self._stats_lock:
+                        self.failovers += 1
+                else:
+                    exhausted = True
+        finally:
+            # Les perdantes se terminent en arrière-plan (latence et disjoncteur)
+            for task in running:
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        raise last_error or ProviderError("Aucun fournisseur IA disponible")
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Version asynchrone de stream"""
+        last_error = None
+        for name in self.available():
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            with self._stats_lock:
+                self.calls[name] += 1
+            started = False
+            try:
+                async for chunk in self.clients[name].astream(prompt):
+                    started = True
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                breaker.release()
+                raise
+            except ProviderError as e:
+                breaker.record_failure()
+                if started:
+                    raise
+                last_error = e
+                with self._stats_lock:
+                    self.failovers += 1
+                continue
+            except Exception as e:
+                breaker.record_failure()
+                logger.exception("Échec inattendu du fournisseur %s", name)
+                if started:
+                    raise ProviderError(f"Erreur {name}: {e}") from e
+                last_error = ProviderError(f"Erreur {name}: {e}")
+                with self._stats_lock:
+                    self.failovers += 1
+                continue
+            except BaseException:
+                # Interruption (KeyboardInterrupt...) : l'essai du disjoncteur est rendu
+                breaker.release()
+                raise
+            breaker.record_success()
+            with self._stats_lock:
+                self.wins[name] += 1
+            return
+        raise last_error or ProviderError("Aucun fournisseur IA disponible (circuits ouverts)")
+
+    def stats(self) -> dict:
+        providers = []
+        for name in self.clients:
+            p95 = self.latencies[name].percentile(0.95)
+            with self._stats_lock:
+                providers.append({
+                    "provider": name,
+                    "state": self.breakers[name].state,
+                    "trips": self.breakers[name].trips,
+                    "calls": self.calls[name],
+                    "wins": self.wins[name],
+                    "p95_ms": 1000 * p95 if p95 is not None else None
+                })
+        with self._stats_lock:
+            return {"hedges": self.hedges, "failovers": self.failovers, "providers": providers}
+
+    def _call(self, name: str, prompt: str) -> str:
+        """Appel d'un fournisseur, compté pour sa latence et son disjoncteur"""
+        with self._stats_lock:
+            self.calls[name] += 1
+        start = time.perf_counter()
+        try:
+            result = self.clients[name].generate(prompt)
+        except ProviderError:
+            _record_failure(self.breakers[name])
+            raise
+        except Exception as e:
+            _record_failure(self.breakers[name])
+            logger.exception("Échec inattendu du fournisseur %s", name)
+            raise ProviderError(f"Erreur {name}: {e}") from e
+        self.latencies[name].add(time.perf_counter() - start)
+        self.breakers[name].record_success()
+        return result
+
+    async def _acall(self, name: str, prompt: str) -> str:
+        with self._stats_lock:
+            self.calls[name] += 1
+        start = time.perf_counter()
+        try:
+            result = await self.clients[name].agenerate(prompt)
+        except ProviderError:
+            self.breakers[name].record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.breakers[name].release()
+            raise
+        except Exception as e:
+            self.breakers[name].record_failure()
+            logger.exception("Échec inattendu du fournisseur %s", name)
+            raise ProviderError(f"Erreur {name}: {e}") from e
+        self.latencies[name].add(time.perf_counter() - start)
+        self.breakers[name].record_success()
+        return result
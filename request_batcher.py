@@ -0,0 +1,156 @@
+# request_batcher.py - Regroupement des requêtes IA de plusieurs utilisateurs (micro-batching)
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import AsyncIterator, List, Optional
+
+from ai_providers import ProviderClient, ProviderError
+from turn_deadline import time_left
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingPrompt:
+    """Prompt en attente d'un lot, et le résultat rendu à l'appelant"""
+
+    __slots__ = ("prompt", "queued_at", "future")
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.queued_at = time.perf_counter()
+        self.future = Future()
+
+
+class RequestBatcher:
+    """Regroupe les prompts arrivant en même temps en un seul appel fournisseur.
+
+    `generate()` bloque l'appelant comme un appel direct (`agenerate()`
+    l'attend sans bloquer la boucle d'événements). Un thread collecte
+    les prompts pendant au plus `max_wait_ms` millisecondes après le premier,
+    ou jusqu'à `max_batch` prompts, puis envoie le lot avec
+    `provider.generate_batch()` et rend à chaque appelant sa réponse. Jusqu'à
+    `max_in_flight` lots peuvent être en cours en même temps.
+    """
+
+    def __init__(self, provider: ProviderClient, max_batch: int = 8, max_wait_ms: float = 5,
+                 max_in_flight: int = 4):
+        self.provider = provider
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight,
+                                            thread_name_prefix=f"{provider.name}-batch")
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.prompts = 0
+        self.largest_batch = 0
+        self.queue_delay = 0.0      # secondes cumulées entre arrivée et envoi
+        self.max_queue_delay = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"{provider.name}-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    def generate(self, prompt: str) -> str:
+        """Réponse au prompt, générée dans un lot avec les prompts simultanés (attendue jusqu'à l'échéance du tour)"""
+        try:
+            return self._submit(prompt).result(timeout=time_left())
+        except FutureTimeout:
+            raise ProviderError(f"Lot {self.provider.name} hors délai") from None
+
+    async def agenerate(self, prompt: str) -> str:
+        return await asyncio.wrap_future(self._submit(prompt))
+
+    def stream(self, prompt: str):
+        """Le streaming reste une requête par utilisateur"""
+        return self.provider.stream(prompt)
+
+    def astream(self, prompt: str) -> AsyncIterator[str]:
+        return self.provider.astream(prompt)
+
+    def _submit(self, prompt: str) -> Future:
+        pending = _PendingPrompt(prompt)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("RequestBatcher fermé")
+            self._queue.append(pending)
+            self._cond.notify()
+        return pending.future
+
+    def stats(self) -> dict:
+        """Taille des lots et attente avant envoi"""
+        with self._cond:
+            queued = len(self._queue)
+        with self._stats_lock:
+            return {
+                "provider": self.provider.name,
+                "queued": queued,
+                "batches": self.batches,
+                "prompts": self.prompts,
+                "avg_batch_size": self.prompts / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "max_batch": self.max_batch,
+                "avg_queue_delay_ms": 1000 * self.queue_delay / self.prompts if self.prompts else 0.0,
+                "max_queue_delay_ms": 1000 * self.max_queue_delay
+            }
+
+    def close(self):
+        """Envoie les prompts en attente puis arrête le thread"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _next_batch(self) -> Optional[List[_PendingPrompt]]:
+        """Attend un premier prompt, puis le lot complet ou la fin du délai"""
+        with self._cond:
+            while not self._queue:
+                if self._stopped:
+                    return None
+                self._cond.wait()
+            deadline = self._queue[0].queued_at + self.max_wait
+            while len(self._queue) < self.max_batch and not self._stopped:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._record(batch)
+            self._executor.submit(self._send, batch)
+
+    def _record(self, batch: List[_PendingPrompt]):
+        now = time.perf_counter()
+        delays = [now - pending.queued_at for pending in batch]
+        with self._stats_lock:
+            self.batches += 1
+            self.prompts += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.queue_delay += sum(delays)
+            self.max_queue_delay = max(self.max_queue_delay, max(delays))
+
+    def _send(self, batch: List[_PendingPrompt]):
+        try:
+            results = self.provider.generate_batch([pending.prompt for pending in batch])
+        except Exception as e:
+            if not isinstance(e, ProviderError):
+                logger.exception("Échec d'un lot de %d prompts", len(batch))
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        for pending, result in zip(batch, results):
+            pending.future.set_result(result)
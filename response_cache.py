@@ -0,0 +1,78 @@
+# response_cache.py - Cache des réponses IA pour les messages courants
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from text_analysis import normalize_text
+
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+def intimacy_band(intimacy_level: float) -> int:
+    """Palier d'intimité (0 formel … 4 très intime), mêmes seuils que les prompts"""
+    for band, threshold in enumerate((1.5, 2.5, 3.5, 4.5)):
+        if intimacy_level <= threshold:
+            return band
+    return 4
+
+
+def normalize_for_key(text: str) -> str:
+    """Forme canonique d'un texte : minuscules sans accents, ponctuation et espaces réduits"""
+    return _NON_WORD.sub(" ", normalize_text(text)[2]).strip()
+
+
+class ResponseCache:
+    """Cache LRU/TTL des réponses brutes du modèle.
+
+    Les ouvertures fréquentes ("bonjour", "merci", "salut") d'utilisateurs
+    sans contexte personnel produisent presque le même prompt : la réponse
+    déjà générée est réutilisée au lieu d'un aller-retour vers le fournisseur.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clé -> (réponse, date d'insertion)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response: str):
+        with self._lock:
+            self._entries[key] = (response, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,41 @@
+# response_templates.py - Réponses à base de règles par intention et niveau d'intimité
+from typing import Optional
+
+# Intention -> [(intimité maximale, réponse)], du plus formel au plus intime ;
+# None : message sans intention reconnue
+TEMPLATES = {
+    "greeting": [
+        (1.5, "Comment puis-je vous aider aujourd'hui ?"),
+        (3, "Comment ça va ? Quoi de neuf ?"),
+        (5.0, "Hey ! Content de te revoir ! Comment tu te sens aujourd'hui ?")
+    ],
+    "sadness": [
+        (2, "Je suis désolé d'apprendre que vous traversez une période difficile."),
+        (3.5, "Oh non, ça me fait de la peine de savoir que tu ne vas pas bien. Tu veux en parler ?"),
+        (5.0, "Mon cœur se serre de te voir comme ça... Je suis là pour toi. Dis-moi tout.")
+    ],
+    "happiness": [
+        (2, "C'est merveilleux d'entendre que tout va bien pour vous !"),
+        (3.5, "Ça me fait plaisir de te voir si heureux ! Raconte-moi !"),
+        (5.0, "Ton bonheur fait chaud au cœur ! J'adore te voir rayonner comme ça !")
+    ],
+    "thanks": [
+        (2, "Je vous en prie, c'est avec plaisir que je vous aide."),
+        (3.5, "De rien ! C'est normal, on est là pour s'entraider !"),
+        (5.0, "Ça me touche que tu me remercies... Notre amitié compte tellement pour moi !")
+    ],
+    None: [
+        (1.5, "C'est intéressant ce que vous me dites. Pouvez-vous m'en dire davantage ?"),
+        (3, "Ah je vois ! Dis-moi en plus, ça m'intéresse."),
+        (5.0, "J'écoute avec attention... Continue, tu sais que je suis toujours là pour toi.")
+    ]
+}
+
+
+def template_response(intent: Optional[str], intimacy_level: float) -> str:
+    """Réponse prédéfinie pour l'intention, au registre du niveau d'intimité"""
+    levels = TEMPLATES.get(intent, TEMPLATES[None])
+    for max_intimacy, response in levels:
+        if intimacy_level <= max_intimacy:
+            return response
+    return levels[-1][1]
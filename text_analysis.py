@@ -0,0 +1,217 @@
+# text_analysis.py - Analyse des messages en une passe (regex en trie de préfixes sur texte normalisé)
+import re
+import unicodedata
+from typing import Optional
+
+# Éléments personnels : catégorie -> expressions, par ordre de priorité
+PERSONAL_MARKERS = {
+    "nom": ["je m'appelle", "je suis", "mon nom"],
+    "humeur": ["je me sens", "je suis triste", "je suis heureux", "je suis content"],
+    "activité": ["je travaille", "je fais", "j'étudie"],
+    "lieu": ["je vis à", "j'habite", "je suis de"],
+    "famille": ["ma famille", "mes parents", "mon mari", "ma femme"],
+    "loisirs": ["j'aime", "je pratique", "mon hobby"]
+}
+
+# Déclencheurs d'intimité : catégorie -> expressions
+INTIMACY_TRIGGERS = {
+    "confidence": ["je te fais confiance", "tu peux m'aider", "j'ai besoin de toi"],
+    "personal": ["c'est personnel", "entre nous", "en confidence"],
+    "emotional": ["je me sens", "j'ai peur", "je suis inquiet", "ça me rend"],
+    "gratitude": ["merci", "tu m'aides", "grâce à toi"],
+    "problems": ["j'ai un problème", "je ne sais pas quoi faire", "aide-moi"]
+}
+
+INTIMACY_WEIGHTS = {
+    "confidence": 0.3,
+    "personal": 0.2,
+    "emotional": 0.15,
+    "gratitude": 0.1,
+    "problems": 0.25
+}
+
+# Intentions reconnues, dans l'ordre de priorité du routage
+INTENT_KEYWORDS = {
+    "greeting": ["bonjour", "salut", "hello", "coucou"],
+    "sadness": ["triste", "déprimé", "mal", "difficile"],
+    "happiness": ["heureux", "content", "joie", "super", "génial"],
+    "thanks": ["merci", "remercie"]
+}
+
+_APOSTROPHES = "’‘ʼ`´′"
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_char_cache = {}
+
+
+def _normalize_char(char: str) -> tuple:
+    """(minuscule, minuscule sans accent) d'un caractère, un caractère chacun"""
+    cached = _char_cache.get(char)
+    if cached is None:
+        if char in _APOSTROPHES:
+            cached = ("'", "'")
+        elif char == "\u00a0":
+            cached = (" ", " ")
+        else:
+            lower = char.lower()[:1] or char
+            base = unicodedata.normalize("NFD", lower)
+            cached = (lower, base[0] if not unicodedata.combining(base[0]) else lower)
+        _char_cache[char] = cached
+    return cached
+
+
+def normalize_text(text: str) -> tuple:
+    """Renvoie (texte NFC, texte en minuscules, texte sans accents), de même longueur.
+
+    Garder la même longueur permet de relire dans le texte d'origine les
+    positions trouvées dans le texte normalisé.
+    """
+    if not unicodedata.is_normalized("NFC", text):
+        text = unicodedata.normalize("NFC", text)
+    lower = text.lower()
+    if len(lower) != len(text):
+        # Rare (ex. "İ") : conversion caractère par caractère
+        lower = "".join(_normalize_char(char)[0] for char in text)
+    if "`" in lower:
+        lower = lower.replace("`", "'")
+    if lower.isascii():
+        return text, lower, lower
+
+    # Seuls les quelques caractères non ASCII distincts sont remplacés
+    folded = lower
+    for char in set(_NON_ASCII.findall(lower)):
+        char_lower, char_folded = _normalize_char(char)
+        if char_lower != char:
+            lower = lower.replace(char, char_lower)
+        if char_folded != char:
+            folded = folded.replace(char, char_folded)
+    return text, lower, folded
+
+
+class ScanResult:
+    """Résultat d'une analyse : première occurrence par (table, catégorie)"""
+
+    __slots__ = ("text", "_best")
+
+    def __init__(self, text: str, best: dict):
+        self.text = text
+        self._best = best  # (table, catégorie) -> (rang de l'expression, position)
+
+    def has(self, table: str, category: str) -> bool:
+        return (table, category) in self._best
+
+    def first_match(self, table: str, category: str) -> Optional[int]:
+        """Position de la première expression (par priorité) trouvée pour la catégorie"""
+        hit = self._best.get((table, category))
+        return hit[1] if hit else None
+
+
+class KeywordMatcher:
+    """Plusieurs tables de mots-clés compilées une fois en un seul motif.
+
+    Une regex unique (préfixes factorisés en arbre) repère en une passe les
+    positions où commence au moins une expression ; seules les expressions
+    partageant les 4 premiers caractères sont ensuite vérifiées à ces positions,
+    y compris chevauchantes ("je suis" et "je suis triste"). Le coût par
+    message dépend du nombre d'occurrences, presque pas du nombre d'expressions.
+
+    La comparaison ignore la casse, le type d'apostrophe et les accents omis
+    par l'utilisateur ("ca me rend" trouve "ça me rend"), mais un accent
+    présent dans le message doit correspondre ("je suis dé…" ne trouve pas
+    "je suis de").
+    """
+
+    def __init__(self, tables: dict):
+        entries = []  # (expression repliée, clé, rang, expression en minuscules)
+        for table, categories in tables.items():
+            for category, expressions in categories.items():
+                for rank, expr in enumerate(expressions):
+                    _, lower, folded = normalize_text(expr)
+                    entries.append((folded, (table, category), rank, lower))
+
+        # Expressions regroupées par leurs 4 premiers caractères (ou moins si plus courtes)
+        self._buckets = {}
+        trie = {}
+        for entry in entries:
+            self._buckets.setdefault(entry[0][:4], []).append(entry)
+            node = trie
+            for char in entry[0]:
+                node = node.setdefault(char, {})
+            node[None] = True
+
+        first_chars = "".join(sorted(char for char in trie if char is not None))
+        self._starts = re.compile(f"(?=[{re.escape(first_chars)}])(?={self._trie_regex(trie)})")
+        self._key_lengths = sorted({len(key) for key in self._buckets})
+
+    @classmethod
+    def _trie_regex(cls, node: dict) -> str:
+        """Alternative factorisée par préfixes communs.
+
+        Seul le début d'une expression est recherché : dès qu'une expression
+        est complète, le reste de la branche est inutile.
+        """
+        if None in node:
+            return ""
+        branches = [re.escape(char) + cls._trie_regex(child)
+                    for char, child in node.items() if char is not None]
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    def scan(self, text: str) -> ScanResult:
+        """Analyse le message en une passe"""
+        text, lower, folded = normalize_text(text)
+        buckets = self._buckets
+        best = {}
+        for match in self._starts.finditer(folded):
+            start = match.start()
+            for key_length in self._key_lengths:
+                for expr_folded, key, rank, expr in buckets.get(folded[start:start + key_length], ()):
+                    if not folded.startswith(expr_folded, start):
+                        continue
+                    hit = best.get(key)
+                    # Même règle que l'ancien parcours : expression la plus prioritaire, première occurrence
+                    if (hit is None or rank < hit[0]) and self._accents_match(expr, lower, folded, start):
+                        best[key] = (rank, start)
+        return ScanResult(text, best)
+
+    @staticmethod
+    def _accents_match(expr: str, lower: str, folded: str, start: int) -> bool:
+        """Un caractère accentué du message doit être identique dans l'expression"""
+        end = start + len(expr)
+        if lower[start:end] == folded[start:end]:
+            return True
+        return all(t == e or t == f for t, e, f in zip(lower[start:end], expr, folded[start:end]))
+
+
+MESSAGE_MATCHER = KeywordMatcher({
+    "marker": PERSONAL_MARKERS,
+    "intimacy": INTIMACY_TRIGGERS,
+    "intent": INTENT_KEYWORDS
+})
+
+
+def scan_message(text: str) -> ScanResult:
+    """Analyse un message avec les tables du compagnon"""
+    return MESSAGE_MATCHER.scan(text)
+
+
+def personal_markers(scan: ScanResult) -> dict:
+    """Éléments personnels : contexte de 80 caractères autour de l'expression"""
+    found_info = {}
+    for category in PERSONAL_MARKERS:
+        start = scan.first_match("marker", category)
+        if start is not None:
+            found_info[category] = scan.text[start:start+80].strip()
+    return found_info
+
+
+def intimacy_boost(scan: ScanResult) -> float:
+    """Augmentation d'intimité (max 0.5 points par interaction)"""
+    boost = sum(weight for category, weight in INTIMACY_WEIGHTS.items() if scan.has("intimacy", category))
+    return min(boost, 0.5)
+
+
+def detect_intent(scan: ScanResult) -> Optional[str]:
+    """Première intention reconnue dans l'ordre de priorité, sinon None"""
+    for intent in INTENT_KEYWORDS:
+        if scan.has("intent", intent):
+            return intent
+    return None
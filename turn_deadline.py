@@ -0,0 +1,216 @@
+# turn_deadline.py - Budget de temps par tour et repli sur les réponses prédéfinies
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional
+
+
+# Échéance (time.monotonic) de l'appel modèle en cours, vue par les clients HTTP du thread de travail
+_model_expires = contextvars.ContextVar("model_expires", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Le budget du tour est épuisé"""
+
+
+def time_left() -> Optional[float]:
+    """Secondes restantes pour l'appel modèle en cours (jamais négatif), None hors échéance"""
+    expires = _model_expires.get()
+    if expires is None:
+        return None
+    return max(0.0, expires - time.monotonic())
+
+
+def _bounded_context(expires: float) -> contextvars.Context:
+    """Contexte du thread de travail, où `time_left()` borne les requêtes à l'échéance"""
+    context = contextvars.copy_context()
+    context.run(_model_expires.set, expires)
+    return context
+
+
+class Deadline:
+    """Échéance d'un tour ; `budget` None = pas de limite"""
+
+    __slots__ = ("started", "expires")
+
+    def __init__(self, budget: Optional[float]):
+        self.started = time.monotonic()
+        self.expires = self.started + budget if budget else None
+
+    def remaining(self) -> Optional[float]:
+        """Secondes restantes (jamais négatif), None sans limite"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+class DeadlinePolicy:
+    """Applique l'échéance d'un tour aux appels modèle.
+
+    L'appel tourne dans un thread de travail ; l'appelant n'attend que le
+    temps restant, moins `reserve` secondes gardées pour le style et la
+    persistance. Le thread voit l'échéance (`time_left()`) : les clients
+    HTTP y bornent leurs délais de connexion et de lecture, la requête d'un
+    fournisseur lent est donc coupée à l'échéance au lieu d'occuper le thread
+    jusqu'à son propre délai. Un appel encore en file est annulé, et un flux
+    est arrêté au morceau suivant. Le tour se replie alors sur la réponse
+    prédéfinie. Si le temps restant est inférieur à `min_model_budget`, le
+    modèle n'est pas appelé du tout. `acall` et `aiterate` font de même pour
+    les coroutines, sans thread : la tâche ou le flux est annulé à l'échéance.
+    """
+
+    def __init__(self, budget: Optional[float] = 8.0, min_model_budget: float = 0.5,
+                 reserve: float = 0.05, max_workers: int = 16):
+        self.budget = budget
+        self.min_model_budget = min_model_budget
+        self.reserve = reserve
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="turn-deadline")
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.skipped = 0    # budget insuffisant avant l'appel
+        self.overruns = 0   # appel interrompu à l'échéance
+        self.overshoot = 0.0  # pire dépassement observé du budget (secondes)
+
+    def start(self) -> Deadline:
+        with self._lock:
+            self.turns += 1
+        return Deadline(self.budget)
+
+    def model_budget(self, deadline: Deadline) -> Optional[float]:
+        """Temps accordé à l'appel modèle ; DeadlineExceeded s'il ne tient plus"""
+        remaining = deadline.remaining()
+        if remaining is None:
+            return None
+        budget = remaining - self.reserve
+        if budget < self.min_model_budget:
+            with self._lock:
+                self.skipped += 1
+            raise DeadlineExceeded(f"{remaining:.2f}s restantes")
+        return budget
+
+    def allows_model(self, deadline: Deadline) -> bool:
+        """False si le modèle ne peut plus être appelé : le prompt (souvenirs compris) n'est alors pas construit"""
+        try:
+            self.model_budget(deadline)
+        except DeadlineExceeded:
+            return False
+        return True
+
+    def call(self, deadline: Deadline, fn: Callable, *args):
+        """fn(*args) dans le temps restant du tour"""
+        budget = self.model_budget(deadline)
+        if budget is None:
+            return fn(*args)
+        context = _bounded_context(time.monotonic() + budget)
+        future = self._executor.submit(context.run, fn, *args)
+        try:
+            return future.result(timeout=budget)
+        except FutureTimeout:
+            future.cancel()  # encore en file : jamais lancé
+            self._overrun()
+            raise DeadlineExceeded(f"appel modèle > {budget:.2f}s") from None
+
+    def iterate(self, deadline: Deadline, chunks: Iterable[str]) -> Iterator[str]:
+        """Morceaux d'un flux tant que le tour est dans les temps"""
+        budget = self.model_budget(deadline)
+        if budget is None:
+            yield from chunks
+            return
+        expires = time.monotonic() + budget
+        buffer = queue.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        break
+                    buffer.put(chunk)
+            except BaseException as e:  # relancée côté appelant
+                buffer.put(e)
+            finally:
+                # Flux interrompu : libère la connexion du fournisseur
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+            buffer.put(done)
+
+        self._executor.submit(_bounded_context(expires).run, pump)
+        try:
+            while True:
+                try:
+                    item = buffer.get(timeout=max(0.0, expires - time.monotonic()))
+                except queue.Empty:
+                    self._overrun()
+                    raise DeadlineExceeded(f"flux modèle > {budget:.2f}s") from None
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    async def acall(self, deadline: Deadline, fn: Callable[..., Awaitable], *args):
+        """await fn(*args) dans le temps restant du tour"""
+        budget = self.model_budget(deadline)
+        if budget is None:
+            return await fn(*args)
+        try:
+            # La tâche est annulée à l'échéance (requête httpx fermée)
+            return await asyncio.wait_for(fn(*args), budget)
+        except asyncio.TimeoutError:
+            self._overrun()
+            raise DeadlineExceeded(f"appel modèle > {budget:.2f}s") from None
+
+    async def aiterate(self, deadline: Deadline, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Morceaux d'un flux asynchrone tant que le tour est dans les temps"""
+        budget = self.model_budget(deadline)
+        iterator = chunks.__aiter__()
+        expires = time.monotonic() + budget if budget is not None else None
+        try:
+            while True:
+                try:
+                    if expires is None:
+                        chunk = await iterator.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), max(0.0, expires - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self._overrun()
+                    raise DeadlineExceeded(f"flux modèle > {budget:.2f}s") from None
+                yield chunk
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def record_turn(self, deadline: Deadline):
+        """Dépassement éventuel du budget sur le tour complet"""
+        if self.budget:
+            with self._lock:
+                self.overshoot = max(self.overshoot, deadline.elapsed() - self.budget)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "turns": self.turns,
+                "skipped": self.skipped,
+                "overruns": self.overruns,
+                "degraded_ratio": (self.skipped + self.overruns) / self.turns if self.turns else 0.0,
+                "max_overshoot_ms": max(0.0, 1000 * self.overshoot)
+            }
+
+    def _overrun(self):
+        with self._lock:
+            self.overruns += 1
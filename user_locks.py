@@ -0,0 +1,73 @@
+# user_locks.py - Verrous par utilisateur pour servir les sessions en parallèle
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+
+class UserLocks:
+    """Un verrou par utilisateur actif.
+
+    Les tours d'un même utilisateur sont sérialisés, ceux d'utilisateurs
+    différents s'exécutent en parallèle. Un verrou n'existe que tant qu'un
+    thread le détient ou l'attend : le registre ne grossit pas avec le nombre
+    d'utilisateurs.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}  # user_id -> [verrou, nombre de détenteurs/attentes]
+
+    @contextmanager
+    def hold(self, user_id: str):
+        """Détient le verrou de l'utilisateur pendant le bloc"""
+        entry = self._register(user_id)
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            self._unregister(user_id, entry)
+
+    @asynccontextmanager
+    async def hold_async(self, user_id: str):
+        """Comme `hold`, sans bloquer la boucle d'événements pendant l'attente.
+
+        Même verrou que `hold` : tours synchrones et asynchrones d'un même
+        utilisateur restent sérialisés entre eux.
+        """
+        entry = self._register(user_id)
+        if not entry[0].acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(entry[0].acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # Le thread obtiendra quand même le verrou : il est rendu aussitôt
+                def release(_):
+                    entry[0].release()
+                    self._unregister(user_id, entry)
+                acquiring.add_done_callback(release)
+                raise
+        try:
+            yield
+        finally:
+            entry[0].release()
+            self._unregister(user_id, entry)
+
+    def _register(self, user_id: str) -> list:
+        with self._guard:
+            entry = self._locks.get(user_id)
+            if entry is None:
+                entry = self._locks[user_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        return entry
+
+    def _unregister(self, user_id: str, entry: list):
+        with self._guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    def active_users(self) -> int:
+        """Nombre d'utilisateurs dont un tour est en cours ou en attente"""
+        with self._guard:
+            return len(self._locks)
@@ -0,0 +1,340 @@
+# user_memory.py - Représentation compacte d'un profil utilisateur en mémoire
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+HISTORY_LIMIT = 10
+
+# Horodatages : microsecondes depuis 1970, en heure locale naïve comme datetime.now()
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Couples (préfixe, suffixe) de style partagés entre toutes les entrées
+_FRAMES = {}
+_FRAMES_LIMIT = 4096
+
+# Textes courts partagés entre les entrées (réponses prédéfinies, salutations…) :
+# au-delà de la limite, les nouveaux textes ne sont plus partagés. Les messages
+# utilisateur, rarement identiques, ne le sont que s'ils sont très courts.
+_TEXTS = {}
+_TEXTS_LIMIT = 65536
+_SHARED_RESPONSE_MAX = 160
+_SHARED_MESSAGE_MAX = 24
+
+# Niveaux d'intimité partagés (le JSON relu crée un float par entrée)
+_LEVELS = {}
+_LEVELS_LIMIT = 4096
+
+_ENTRY_KEYS = frozenset(("timestamp", "user", "assistant", "intimacy_level"))
+_RAW_ENTRY_KEYS = _ENTRY_KEYS | {"ai_raw"}
+_PROFILE_KEYS = frozenset(("intimacy_level", "interaction_count", "personal_info", "conversation_history",
+                           "emotional_state"))
+
+
+def timestamp_now() -> int:
+    return (datetime.now() - _EPOCH) // _MICROSECOND
+
+
+def parse_timestamp(text):
+    """Horodatage ISO en entier, ou le texte tel quel s'il ne se réécrit pas à l'identique"""
+    try:
+        value = (datetime.fromisoformat(text) - _EPOCH) // _MICROSECOND
+    except (TypeError, ValueError):
+        return text
+    return value if format_timestamp(value) == text else text
+
+
+def format_timestamp(value) -> str:
+    if isinstance(value, int):
+        return (_EPOCH + timedelta(microseconds=value)).isoformat()
+    return value
+
+
+def _shared_frame(prefix: str, suffix: str) -> tuple:
+    frame = (prefix, suffix)
+    shared = _FRAMES.get(frame)
+    if shared is None:
+        if len(_FRAMES) >= _FRAMES_LIMIT:
+            return frame
+        shared = _FRAMES.setdefault(frame, frame)
+    return shared
+
+
+def _shared_text(text: str, max_length: int = _SHARED_RESPONSE_MAX) -> str:
+    if len(text) > max_length:
+        return text
+    shared = _TEXTS.get(text)
+    if shared is None:
+        if len(_TEXTS) >= _TEXTS_LIMIT:
+            return text
+        shared = _TEXTS.setdefault(text, text)
+    return shared
+
+
+def _shared_level(level):
+    # Floats positifs seulement : 1 et 1.0, 0.0 et -0.0 s'écrivent différemment en JSON
+    if type(level) is not float or not level > 0.0:
+        return level
+    shared = _LEVELS.get(level)
+    if shared is None:
+        if len(_LEVELS) >= _LEVELS_LIMIT:
+            return level
+        shared = _LEVELS.setdefault(level, level)
+    return shared
+
+
+class HistoryEntry:
+    """Échange de l'historique, immuable une fois créé.
+
+    Les textes courts sont partagés entre entrées identiques. La réponse
+    stylée est le plus souvent `préfixe + texte brut + suffixe` :
+    seul le texte brut est gardé (`text`), avec le couple d'affixes partagé
+    entre les entrées (`frame`). Trois cas :
+
+    - `frame` None : pas de texte brut, `text` est la réponse ;
+    - `frame` tuple : `text` est le texte brut (`ai_raw`), la réponse est recomposée ;
+    - `frame` str : le texte brut, absent de la réponse (vouvoiement appliqué),
+      `text` étant la réponse.
+
+    Une entrée qui ne suit pas le format habituel (clé manquante ou inconnue)
+    garde son dict d'origine dans `original`, restitué tel quel.
+    """
+
+    __slots__ = ("timestamp", "user", "text", "frame", "intimacy_level", "original")
+
+    def __init__(self, timestamp, user: str, text: str, frame=None, intimacy_level: float = 1.0,
+                 original: Optional[dict] = None):
+        self.timestamp = timestamp
+        self.user = user
+        self.text = text
+        self.frame = frame
+        self.intimacy_level = intimacy_level
+        self.original = original
+
+    @classmethod
+    def create(cls, user: str, assistant: str, intimacy_level: float,
+               ai_raw: Optional[str] = None, timestamp=None) -> "HistoryEntry":
+        if timestamp is None:
+            timestamp = timestamp_now()
+        user = _shared_text(user, _SHARED_MESSAGE_MAX)
+        intimacy_level = _shared_level(intimacy_level)
+        if ai_raw is None:
+            return cls(timestamp, user, _shared_text(assistant), None, intimacy_level)
+        start = assistant.find(ai_raw)
+        if start < 0:
+            text, frame = assistant, _shared_text(ai_raw)
+        else:
+            text, frame = ai_raw, _shared_frame(assistant[:start], assistant[start + len(ai_raw):])
+        return cls(timestamp, user, _shared_text(text), frame, intimacy_level)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HistoryEntry":
+        keys = data.keys()
+        usual = (
+            (keys == _ENTRY_KEYS or keys == _RAW_ENTRY_KEYS)
+            and type(data["user"]) is str
+            and type(data["assistant"]) is str
+            and type(data.get("ai_raw", "")) is str
+        )
+        if not usual:
+            return cls(data.get("timestamp"), data.get("user"), data.get("assistant"),
+                       None, data.get("intimacy_level"), original=dict(data))
+        return cls.create(data["user"], data["assistant"], data["intimacy_level"],
+                          data.get("ai_raw"), parse_timestamp(data["timestamp"]))
+
+    @property
+    def assistant(self) -> str:
+        if isinstance(self.frame, tuple):
+            return f"{self.frame[0]}{self.text}{self.frame[1]}"
+        return self.text
+
+    @property
+    def ai_raw(self) -> Optional[str]:
+        if isinstance(self.frame, tuple):
+            return self.text
+        return self.frame
+
+    def to_dict(self) -> dict:
+        """Format JSON historique de l'entrée"""
+        if self.original is not None:
+            return dict(self.original)
+        data = {
+            "timestamp": format_timestamp(self.timestamp),
+            "user": self.user,
+            "assistant": self.assistant,
+            "intimacy_level": self.intimacy_level
+        }
+        if self.frame is not None:
+            data["ai_raw"] = self.ai_raw
+        return data
+
+    def to_record(self):
+        """Forme compacte de l'entrée : liste sans noms de clés, affixes au lieu de la réponse"""
+        if self.original is not None:
+            return dict(self.original)
+        return [self.timestamp, self.user, self.text, self.frame, self.intimacy_level]
+
+    @classmethod
+    def from_record(cls, record) -> "HistoryEntry":
+        if isinstance(record, dict):
+            return cls.from_dict(record)
+        timestamp, user, text, frame, intimacy_level = record
+        if isinstance(frame, list):
+            frame = _shared_frame(*frame)
+        elif frame is not None:
+            frame = _shared_text(frame)
+        return cls(timestamp, _shared_text(user, _SHARED_MESSAGE_MAX), _shared_text(text), frame,
+                   _shared_level(intimacy_level))
+
+
+class HistoryRing:
+    """Tampon circulaire des `capacity` derniers échanges.
+
+    Un ajout remplace l'entrée la plus ancienne en place, sans recopier la
+    liste ; l'entrée évincée est renvoyée.
+    """
+
+    __slots__ = ("capacity", "_items", "_start")
+
+    def __init__(self, capacity: int = HISTORY_LIMIT, entries=()):
+        self.capacity = capacity
+        self._items = list(entries)[-capacity:] if capacity else []
+        self._start = 0
+
+    def append(self, entry: HistoryEntry) -> Optional[HistoryEntry]:
+        if len(self._items) < self.capacity:
+            self._items.append(entry)
+            return None
+        if not self.capacity:
+            return entry
+        evicted = self._items[self._start]
+        self._items[self._start] = entry
+        self._start = (self._start + 1) % self.capacity
+        return evicted
+
+    def recent(self, count: int) -> list:
+        """Les `count` derniers échanges, du plus ancien au plus récent"""
+        size = len(self._items)
+        return [self._items[(self._start + index) % size] for index in range(max(0, size - count), size)]
+
+    def copy(self) -> "HistoryRing":
+        ring = HistoryRing.__new__(HistoryRing)
+        ring.capacity = self.capacity
+        ring._items = list(self._items)
+        ring._start = self._start
+        return ring
+
+    def clear(self):
+        self._items = []
+        self._start = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[HistoryEntry]:
+        size = len(self._items)
+        for index in range(size):
+            yield self._items[(self._start + index) % size]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        size = len(self._items)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("index d'historique hors limites")
+        return self._items[(self._start + index) % size]
+
+
+class UserMemory:
+    """Profil d'un utilisateur : intimité, compteur, infos personnelles, historique.
+
+    Remplace le dict de dicts du fichier JSON en mémoire : attributs fixes
+    (`__slots__`), historique en tampon circulaire, horodatages entiers et
+    réponse stylée recomposée à partir du texte brut. `from_dict` et
+    `to_dict` convertissent depuis et vers le format JSON sans perte ; les
+    clés inconnues du profil sont conservées dans `extra`.
+    """
+
+    __slots__ = ("intimacy_level", "interaction_count", "personal_info", "conversation_history",
+                 "emotional_state", "extra")
+
+    def __init__(self, intimacy_level: float = 1.0, interaction_count: int = 0,
+                 personal_info: Optional[dict] = None, conversation_history: Optional[HistoryRing] = None,
+                 emotional_state: str = "neutral", extra: Optional[dict] = None,
+                 history_limit: int = HISTORY_LIMIT):
+        self.intimacy_level = intimacy_level
+        self.interaction_count = interaction_count
+        self.personal_info = personal_info if personal_info is not None else {}
+        self.conversation_history = conversation_history if conversation_history is not None \
+            else HistoryRing(history_limit)
+        self.emotional_state = emotional_state
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data: dict, history_limit: int = HISTORY_LIMIT) -> "UserMemory":
+        history = data.get("conversation_history") or ()
+        # Un historique plus long que la limite (profil importé) est gardé entier
+        ring = HistoryRing(max(history_limit, len(history)), map(HistoryEntry.from_dict, history))
+        extra = None
+        if data.keys() - _PROFILE_KEYS:
+            extra = {key: value for key, value in data.items() if key not in _PROFILE_KEYS}
+        emotional_state = data.get("emotional_state", "neutral")
+        return cls(
+            data.get("intimacy_level", 1.0),
+            data.get("interaction_count", 0),
+            {sys.intern(key): value for key, value in (data.get("personal_info") or {}).items()},
+            ring,
+            sys.intern(emotional_state) if isinstance(emotional_state, str) else emotional_state,
+            extra
+        )
+
+    def to_dict(self) -> dict:
+        """Format JSON historique du profil"""
+        data = {
+            "intimacy_level": self.intimacy_level,
+            "interaction_count": self.interaction_count,
+            "personal_info": dict(self.personal_info),
+            "conversation_history": [entry.to_dict() for entry in self.conversation_history],
+            "emotional_state": self.emotional_state
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_record(cls, record: list, history_limit: int = HISTORY_LIMIT) -> "UserMemory":
+        intimacy_level, interaction_count, personal_info, emotional_state, history, extra = record
+        ring = HistoryRing(max(history_limit, len(history)), map(HistoryEntry.from_record, history))
+        return cls(
+            intimacy_level,
+            interaction_count,
+            {sys.intern(key): value for key, value in personal_info.items()},
+            ring,
+            sys.intern(emotional_state) if isinstance(emotional_state, str) else emotional_state,
+            extra
+        )
+
+    def to_record(self) -> list:
+        """Forme compacte du profil (fichier binaire de memory_segments.py), sans perte comme `to_dict`"""
+        return [self.intimacy_level, self.interaction_count, self.personal_info, self.emotional_state,
+                [entry.to_record() for entry in self.conversation_history], self.extra or None]
+
+    def add_exchange(self, user: str, assistant: str, ai_raw: Optional[str] = None,
+                     on_evict: Optional[Callable[[HistoryEntry], None]] = None) -> HistoryEntry:
+        """Ajoute l'échange du tour à l'historique (au niveau d'intimité courant) et le renvoie.
+
+        `on_evict` reçoit l'échange le plus ancien quand l'historique plein l'évince.
+        """
+        entry = HistoryEntry.create(user, assistant, self.intimacy_level, ai_raw)
+        evicted = self.conversation_history.append(entry)
+        if evicted is not None and on_evict is not None:
+            on_evict(evicted)
+        return entry
+
+    def copy(self) -> "UserMemory":
+        """Copie indépendante des mutations du tour suivant (les entrées, immuables, sont partagées)"""
+        return UserMemory(self.intimacy_level, self.interaction_count, dict(self.personal_info),
+                          self.conversation_history.copy(), self.emotional_state,
+                          dict(self.extra) if self.extra else None)